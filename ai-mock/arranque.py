@@ -0,0 +1,123 @@
+"""
+Arranque del servicio: tiempos de carga y disponibilidad (GET /ready)
+
+/health solo indica que el proceso responde (liveness). /ready indica
+además que ya está precalentado, es decir, que la primera petición no
+pagará la importación de las dependencias pesadas (readiness). El tiempo
+de cada etapa (carga de la aplicación, importación de cada módulo
+diferido, precalentamiento) se escribe en el log y se devuelve en /ready,
+para que una regresión en el arranque se vea.
+
+Dos modos (ARRANQUE_RAPIDO):
+    0  el proceso maestro de gunicorn precalienta antes de crear los
+       workers, y estos heredan todo ya cargado (copy-on-write)
+    1  el maestro carga solo lo imprescindible y crea los workers
+       enseguida. Cada worker importa los módulos diferidos y precalienta
+       en un hilo en segundo plano. /health responde desde el primer
+       momento y /ready devuelve 503 hasta que termina
+
+Los tiempos se escriben en stderr para no mezclarse con la salida de los
+comandos de la CLI.
+
+Este archivo es el mismo en ai-mock y en pdf-service (ver
+comprobar_compartidos.sh).
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+from flask import jsonify
+
+ARRANQUE_RAPIDO = os.environ.get('ARRANQUE_RAPIDO') == '1'
+
+
+class Arranque:
+    """Tiempos de arranque y estado del precalentamiento de un proceso"""
+
+    def __init__(self, servicio, inicio=None):
+        self.servicio = servicio
+        self.inicio = inicio if inicio is not None else time.perf_counter()
+        self.tiempos = {}
+        self.error = None
+        self._importados = {}
+        self._listo = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def listo(self):
+        return self._listo.is_set()
+
+    def anotar(self, etapa, segundos):
+        """Guarda la duración de una etapa y la escribe en el log"""
+        self.tiempos[etapa] = round(segundos * 1000, 1)
+        print(f"⏱️  [{self.servicio}] {etapa}: {segundos * 1000:.1f} ms (pid {os.getpid()})",
+              file=sys.stderr, flush=True)
+
+    def cargada(self):
+        """Marca el final de la carga del módulo de la aplicación"""
+        self.anotar('carga_app', time.perf_counter() - self.inicio)
+
+    def importar(self, nombre):
+        """Importa un módulo diferido; la primera vez anota cuánto tarda"""
+        modulo = self._importados.get(nombre)
+        if modulo is not None:
+            return modulo
+        with self._lock:
+            modulo = self._importados.get(nombre)
+            if modulo is None:
+                inicio = time.perf_counter()
+                modulo = importlib.import_module(nombre)
+                self.anotar(f'import_{nombre}', time.perf_counter() - inicio)
+                self._importados[nombre] = modulo
+        return modulo
+
+    def precalentar(self, funcion, en_segundo_plano=False):
+        """
+        Ejecuta funcion (la que importa y prepara lo pesado) y marca el
+        proceso como listo. En segundo plano, un error deja el proceso sin
+        marcar como listo; en primer plano, además se propaga
+        """
+        if en_segundo_plano:
+            threading.Thread(
+                target=self._precalentar, args=(funcion, False),
+                name='precalentar', daemon=True
+            ).start()
+        else:
+            self._precalentar(funcion, True)
+
+    def _precalentar(self, funcion, propagar):
+        inicio = time.perf_counter()
+        try:
+            funcion()
+        except Exception as e:
+            self.error = f'{type(e).__name__}: {e}'
+            print(f"❌ [{self.servicio}] Error al precalentar: {self.error}",
+                  file=sys.stderr, flush=True)
+            if propagar:
+                raise
+            return
+        self.anotar('precalentamiento', time.perf_counter() - inicio)
+        self._listo.set()
+
+    def registrar(self, app):
+        """Añade GET /ready a la app"""
+
+        @app.route('/ready', methods=['GET'])
+        def ready():
+            """Readiness: 200 si este proceso ya está precalentado, si no 503"""
+            if self.listo:
+                estado = 'ready'
+            elif self.error:
+                estado = 'error'
+            else:
+                estado = 'starting'
+            return jsonify({
+                'status': estado,
+                'service': self.servicio,
+                'arranque_rapido': ARRANQUE_RAPIDO,
+                'pid': os.getpid(),
+                'tiempos_ms': self.tiempos,
+                'error': self.error
+            }), 200 if self.listo else 503
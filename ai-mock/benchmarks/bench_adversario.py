@@ -0,0 +1,137 @@
+"""
+Benchmark de extracción con mensajes adversarios
+
+Mensajes pensados para disparar la vuelta atrás de las expresiones
+regulares anteriores: "factura" seguida de miles de espacios, "para "
+repetido, palabras en mayúscula sin fin, "ramo de " repetido, números
+muy largos y un reenvío de chat de ~100 KB. Para cada caso y tamaño se
+comparan las versiones anteriores (copiadas aquí) con las de mock_ia:
+el coste por carácter de las nuevas no crece con el tamaño.
+
+Las versiones anteriores dejan de medirse en un caso cuando superan
+--presupuesto segundos (el siguiente tamaño tardaría mucho más).
+
+Uso (desde ai-mock/):
+    python benchmarks/bench_adversario.py
+    python benchmarks/bench_adversario.py --tamanos 1000 10000 100000 --presupuesto 5
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_ia  # noqa: E402
+from bench_extraccion import extraer_productos_anterior, generar_corpus  # noqa: E402
+
+
+def extraer_numero_factura_anterior(texto):
+    """Versión con tres expresiones regulares (solo para comparar)"""
+    patrones = [
+        r'factura\s*[:#]?\s*(\d{4}-\d{3})',
+        r'n[uúº]mero\s+(\d{4}-\d{3})',
+        r'factura\s+n[uúº]\s*(\d+)',
+    ]
+    for patron in patrones:
+        match = re.search(patron, texto, re.IGNORECASE)
+        if match:
+            return match.group(1)
+    return None
+
+
+def extraer_cliente_anterior(texto):
+    """Versión con cuatro expresiones regulares (solo para comparar)"""
+    patrones = [
+        r'para\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
+        r'cliente:?\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
+        r'a nombre de\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
+        r'destinatario:?\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
+    ]
+    for patron in patrones:
+        match = re.search(patron, texto)
+        if match:
+            return match.group(1).strip()
+    return "Cliente"
+
+
+def _repetir(trozo, tamano, prefijo='', sufijo=''):
+    relleno = tamano - len(prefijo) - len(sufijo)
+    return prefijo + (trozo * (relleno // len(trozo) + 1))[:relleno] + sufijo
+
+
+def _reenvio_chat(tamano):
+    lineas = []
+    total = 0
+    for i, mensaje in enumerate(generar_corpus(tamano // 40 + 1, semilla=7)):
+        linea = f'[12/03/25, 10:{i % 60:02d}] Tienda: {mensaje}'
+        lineas.append(linea)
+        total += len(linea) + 1
+        if total >= tamano:
+            break
+    return '\n'.join(lineas)[:tamano]
+
+
+# nombre -> (función que genera el texto de un tamaño, extracción que lo sufre)
+CASOS = {
+    'factura + espacios': (lambda n: _repetir(' ', n, 'factura', 'x'), 'numero'),
+    'número + espacios': (lambda n: _repetir(' ', n, 'número'), 'numero'),
+    '"para " repetido': (lambda n: _repetir('para ', n), 'cliente'),
+    'Palabras Mayúscula': (lambda n: _repetir('Ramo ', n, 'para ', '1'), 'cliente'),
+    '"ramo de " repetido': (lambda n: _repetir('ramo de ', n, '2 '), 'productos'),
+    'dígitos seguidos': (lambda n: _repetir('7', n), 'productos'),
+    'reenvío de chat': (_reenvio_chat, 'productos'),
+}
+
+EXTRACCIONES = {
+    'numero': (extraer_numero_factura_anterior, mock_ia.extraer_numero_factura),
+    'cliente': (extraer_cliente_anterior, mock_ia.extraer_cliente),
+    'productos': (extraer_productos_anterior, mock_ia.extraer_productos),
+}
+
+
+def medir(funcion, texto, repeticiones):
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(texto)
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--presupuesto', type=float, default=2.0,
+                        help='segundos a partir de los que se deja de medir la versión anterior')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'caso':<22} {'tamaño':>8} {'anterior ms':>12} {'nueva ms':>10} "
+          f"{'ns/carácter':>12} {'aceleración':>12}")
+
+    for nombre, (generar, extraccion) in CASOS.items():
+        anterior, nueva = EXTRACCIONES[extraccion]
+        anterior_agotada = False
+        for tamano in args.tamanos:
+            texto = generar(tamano)
+            t_nueva = medir(nueva, texto, args.repeticiones)
+
+            if anterior_agotada:
+                t_anterior = None
+            else:
+                t_anterior = medir(anterior, texto, 1)
+                anterior_agotada = t_anterior > args.presupuesto
+
+            columna_anterior = f'{t_anterior * 1000:>12.2f}' if t_anterior is not None else f"{'(omitida)':>12}"
+            aceleracion = f'x{t_anterior / t_nueva:.0f}' if t_anterior is not None else '-'
+            print(f"{nombre:<22} {len(texto):>8} {columna_anterior} {t_nueva * 1000:>10.2f} "
+                  f"{t_nueva / len(texto) * 1e9:>12.0f} {aceleracion:>12}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
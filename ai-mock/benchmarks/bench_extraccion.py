@@ -0,0 +1,211 @@
+"""
+Benchmark de extraer_productos sobre un corpus de pedidos realistas
+
+Compara el analizador de una sola pasada de mock_ia con la versión
+anterior de cuatro expresiones regulares (copiada aquí): mensajes por
+segundo, µs por mensaje y productos extraídos, incluidos los duplicados
+que generaba la versión anterior.
+
+Uso (desde ai-mock/):
+    python benchmarks/bench_extraccion.py
+    python benchmarks/bench_extraccion.py --mensajes 20000 --repeticiones 5
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_ia  # noqa: E402
+
+CLIENTES = [
+    'María García', 'Juan Pérez', 'Ana López', 'Hotel Plaza', 'Familia Rodríguez',
+    'Carmen Ruiz', 'Restaurante El Patio', 'José Martínez', 'Lucía Fernández',
+]
+PRODUCTOS = [
+    'ramo de rosas', 'ramos de rosas rojas', 'centro de mesa', 'plantas de interior',
+    'arreglo floral para evento', 'corona de flores', 'bouquet de novia',
+    'tulipanes', 'orquídea blanca', 'ramo de girasoles', 'centros de lirios',
+]
+PLANTILLAS_LINEA = [
+    '{cantidad} {producto} a {precio} euros',
+    '{cantidad} {producto} a {precio}€',
+    '{cantidad}x {producto} - {precio}€',
+    '{producto} {precio} eur',
+    '{cantidad} {producto} {precio} euros',
+]
+PLANTILLAS_MENSAJE = [
+    'Para {cliente}: {lineas}',
+    'Hola! Soy {cliente}, quería {lineas}. Gracias',
+    'Cliente {cliente}: {lineas}',
+    '{lineas}, cliente: {cliente}',
+    'Buenas tardes\nPedido a nombre de {cliente}\n{lineas_separadas}\nFactura {numero}',
+]
+
+
+def generar_corpus(n, semilla=2025):
+    """n mensajes de WhatsApp sintéticos con 1 a 5 productos cada uno"""
+    azar = random.Random(semilla)
+    corpus = []
+    for i in range(n):
+        lineas = []
+        for _ in range(azar.randint(1, 5)):
+            precio = azar.choice([12, 15, 25, 30, 35, 45, 80, 120])
+            if azar.random() < 0.3:
+                precio = f"{precio},{azar.choice(['50', '90', '95'])}"
+            lineas.append(azar.choice(PLANTILLAS_LINEA).format(
+                cantidad=azar.randint(1, 6),
+                producto=azar.choice(PRODUCTOS),
+                precio=precio
+            ))
+        corpus.append(azar.choice(PLANTILLAS_MENSAJE).format(
+            cliente=azar.choice(CLIENTES),
+            lineas=' y '.join(lineas),
+            lineas_separadas='\n'.join(lineas),
+            numero=f'2025-{i % 1000:03d}'
+        ))
+    return corpus
+
+
+def extraer_productos_anterior(texto):
+    """Versión con cuatro expresiones regulares (solo para comparar)"""
+    productos = []
+    
+    # Patrones mejorados para detectar productos de floristería
+    patrones = [
+        # "2 ramos de rosas a 30 euros"
+        r'(\d+)\s+(ramos?|centros?|plantas?|arreglos?|bouquets?|coronas?)[^0-9]*?([a-záéíóúñ\s]+?)\s+a\s+(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
+        # "ramo de rosas 30€"
+        r'(ramos?|centros?|plantas?|arreglos?|bouquets?|coronas?)\s+(?:de\s+)?([a-záéíóúñ\s]+?)\s+(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
+        # "2x ramo de rosas - 30€"
+        r'(\d+)\s*x?\s+(ramos?|centros?|plantas?|arreglos?)[^0-9]*?([a-záéíóúñ\s]+?)\s*[-–]\s*(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
+        # Patrón genérico: "cantidad producto precio"
+        r'(\d+)\s+([a-záéíóúñ\s]{3,30}?)\s+(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
+    ]
+    
+    texto_lower = texto.lower()
+    
+    for patron in patrones:
+        matches = re.finditer(patron, texto_lower, re.IGNORECASE)
+        for match in matches:
+            grupos = match.groups()
+            
+            # Determinar cantidad, tipo y precio según el patrón
+            if len(grupos) == 4:
+                # Patrón con tipo de producto explícito
+                cantidad_str = grupos[0]
+                tipo = grupos[1]
+                nombre = grupos[2]
+                precio_str = grupos[3]
+                
+                try:
+                    cantidad = int(cantidad_str) if cantidad_str.isdigit() else 1
+                except:
+                    cantidad = 1
+                    
+                producto = f"{tipo.title()} {nombre.strip().title()}"
+            elif len(grupos) == 3:
+                # Patrón simple
+                if grupos[0].isdigit():
+                    # "2 rosas 30€"
+                    cantidad = int(grupos[0])
+                    producto = grupos[1].strip().title()
+                    precio_str = grupos[2]
+                else:
+                    # "ramo de rosas 30€"
+                    cantidad = 1
+                    producto = f"{grupos[0].title()} {grupos[1].strip().title()}"
+                    precio_str = grupos[2]
+            else:
+                continue
+            
+            # Limpiar y convertir precio
+            precio_str = precio_str.replace(',', '.')
+            try:
+                precio_unitario = float(precio_str)
+            except:
+                continue
+            
+            # Calcular valores (precio base sin mock_ia.IVA)
+            base_unitaria = precio_unitario
+            base_total = base_unitaria * cantidad
+            iva_total = base_total * mock_ia.IVA
+            total = base_total + iva_total
+            
+            productos.append({
+                'producto': producto.strip(),
+                'cantidad': cantidad,
+                'base': round(base_total, 2),
+                'iva': round(iva_total, 2),
+                'total': round(total, 2)
+            })
+    
+    # Si no se encontraron productos, intentar detectar solo precios y asumir cantidad 1
+    if not productos:
+        precios = re.findall(r'(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)', texto_lower)
+        if precios:
+            precio = float(precios[0].replace(',', '.'))
+            base = precio
+            iva = base * mock_ia.IVA
+            total = base + iva
+            
+            productos.append({
+                'producto': 'Producto Genérico',
+                'cantidad': 1,
+                'base': round(base, 2),
+                'iva': round(iva, 2),
+                'total': round(total, 2)
+            })
+    
+    return productos
+
+
+def medir(funcion, corpus, repeticiones):
+    """Mejor tiempo (segundos) de pasar el corpus completo y productos extraídos"""
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        productos = [funcion(texto) for texto in corpus]
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor, productos
+
+
+def duplicados(productos):
+    """Productos repetidos dentro de un mismo mensaje"""
+    total = 0
+    for items in productos:
+        vistos = set()
+        for item in items:
+            clave = (item['producto'].lower(), item['cantidad'], item['base'])
+            total += clave in vistos
+            vistos.add(clave)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--mensajes', type=int, default=5000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = generar_corpus(args.mensajes)
+    print(f"Corpus: {len(corpus)} mensajes, {sum(len(t) for t in corpus) / 1024:.0f} KB\n")
+    print(f"{'versión':<14} {'mensajes/s':>11} {'µs/mensaje':>11} {'productos':>10} {'duplicados':>11}")
+
+    resultados = {}
+    for nombre, funcion in (('anterior', extraer_productos_anterior),
+                            ('una pasada', mock_ia.extraer_productos)):
+        duracion, productos = medir(funcion, corpus, args.repeticiones)
+        resultados[nombre] = duracion
+        print(f"{nombre:<14} {len(corpus) / duracion:>11.0f} {duracion / len(corpus) * 1e6:>11.1f} "
+              f"{sum(len(p) for p in productos):>10} {duplicados(productos):>11}")
+
+    print(f"\nAceleración: x{resultados['anterior'] / resultados['una pasada']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
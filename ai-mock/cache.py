@@ -0,0 +1,74 @@
+"""
+Caché LRU en memoria con caducidad opcional
+
+La usa mock_ia para no volver a analizar un mensaje idéntico (reenvíos
+de WhatsApp, reintentos de n8n). Es por proceso: cada worker de gunicorn
+y cada proceso del pool tienen la suya.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class CacheLRU:
+    """
+    Guarda como mucho max_entradas valores; al llenarse se descarta el
+    menos usado. Con ttl (segundos) las entradas caducan aunque se usen
+    """
+
+    def __init__(self, max_entradas=1024, ttl=None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl or None
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.descartes = 0
+        self.caducadas = 0
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado o None (y lo marca como recién usado)"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            valor, caduca = entrada
+            if caduca is not None and caduca <= time.monotonic():
+                del self._datos[clave]
+                self.caducadas += 1
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor):
+        if self.max_entradas <= 0:
+            return
+        caduca = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._datos[clave] = (valor, caduca)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.descartes += 1
+
+    def vaciar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        """Aciertos, fallos, descartes y tamaño actual"""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else None,
+                'descartes': self.descartes,
+                'caducadas': self.caducadas,
+                'entradas': len(self._datos),
+                'max_entradas': self.max_entradas,
+                'ttl_segundos': self.ttl,
+            }
@@ -0,0 +1,110 @@
+"""
+Escáner de pedidos en tiempo lineal
+
+Todo el análisis de un mensaje parte de una única lista de tokens:
+
+    precio    "30 euros", "30,50€", "12 eur"
+    cantidad  "2", "2x", "2 x"
+    palabra   cualquier palabra, con sus mayúsculas originales
+    corte     signos que separan frases (. , ; : ! ? paréntesis, salto de línea)
+
+El patrón de tokens solo usa cuantificadores posesivos: nunca vuelve
+atrás, así que cada carácter se mira un número acotado de veces. Sobre
+los tokens, las frases clave ("para", "a nombre de", "factura"...) y los
+tipos de producto se reconocen con un trie de palabras (Vocabulario), y
+los números de factura con un lector que mira como mucho unos pocos
+caracteres tras la palabra clave. El coste total crece de forma lineal
+con la longitud del mensaje, sea cual sea su contenido.
+"""
+import re
+
+_LETRAS = 'a-záéíóúñü'
+
+_RE_TOKEN = re.compile(
+    rf'(?P<precio>\d++(?:[.,]\d{{1,2}}+)?+)\s*+(?:euros?+|eur|€)(?![{_LETRAS}])'
+    rf'|(?P<cantidad>\d++)(?:\s?x\b)?+'
+    rf'|(?P<palabra>[{_LETRAS}]++)'
+    r'|(?P<corte>[.,;:!?¡¿()\n])',
+    re.IGNORECASE
+)
+
+PRECIO = 'precio'
+CANTIDAD = 'cantidad'
+PALABRA = 'palabra'
+CORTE = 'corte'
+
+
+def tokenizar(texto):
+    """
+    Lista de tokens del texto, en una sola pasada
+    Cada token es el re.Match del patrón: lastgroup es su tipo, t[tipo]
+    su texto (en precio y cantidad, solo el número) y start()/end() su
+    posición en el texto
+    """
+    return list(_RE_TOKEN.finditer(texto))
+
+
+class Vocabulario:
+    """
+    Trie de frases (secuencias de palabras en minúsculas) con su valor
+    Buscar en n tokens cuesta como mucho n × la frase más larga
+    """
+
+    def __init__(self, frases=None):
+        self._raiz = {}
+        self.longitud_maxima = 0
+        for frase, valor in (frases or {}).items():
+            self.agregar(frase, valor)
+
+    def agregar(self, frase, valor):
+        palabras = frase.lower().split()
+        nodo = self._raiz
+        for palabra in palabras:
+            nodo = nodo.setdefault(palabra, {})
+        nodo[None] = valor
+        self.longitud_maxima = max(self.longitud_maxima, len(palabras))
+
+    def __contains__(self, palabra):
+        nodo = self._raiz.get(palabra.lower())
+        return nodo is not None and None in nodo
+
+    def coincidencias(self, tokens):
+        """
+        Genera (valor, índice del primer token, índice tras el último) de
+        cada frase encontrada; en cada posición, la frase más larga
+        """
+        for i, token in enumerate(tokens):
+            if token.lastgroup != PALABRA:
+                continue
+            nodo = self._raiz.get(token[PALABRA].lower())
+            j = i + 1
+            encontrada = None
+            while nodo is not None:
+                if None in nodo:
+                    encontrada = (nodo[None], i, j)
+                if j == len(tokens) or tokens[j].lastgroup != PALABRA:
+                    break
+                nodo = nodo.get(tokens[j][PALABRA].lower())
+                j += 1
+            if encontrada:
+                yield encontrada
+
+
+def leer_digitos(texto, posicion, maximo):
+    """
+    Lee hasta maximo dígitos seguidos desde posicion
+    Devuelve (dígitos, posición siguiente)
+    """
+    fin = posicion
+    limite = min(len(texto), posicion + maximo)
+    while fin < limite and texto[fin].isdigit():
+        fin += 1
+    return texto[posicion:fin], fin
+
+
+def saltar_espacios(texto, posicion, maximo):
+    """Avanza como mucho maximo espacios desde posicion"""
+    limite = min(len(texto), posicion + maximo)
+    while posicion < limite and texto[posicion].isspace():
+        posicion += 1
+    return posicion
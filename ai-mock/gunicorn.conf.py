@@ -0,0 +1,80 @@
+"""
+Configuración de gunicorn para el Mock IA en producción
+
+Variables de entorno (ver docker-compose.yml):
+    PORT                        puerto de escucha (5001)
+    GUNICORN_WORKERS            procesos worker (uno por núcleo)
+    GUNICORN_THREADS            hilos por worker (4)
+    GUNICORN_MAX_REQUESTS       peticiones antes de reciclar un worker (5000, 0 = nunca)
+    GUNICORN_MAX_REQUESTS_JITTER  aleatoriedad para no reciclar todos a la vez (500)
+    GUNICORN_TIMEOUT            segundos antes de matar un worker bloqueado (30)
+    GUNICORN_GRACEFUL_TIMEOUT   segundos para terminar peticiones al reiniciar (30)
+    GUNICORN_KEEPALIVE          segundos que se mantiene abierta una conexión sin uso (5);
+                                pdf-service reutiliza la suya en /factura-desde-texto
+    PROMETHEUS_MULTIPROC_DIR    directorio para agregar las métricas de todos los workers
+    ARRANQUE_RAPIDO             1 = precalentar en cada worker en segundo plano (0)
+
+mock_ia se importa en el maestro (preload_app) y las expresiones regulares
+quedan compiladas antes del fork. `docker compose kill -s HUP ai-mock`
+reinicia los workers de forma ordenada.
+"""
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = int(os.environ.get('GUNICORN_WORKERS', os.cpu_count() or 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+
+def _preparar_metricas():
+    """
+    Vacía las métricas que hayan quedado de una ejecución anterior y crea
+    el directorio. Tiene que ser aquí y no en un hook: con preload_app la
+    app se importa en el maestro antes de on_starting y ya escribe sus
+    archivos. Al recargar con HUP este archivo se vuelve a leer, pero los
+    archivos del maestro y de los workers siguen en uso: solo se vacía
+    la primera vez
+    """
+    directorio = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not directorio or os.environ.get('_METRICAS_PREPARADAS'):
+        return
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.makedirs(directorio, exist_ok=True)
+    os.environ['_METRICAS_PREPARADAS'] = '1'
+
+
+_preparar_metricas()
+
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """En el maestro, antes de crear los workers"""
+    import mock_ia
+    if mock_ia.ARRANQUE_RAPIDO:
+        server.log.info("Arranque rápido: cada worker precalentará en segundo plano")
+        return
+    mock_ia.arranque.precalentar(mock_ia.precalentar)
+    server.log.info("Patrones de extracción precompilados")
+
+
+def post_fork(server, worker):
+    """En cada worker, con arranque rápido: precalentar en segundo plano"""
+    import mock_ia
+    if mock_ia.ARRANQUE_RAPIDO:
+        mock_ia.arranque.precalentar(mock_ia.precalentar, en_segundo_plano=True)
+
+
+def child_exit(server, worker):
+    """Las métricas de un worker que ha terminado dejan de contar como vivas"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,136 @@
+"""
+Métricas Prometheus comunes a los servicios (GET /metrics)
+
+Por ruta: peticiones, errores, latencia y peticiones en curso.
+Del servicio: CPU y memoria residente, sumadas entre los procesos vivos.
+Los nombres llevan el prefijo del servicio (pdf_service_..., ai_mock_...).
+Las métricas propias de cada servicio (etapas del render, de la
+extracción...) se definen en el módulo que las mide.
+
+Con varios procesos (workers de gunicorn, pools) hay que definir
+PROMETHEUS_MULTIPROC_DIR: cada proceso escribe sus valores en ese
+directorio y /metrics los agrega.
+
+Este archivo es el mismo en ai-mock y en pdf-service (ver
+comprobar_compartidos.sh).
+"""
+import os
+import resource
+import time
+
+from flask import Response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+    Histogram, generate_latest, multiprocess
+)
+
+# Cada proceso actualiza su CPU y memoria como mucho una vez por intervalo
+INTERVALO_PROCESO = 1.0
+
+# Métricas de cada prefijo: se registran una sola vez por proceso
+_servicios = {}
+
+
+def _memoria_residente():
+    """Bytes de memoria residente (de /proc en Linux; si no, el pico)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricasServicio:
+    """Métricas HTTP y de proceso de un servicio"""
+
+    def __init__(self, prefijo):
+        self.prefijo = prefijo
+        self.peticiones = Counter(
+            f'{prefijo}_http_requests_total', 'Peticiones HTTP atendidas',
+            ['metodo', 'ruta', 'estado']
+        )
+        self.errores = Counter(
+            f'{prefijo}_http_errors_total', 'Respuestas HTTP con estado >= 400',
+            ['ruta', 'estado']
+        )
+        self.latencia = Histogram(
+            f'{prefijo}_http_request_duration_seconds', 'Latencia de las peticiones HTTP',
+            ['ruta']
+        )
+        self.en_curso = Gauge(
+            f'{prefijo}_http_requests_in_flight', 'Peticiones HTTP en curso',
+            ['ruta'], multiprocess_mode='livesum'
+        )
+        self.cpu_procesos = Gauge(
+            f'{prefijo}_process_cpu_seconds', 'Segundos de CPU de los procesos vivos',
+            multiprocess_mode='livesum'
+        )
+        self.rss_procesos = Gauge(
+            f'{prefijo}_process_resident_memory_bytes', 'Memoria residente de los procesos vivos',
+            multiprocess_mode='livesum'
+        )
+        self._ultima_medicion = {'pid': None, 'instante': 0.0}
+
+    def medir_proceso(self, forzar=False):
+        """Actualiza cpu_procesos y rss_procesos con los valores de este proceso"""
+        ahora = time.monotonic()
+        if (not forzar and self._ultima_medicion['pid'] == os.getpid()
+                and ahora - self._ultima_medicion['instante'] < INTERVALO_PROCESO):
+            return
+        self._ultima_medicion.update(pid=os.getpid(), instante=ahora)
+        uso = resource.getrusage(resource.RUSAGE_SELF)
+        self.cpu_procesos.set(uso.ru_utime + uso.ru_stime)
+        self.rss_procesos.set(_memoria_residente())
+
+
+def metricas_servicio(prefijo):
+    """Devuelve las métricas del prefijo, creándolas si hace falta"""
+    if prefijo not in _servicios:
+        _servicios[prefijo] = MetricasServicio(prefijo)
+    return _servicios[prefijo]
+
+
+def _ruta():
+    regla = request.url_rule
+    return regla.rule if regla is not None else 'desconocida'
+
+
+def instrumentar(app, prefijo):
+    """Registra los hooks de medición y el endpoint /metrics en la app"""
+    metricas = metricas_servicio(prefijo)
+
+    @app.before_request
+    def _inicio_peticion():
+        request.environ['metricas.inicio'] = time.perf_counter()
+        metricas.en_curso.labels(_ruta()).inc()
+        metricas.medir_proceso()
+
+    @app.teardown_request
+    def _fin_peticion(exc):
+        inicio = request.environ.pop('metricas.inicio', None)
+        if inicio is not None:
+            metricas.en_curso.labels(_ruta()).dec()
+
+    @app.after_request
+    def _registrar_peticion(respuesta):
+        inicio = request.environ.get('metricas.inicio')
+        if inicio is None:
+            return respuesta
+        ruta = _ruta()
+        estado = str(respuesta.status_code)
+        metricas.latencia.labels(ruta).observe(time.perf_counter() - inicio)
+        metricas.peticiones.labels(request.method, ruta, estado).inc()
+        if respuesta.status_code >= 400:
+            metricas.errores.labels(ruta, estado).inc()
+        return respuesta
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Endpoint de métricas en formato de texto de Prometheus"""
+        metricas.medir_proceso(forzar=True)
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registro = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registro)
+        else:
+            registro = REGISTRY
+        return Response(generate_latest(registro), mimetype=CONTENT_TYPE_LATEST)
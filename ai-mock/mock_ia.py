@@ -1,155 +1,553 @@
-from flask import Flask, request, jsonify
+import time
+
+# Desde aquí se mide la carga de la aplicación (ver arranque)
+_inicio_carga = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, stream_with_context
+import click
+from prometheus_client import Histogram
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import json
+import os
 import re
+import sys
+
+from arranque import ARRANQUE_RAPIDO, Arranque
+from cache import CacheLRU
+from escaner import (
+    CANTIDAD, CORTE, PALABRA, PRECIO, Vocabulario, leer_digitos, saltar_espacios,
+    tokenizar
+)
+from metricas import instrumentar
+from perfilado import activar_perfilado
+from whatsapp import leer_mensajes
 
 app = Flask(__name__)
 
+# Métricas Prometheus por ruta y GET /metrics
+instrumentar(app, 'ai_mock')
+
+# Dentro de /procesar-pedido: tiempo de cada extracción (cliente,
+# productos, numero)
+ETAPA = Histogram(
+    'ai_mock_extraction_stage_duration_seconds',
+    'Tiempo de cada extracción de /procesar-pedido',
+    ['etapa'],
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+)
+
+# Tiempos de arranque y GET /ready
+arranque = Arranque('ai-mock', _inicio_carga)
+arranque.registrar(app)
+
+# Perfilado bajo demanda (ver perfilado): con PERFILADO_TOKEN, la cabecera
+# X-Perfilar perfila una petición; con PERFILADO_MUESTREO=N, una de cada N
+activar_perfilado(
+    app, 'ai-mock', os.environ.get('PERFILADO_DIR', 'perfiles'),
+    token=os.environ.get('PERFILADO_TOKEN'),
+    muestreo=int(os.environ.get('PERFILADO_MUESTREO', 0)),
+    maximo=int(os.environ.get('PERFILADO_MAX', 200))
+)
+
 # IVA fijo al 10% (como en tu aplicación)
 IVA = 0.10
 
+ERROR_SIN_PRODUCTOS = 'No se pudieron extraer productos del texto'
+ERROR_TEXTO_LARGO = 'Texto demasiado largo'
+SUGERENCIA_FORMATO = 'Formato esperado: "2 ramos de rosas a 30 euros"'
+
+# Límites de entrada: caracteres por mensaje y palabras que se guardan
+# como nombre de un producto (las más cercanas al precio)
+MAX_LONGITUD_TEXTO = int(os.environ.get('MAX_LONGITUD_TEXTO', 20000))
+MAX_PALABRAS_PRODUCTO = int(os.environ.get('MAX_PALABRAS_PRODUCTO', 12))
+# Un número más largo no es una cantidad (teléfonos, referencias...)
+MAX_DIGITOS_CANTIDAD = 6
+
+# Lotes de /procesar-pedidos: a partir de LOTE_MINIMO_POOL mensajes se
+# reparten entre PEDIDOS_WORKERS procesos, de TROZO_POOL en TROZO_POOL
+MAX_PEDIDOS_LOTE = int(os.environ.get('MAX_PEDIDOS_LOTE', 10000))
+PEDIDOS_WORKERS = int(os.environ.get('PEDIDOS_WORKERS', os.cpu_count() or 1))
+LOTE_MINIMO_POOL = 64
+TROZO_POOL = 32
+
+# El pool se crea en la primera petición por lotes (después del fork de
+# gunicorn)
+_pool_pedidos = None
+
+# Cliente y productos ya extraídos, por texto normalizado (0 entradas la
+# desactiva; TTL en segundos, 0 = sin caducidad)
+cache_extraccion = CacheLRU(
+    max_entradas=int(os.environ.get('CACHE_PEDIDOS_MAX', 2048)),
+    ttl=float(os.environ.get('CACHE_PEDIDOS_TTL', 0))
+)
+
+# Chats exportados (/procesar-chat): los mensajes que parecen pedidos se
+# interpretan en lotes de LOTE_CHAT
+LOTE_CHAT = int(os.environ.get('LOTE_CHAT', 256))
+
+_RE_ESPACIOS = re.compile(r'[^\S\n]+')
+
+# Un número seguido de euros: sin él no hay producto que extraer
+_RE_HAY_PRECIO = re.compile(r'\d\s*+(?:eur|€)', re.IGNORECASE)
+
+
+# Tipos de producto de la floristería: sin cantidad, el nombre empieza aquí
+TIPOS_PRODUCTO = Vocabulario({
+    tipo: tipo for tipo in (
+        'ramo', 'ramos', 'centro', 'centros', 'planta', 'plantas',
+        'arreglo', 'arreglos', 'bouquet', 'bouquets', 'corona', 'coronas',
+    )
+})
+
+# Frases tras las que viene el nombre del cliente, por prioridad
+# (con los dos puntos opcionales de "cliente:" y "destinatario:")
+FRASES_CLIENTE = Vocabulario({
+    'para': (0, False),
+    'cliente': (1, True),
+    'a nombre de': (2, False),
+    'destinatario': (3, True),
+})
+MAX_PALABRAS_CLIENTE = 4
+
+# Palabras tras las que puede venir el número de factura
+FRASES_NUMERO = Vocabulario({
+    'factura': 'factura',
+    'numero': 'numero',
+    'número': 'numero',
+    'n mero': 'numero',
+})
+# Espacios que se miran entre la palabra clave y el número
+MAX_ESPACIOS_NUMERO = 16
+
+# Palabras que unen el producto con el precio o con el producto anterior
+# y que no forman parte del nombre
+_CONECTORES_FINAL = {'a', 'al', 'por', 'de', 'x', 'son', 'cuesta', 'cuestan', 'vale', 'valen'}
+_RELLENO_INICIO = {'y', 'e', 'cada', 'uno', 'una', 'con', 'más', 'mas', 'también', 'tambien', 'además', 'ademas'}
+
+
+def _linea_producto(producto, cantidad, precio_unitario):
+    """Construye un item con los importes calculados (precio base sin IVA)"""
+    base_total = precio_unitario * cantidad
+    iva_total = base_total * IVA
+    total = base_total + iva_total
+    return {
+        'producto': producto,
+        'cantidad': cantidad,
+        'base': round(base_total, 2),
+        'iva': round(iva_total, 2),
+        'total': round(total, 2)
+    }
+
+
+def _nombre_producto(palabras, con_cantidad):
+    """
+    Nombre del producto a partir de las palabras previas al precio, o
+    None si no hay producto reconocible
+    """
+    if not con_cantidad:
+        # "quiero un ramo de rosas 30€": se empieza en el tipo de producto
+        for i, palabra in enumerate(palabras):
+            if palabra in TIPOS_PRODUCTO:
+                palabras = palabras[i:]
+                break
+        else:
+            return None
+    
+    inicio, fin = 0, len(palabras)
+    while inicio < fin and palabras[inicio].lower() in _RELLENO_INICIO:
+        inicio += 1
+    while fin > inicio and palabras[fin - 1].lower() in _CONECTORES_FINAL:
+        fin -= 1
+    if inicio == fin:
+        return None
+    return ' '.join(palabras[inicio:fin]).title()
+
 
 def extraer_productos(texto):
     """
     Extrae productos, cantidades y precios del texto
-    Detecta patrones comunes en mensajes de WhatsApp
+    Detecta patrones comunes en mensajes de WhatsApp:
+    "2 ramos de rosas a 30 euros", "ramo de rosas 30€",
+    "2x ramo de rosas - 30€", "3 tulipanes 12 euros"
+    
+    Recorre los tokens una sola vez (ver escaner): cada precio cierra
+    como mucho un producto (la cantidad y las palabras que lo preceden),
+    así que un mismo pedido no puede salir repetido
     """
     productos = []
+    primer_precio = None
+    cantidad = None
+    palabras = deque(maxlen=MAX_PALABRAS_PRODUCTO)
     
-    # Patrones mejorados para detectar productos de floristería
-    patrones = [
-        # "2 ramos de rosas a 30 euros"
-        r'(\d+)\s+(ramos?|centros?|plantas?|arreglos?|bouquets?|coronas?)[^0-9]*?([a-záéíóúñ\s]+?)\s+a\s+(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
-        # "ramo de rosas 30€"
-        r'(ramos?|centros?|plantas?|arreglos?|bouquets?|coronas?)\s+(?:de\s+)?([a-záéíóúñ\s]+?)\s+(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
-        # "2x ramo de rosas - 30€"
-        r'(\d+)\s*x?\s+(ramos?|centros?|plantas?|arreglos?)[^0-9]*?([a-záéíóúñ\s]+?)\s*[-–]\s*(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
-        # Patrón genérico: "cantidad producto precio"
-        r'(\d+)\s+([a-záéíóúñ\s]{3,30}?)\s+(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)',
-    ]
-    
-    texto_lower = texto.lower()
-    
-    for patron in patrones:
-        matches = re.finditer(patron, texto_lower, re.IGNORECASE)
-        for match in matches:
-            grupos = match.groups()
-            
-            # Determinar cantidad, tipo y precio según el patrón
-            if len(grupos) == 4:
-                # Patrón con tipo de producto explícito
-                cantidad_str = grupos[0]
-                tipo = grupos[1]
-                nombre = grupos[2]
-                precio_str = grupos[3]
-                
-                try:
-                    cantidad = int(cantidad_str) if cantidad_str.isdigit() else 1
-                except:
-                    cantidad = 1
-                    
-                producto = f"{tipo.title()} {nombre.strip().title()}"
-            elif len(grupos) == 3:
-                # Patrón simple
-                if grupos[0].isdigit():
-                    # "2 rosas 30€"
-                    cantidad = int(grupos[0])
-                    producto = grupos[1].strip().title()
-                    precio_str = grupos[2]
-                else:
-                    # "ramo de rosas 30€"
-                    cantidad = 1
-                    producto = f"{grupos[0].title()} {grupos[1].strip().title()}"
-                    precio_str = grupos[2]
-            else:
-                continue
-            
-            # Limpiar y convertir precio
-            precio_str = precio_str.replace(',', '.')
-            try:
-                precio_unitario = float(precio_str)
-            except:
-                continue
-            
-            # Calcular valores (precio base sin IVA)
-            base_unitaria = precio_unitario
-            base_total = base_unitaria * cantidad
-            iva_total = base_total * IVA
-            total = base_total + iva_total
-            
-            productos.append({
-                'producto': producto.strip(),
-                'cantidad': cantidad,
-                'base': round(base_total, 2),
-                'iva': round(iva_total, 2),
-                'total': round(total, 2)
-            })
-    
-    # Si no se encontraron productos, intentar detectar solo precios y asumir cantidad 1
-    if not productos:
-        precios = re.findall(r'(\d+(?:[.,]\d{1,2})?)\s*(?:euros?|€|eur)', texto_lower)
-        if precios:
-            precio = float(precios[0].replace(',', '.'))
-            base = precio
-            iva = base * IVA
-            total = base + iva
-            
-            productos.append({
-                'producto': 'Producto Genérico',
-                'cantidad': 1,
-                'base': round(base, 2),
-                'iva': round(iva, 2),
-                'total': round(total, 2)
-            })
+    for token in tokenizar(texto):
+        tipo = token.lastgroup
+        if tipo == PALABRA:
+            palabras.append(token[PALABRA])
+        elif tipo == CANTIDAD and len(token[CANTIDAD]) <= MAX_DIGITOS_CANTIDAD:
+            cantidad = int(token[CANTIDAD])
+            palabras.clear()
+        elif tipo != PRECIO:
+            # Corte, o un número demasiado largo para ser una cantidad
+            cantidad = None
+            palabras.clear()
+        else:
+            precio = float(token[PRECIO].replace(',', '.'))
+            if primer_precio is None:
+                primer_precio = precio
+            producto = _nombre_producto(list(palabras), cantidad is not None)
+            if producto:
+                productos.append(_linea_producto(producto, cantidad or 1, precio))
+            cantidad = None
+            palabras.clear()
+    
+    # Si no se encontraron productos, usar el primer precio con cantidad 1
+    if not productos and primer_precio is not None:
+        productos.append(_linea_producto('Producto Genérico', 1, primer_precio))
     
     return productos
 
 
+def _numero_tras(texto, posicion, con_prefijo_n):
+    """
+    Lee el número de factura que sigue a una palabra clave, mirando como
+    mucho unos pocos caracteres:
+        factura: 2025-001 / factura #2025-001 / número 2025-001
+        factura nº 123 (con_prefijo_n)
+    """
+    inicio = posicion
+    posicion = saltar_espacios(texto, posicion, MAX_ESPACIOS_NUMERO)
+    if con_prefijo_n:
+        if posicion == inicio or texto[posicion:posicion + 1].lower() != 'n':
+            return None
+        if texto[posicion + 1:posicion + 2].lower() not in ('u', 'ú', 'º'):
+            return None
+        posicion = saltar_espacios(texto, posicion + 2, MAX_ESPACIOS_NUMERO)
+        digitos, _ = leer_digitos(texto, posicion, 20)
+        return digitos or None
+    
+    anio, posicion = leer_digitos(texto, posicion, 5)
+    if len(anio) != 4 or texto[posicion:posicion + 1] != '-':
+        return None
+    serie, _ = leer_digitos(texto, posicion + 1, 3)
+    return f"{anio}-{serie}" if len(serie) == 3 else None
+
+
 def extraer_numero_factura(texto):
     """
     Intenta extraer un número de factura si está mencionado
+    Devuelve None si no hay ninguno (el número lo asigna pdf-service)
     """
-    patrones = [
-        r'factura\s*[:#]?\s*(\d{4}-\d{3})',  # factura: 2025-001
-        r'n[uúº]mero\s+(\d{4}-\d{3})',        # número 2025-001
-        r'factura\s+n[uúº]\s*(\d+)',          # factura nº 123
-    ]
+    tokens = tokenizar(texto)
     
-    for patron in patrones:
-        match = re.search(patron, texto, re.IGNORECASE)
-        if match:
-            return match.group(1)
+    # Por prioridad: "factura 2025-001", "número 2025-001", "factura nº 123"
+    encontrados = [None, None, None]
+    for clave, _, fin in FRASES_NUMERO.coincidencias(tokens):
+        posicion = tokens[fin - 1].end()
+        if clave == 'factura':
+            if encontrados[0] is None:
+                separador = saltar_espacios(texto, posicion, MAX_ESPACIOS_NUMERO)
+                if texto[separador:separador + 1] in (':', '#'):
+                    encontrados[0] = _numero_tras(texto, separador + 1, False)
+                else:
+                    encontrados[0] = _numero_tras(texto, posicion, False)
+            if encontrados[2] is None:
+                encontrados[2] = _numero_tras(texto, posicion, True)
+        elif encontrados[1] is None and texto[posicion:posicion + 1].isspace():
+            encontrados[1] = _numero_tras(texto, posicion, False)
+        if encontrados[0]:
+            break
     
-    # Si no se encuentra, generar uno basado en fecha
-    ahora = datetime.now()
-    return f"{ahora.year}-{ahora.month:02d}{ahora.day:02d}{ahora.hour:02d}{ahora.minute:02d}"
+    for numero in encontrados:
+        if numero:
+            return numero
+    return None
+
+
+def _es_nombre_propio(palabra):
+    return len(palabra) > 1 and palabra[0].isupper() and palabra[1:].islower()
 
 
 def extraer_cliente(texto):
     """
-    Intenta extraer el nombre del cliente del texto
+    Intenta extraer el nombre del cliente del texto: hasta cuatro
+    palabras en mayúscula tras "para", "cliente:", "a nombre de" o
+    "destinatario:"
     """
-    patrones = [
-        r'para\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
-        r'cliente:?\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
-        r'a nombre de\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
-        r'destinatario:?\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+){0,3})',
-    ]
+    tokens = tokenizar(texto)
+    mejor = None
+    for (prioridad, dos_puntos), _, j in FRASES_CLIENTE.coincidencias(tokens):
+        if mejor is not None and prioridad >= mejor[0]:
+            continue
+        
+        anterior = tokens[j - 1].end()
+        if (dos_puntos and j < len(tokens) and tokens[j][0] == ':'
+                and tokens[j].start() == anterior):
+            anterior = tokens[j].end()
+            j += 1
+        
+        partes = []
+        while j < len(tokens) and len(partes) < MAX_PALABRAS_CLIENTE:
+            token = tokens[j]
+            if (token.lastgroup != PALABRA or not _es_nombre_propio(token[PALABRA])
+                    or not texto[anterior:token.start()].isspace()):
+                break
+            partes.append(token[PALABRA])
+            anterior = token.end()
+            j += 1
+        
+        if partes:
+            mejor = (prioridad, ' '.join(partes))
+            if prioridad == 0:
+                break
     
-    for patron in patrones:
-        match = re.search(patron, texto)
-        if match:
-            return match.group(1).strip()
+    return mejor[1] if mejor else "Cliente"
+
+
+def normalizar_texto(texto):
+    """
+    Quita los espacios sobrantes de cada línea (se conservan los saltos
+    de línea, que separan productos)
+    """
+    lineas = (_RE_ESPACIOS.sub(' ', linea).strip() for linea in texto.split('\n'))
+    return '\n'.join(lineas).strip()
+
+
+def extraer_cliente_y_productos(texto):
+    """
+    Extrae cliente y productos pasando por la caché: un mensaje idéntico
+    (salvo espacios) no se vuelve a analizar
+    """
+    clave = normalizar_texto(texto)
+    guardado = cache_extraccion.obtener(clave)
+    if guardado is None:
+        with ETAPA.labels('cliente').time():
+            cliente_nombre = extraer_cliente(clave)
+        with ETAPA.labels('productos').time():
+            productos = extraer_productos(clave)
+        guardado = (cliente_nombre, productos)
+        cache_extraccion.guardar(clave, guardado)
     
-    return "Cliente"
+    # Copias: la respuesta no debe poder modificar lo guardado
+    cliente_nombre, productos = guardado
+    return cliente_nombre, [dict(item) for item in productos]
+
+
+def interpretar_pedido(texto, numero=None, fecha=None):
+    """
+    Convierte el texto de un pedido en la respuesta de /procesar-pedido
+    Devuelve None si no se encuentra ningún producto
+    La fecha (hoy si no se indica) y el número se calculan siempre (no se
+    cachean). Si el texto no trae número queda None: lo asigna pdf-service
+    al guardar la factura, después de comprobar que no está repetida
+    """
+    # Extraer información del texto
+    cliente_nombre, productos = extraer_cliente_y_productos(texto)
+    
+    # Número de factura (usar el proporcionado o el del texto)
+    with ETAPA.labels('numero').time():
+        if numero is None:
+            numero = extraer_numero_factura(texto)
+    
+    if not productos:
+        return None
+    
+    # Generar fecha actual
+    if fecha is None:
+        fecha = datetime.now().strftime('%d/%m/%Y')
+    
+    # Construir respuesta en formato compatible con tu PDF
+    respuesta = {
+        'numero': numero,
+        'fecha': fecha,
+        'cliente': {
+            'nombre': cliente_nombre
+        },
+        'items': productos
+    }
+    
+    # Calcular totales
+    subtotal = sum(item['base'] for item in productos)
+    iva_total = sum(item['iva'] for item in productos)
+    total = sum(item['total'] for item in productos)
+    
+    response_data = {
+        'success': True,
+        'mensaje': 'Pedido procesado correctamente',
+        'texto_original': texto,
+        'factura': respuesta,
+        'resumen': {
+            'subtotal': round(subtotal, 2),
+            'iva': round(iva_total, 2),
+            'total': round(total, 2),
+            'num_items': len(productos)
+        }
+    }
+    return response_data
+
+
+def _interpretar_pedido_lote(pedido):
+    """
+    Interpreta un pedido de un lote (también dentro de un proceso del pool)
+    Los errores se devuelven en el resultado para no romper el lote
+    """
+    if not isinstance(pedido, dict) or not isinstance(pedido.get('texto'), str):
+        return {'success': False, 'error': 'Campo "texto" requerido'}
+    if len(pedido['texto']) > MAX_LONGITUD_TEXTO:
+        return {
+            'success': False,
+            'error': ERROR_TEXTO_LARGO,
+            'max_caracteres': MAX_LONGITUD_TEXTO
+        }
+    try:
+        resultado = interpretar_pedido(
+            pedido['texto'], pedido.get('numero'), pedido.get('fecha')
+        )
+    except Exception as e:
+        return {
+            'success': False,
+            'error': 'Error al procesar el pedido',
+            'details': str(e)
+        }
+    if resultado is None:
+        return {
+            'success': False,
+            'error': ERROR_SIN_PRODUCTOS,
+            'sugerencia': SUGERENCIA_FORMATO
+        }
+    return resultado
+
+
+def obtener_pool_pedidos():
+    """Devuelve el pool de procesos para lotes, creándolo si hace falta"""
+    global _pool_pedidos
+    if _pool_pedidos is None:
+        _pool_pedidos = ProcessPoolExecutor(max_workers=PEDIDOS_WORKERS)
+    return _pool_pedidos
+
+
+def reiniciar_pool_pedidos():
+    """Descarta el pool actual (por ejemplo, si un proceso ha muerto)"""
+    global _pool_pedidos
+    if _pool_pedidos is not None:
+        _pool_pedidos.shutdown(wait=False, cancel_futures=True)
+        _pool_pedidos = None
+
+
+def interpretar_lote(pedidos):
+    """
+    Genera los resultados de un lote de pedidos en el mismo orden
+    Los lotes grandes se reparten entre los procesos del pool
+    """
+    if len(pedidos) < LOTE_MINIMO_POOL:
+        for pedido in pedidos:
+            yield _interpretar_pedido_lote(pedido)
+        return
+    
+    enviados = 0
+    try:
+        resultados = obtener_pool_pedidos().map(
+            _interpretar_pedido_lote, pedidos, chunksize=TROZO_POOL
+        )
+        for resultado in resultados:
+            yield resultado
+            enviados += 1
+    except Exception as e:
+        # Un proceso murió: el resto del lote sale con error y el pool se
+        # recrea en el siguiente lote
+        reiniciar_pool_pedidos()
+        for _ in range(enviados, len(pedidos)):
+            yield {
+                'success': False,
+                'error': 'Error al procesar el pedido',
+                'details': str(e) or type(e).__name__
+            }
+
+
+def parece_pedido(texto):
+    """Filtro rápido para mensajes de chat: un pedido lleva algún precio"""
+    return _RE_HAY_PRECIO.search(texto) is not None
+
+
+def procesar_chat(archivo, desde=0, autor=None):
+    """
+    Genera los resultados de un chat exportado de WhatsApp (ver whatsapp)
+    
+    Un resultado por cada mensaje que parece un pedido, con 'tipo':
+    'pedido', los datos del mensaje y la respuesta de /procesar-pedido
+    (fecha de la factura = fecha del mensaje); al final, uno con 'tipo':
+    'resumen'. 'offset' es el byte desde el que reanudar tras ese
+    resultado. Con autor, solo se miran los mensajes de ese autor
+    """
+    mensajes = pedidos = errores = 0
+    offset = desde
+    pendientes = []
+    
+    def interpretar(pendientes):
+        nonlocal pedidos, errores
+        lote = [{'texto': m.texto, 'fecha': m.fecha} for m in pendientes]
+        for mensaje, resultado in zip(pendientes, interpretar_lote(lote)):
+            if resultado.get('success'):
+                pedidos += 1
+            else:
+                errores += 1
+            yield {
+                'tipo': 'pedido',
+                'offset': mensaje.fin,
+                'inicio': mensaje.inicio,
+                'fecha_mensaje': mensaje.fecha,
+                'hora_mensaje': mensaje.hora,
+                'autor': mensaje.autor,
+                **resultado
+            }
+    
+    for mensaje in leer_mensajes(archivo, desde, MAX_LONGITUD_TEXTO):
+        mensajes += 1
+        offset = mensaje.fin
+        if mensaje.autor is None or (autor and mensaje.autor.lower() != autor.lower()):
+            continue
+        if not parece_pedido(mensaje.texto):
+            continue
+        pendientes.append(mensaje)
+        if len(pendientes) == LOTE_CHAT:
+            yield from interpretar(pendientes)
+            pendientes = []
+    
+    if pendientes:
+        yield from interpretar(pendientes)
+    yield {
+        'tipo': 'resumen',
+        'offset': offset,
+        'desde': desde,
+        'mensajes': mensajes,
+        'pedidos': pedidos,
+        'errores': errores
+    }
+
+
+def precalentar():
+    """
+    Pasa un pedido de ejemplo por la extracción para que todo lo que
+    usa (escáner, vocabularios) quede cargado. Ver arranque: con
+    gunicorn se llama en el proceso maestro y los workers la heredan o,
+    con ARRANQUE_RAPIDO=1, en cada worker en segundo plano
+    """
+    texto = 'Para María García: 2 ramos de rosas a 30 euros. Factura 2025-001'
+    extraer_cliente(texto)
+    extraer_productos(texto)
+    extraer_numero_factura(texto)
 
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Endpoint de health check"""
+    """Endpoint de health check (liveness; la disponibilidad, en /ready)"""
     return jsonify({
         'status': 'healthy',
         'service': 'mock-ia-flores-loli',
         'empresa': 'Flores y Plantas Loli',
+        'cache': cache_extraccion.estadisticas(),
+        'pid': os.getpid(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -179,63 +577,21 @@ def procesar_pedido():
                 'error': 'Campo "texto" requerido'
             }), 400
         
-        texto = data['texto']
-        
-        # Extraer información del texto
-        cliente_nombre = extraer_cliente(texto)
-        productos = extraer_productos(texto)
+        if len(data['texto']) > MAX_LONGITUD_TEXTO:
+            return jsonify({
+                'error': ERROR_TEXTO_LARGO,
+                'max_caracteres': MAX_LONGITUD_TEXTO
+            }), 413
         
-        # Número de factura (usar el proporcionado o generar uno)
-        numero = data.get('numero', extraer_numero_factura(texto))
+        response_data = interpretar_pedido(data['texto'], data.get('numero'))
         
         # Validar que se encontraron productos
-        if not productos:
+        if response_data is None:
             return jsonify({
-                'error': 'No se pudieron extraer productos del texto',
-                'sugerencia': 'Formato esperado: "2 ramos de rosas a 30 euros"'
+                'error': ERROR_SIN_PRODUCTOS,
+                'sugerencia': SUGERENCIA_FORMATO
             }), 400
         
-        # Limitar a 10 productos (como en tu app)
-        if len(productos) > 10:
-            productos = productos[:10]
-            mensaje_warning = 'Solo se procesaron los primeros 10 productos'
-        else:
-            mensaje_warning = None
-        
-        # Generar fecha actual
-        fecha = datetime.now().strftime('%d/%m/%Y')
-        
-        # Construir respuesta en formato compatible con tu PDF
-        respuesta = {
-            'numero': numero,
-            'fecha': fecha,
-            'cliente': {
-                'nombre': cliente_nombre
-            },
-            'items': productos
-        }
-        
-        # Calcular totales
-        subtotal = sum(item['base'] for item in productos)
-        iva_total = sum(item['iva'] for item in productos)
-        total = sum(item['total'] for item in productos)
-        
-        response_data = {
-            'success': True,
-            'mensaje': 'Pedido procesado correctamente',
-            'texto_original': texto,
-            'factura': respuesta,
-            'resumen': {
-                'subtotal': round(subtotal, 2),
-                'iva': round(iva_total, 2),
-                'total': round(total, 2),
-                'num_items': len(productos)
-            }
-        }
-        
-        if mensaje_warning:
-            response_data['warning'] = mensaje_warning
-        
         return jsonify(response_data), 200
         
     except Exception as e:
@@ -245,6 +601,90 @@ def procesar_pedido():
         }), 500
 
 
+@app.route('/procesar-pedidos', methods=['POST'])
+def procesar_pedidos():
+    """
+    Endpoint para procesar muchos mensajes en una sola llamada (por
+    ejemplo, al recuperar los pedidos acumulados tras una caída)
+    
+    Formato esperado: lista de pedidos con el mismo formato que
+    /procesar-pedido, directamente o dentro de {"pedidos": [...]}
+    [{"texto": "...", "numero": "2025-001"}, {"texto": "..."}]
+    
+    Devuelve NDJSON (application/x-ndjson): una línea por pedido, en el
+    mismo orden y según se van procesando, con 'indice' y 'success'.
+    Un pedido incorrecto no hace fallar al resto del lote
+    """
+    if not request.is_json:
+        return jsonify({
+            'error': 'Content-Type debe ser application/json'
+        }), 400
+    
+    data = request.get_json()
+    pedidos = data.get('pedidos') if isinstance(data, dict) else data
+    
+    if not isinstance(pedidos, list) or len(pedidos) == 0:
+        return jsonify({
+            'error': 'Debe enviarse una lista de pedidos no vacía'
+        }), 400
+    
+    if len(pedidos) > MAX_PEDIDOS_LOTE:
+        return jsonify({
+            'error': f'Máximo {MAX_PEDIDOS_LOTE} pedidos por lote'
+        }), 400
+    
+    def generar():
+        for indice, resultado in enumerate(interpretar_lote(pedidos)):
+            resultado['indice'] = indice
+            yield json.dumps(resultado, ensure_ascii=False) + '\n'
+    
+    return Response(generar(), mimetype='application/x-ndjson')
+
+
+@app.route('/procesar-chat', methods=['POST'])
+def procesar_chat_exportado():
+    """
+    Endpoint para procesar un chat exportado de WhatsApp (.txt) completo
+    
+    El archivo va en el campo 'archivo' de un formulario multipart o
+    directamente como cuerpo de la petición (text/plain). Se lee según
+    llega, sin cargarlo entero en memoria.
+    
+    Parámetros opcionales:
+        desde   byte desde el que continuar (el 'offset' de la última
+                línea recibida en una llamada anterior)
+        autor   procesar solo los mensajes de este autor
+    
+    Devuelve NDJSON (application/x-ndjson): una línea por cada pedido
+    encontrado, según se van procesando, y una línea final de resumen
+    """
+    try:
+        desde = int(request.args.get('desde', 0))
+    except ValueError:
+        desde = -1
+    if desde < 0:
+        return jsonify({
+            'error': 'Parámetro "desde" inválido (byte del archivo, >= 0)'
+        }), 400
+    
+    if request.mimetype == 'multipart/form-data':
+        subido = request.files.get('archivo')
+        if subido is None:
+            return jsonify({
+                'error': 'Campo "archivo" requerido'
+            }), 400
+        archivo = subido.stream
+    else:
+        archivo = request.stream
+    autor = request.args.get('autor')
+    
+    def generar():
+        for resultado in procesar_chat(archivo, desde, autor):
+            yield json.dumps(resultado, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generar()), mimetype='application/x-ndjson')
+
+
 @app.route('/ejemplos', methods=['GET'])
 def ejemplos():
     """
@@ -280,7 +720,7 @@ def ejemplos():
             }
         ],
         'formato_salida': {
-            'numero': 'string (generado automáticamente: YYYY-MMDDHHMMSS)',
+            'numero': 'string (el del texto) o null: lo asigna pdf-service al generar la factura',
             'fecha': 'string (DD/MM/YYYY - fecha actual)',
             'cliente': {'nombre': 'string'},
             'items': [
@@ -295,7 +735,7 @@ def ejemplos():
         },
         'notas': [
             'IVA aplicado: 10%',
-            'Máximo 10 productos por factura',
+            'Sin límite de productos (la factura continúa en varias páginas)',
             'Detecta automáticamente: ramos, centros, plantas, arreglos, coronas, bouquets',
             'Formatos de precio aceptados: "30 euros", "30€", "30 eur"'
         ]
@@ -312,6 +752,12 @@ def test_extraccion():
         data = request.get_json()
         texto = data.get('texto', '')
         
+        if len(texto) > MAX_LONGITUD_TEXTO:
+            return jsonify({
+                'error': ERROR_TEXTO_LARGO,
+                'max_caracteres': MAX_LONGITUD_TEXTO
+            }), 413
+        
         return jsonify({
             'texto': texto,
             'cliente_detectado': extraer_cliente(texto),
@@ -325,10 +771,39 @@ def test_extraccion():
         }), 500
 
 
+@app.cli.command('procesar-chat')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--desde', default=0, show_default=True,
+              help='Byte desde el que continuar (el offset de la última línea escrita)')
+@click.option('--autor', help='Procesar solo los mensajes de este autor')
+@click.option('--salida', help='Archivo NDJSON (por defecto la salida estándar; '
+                                'con --desde se añade al final)')
+def procesar_chat_cli(archivo, desde, autor, salida):
+    """Procesa un chat exportado de WhatsApp y escribe los pedidos en NDJSON"""
+    with open(archivo, 'rb') as entrada:
+        resultados = procesar_chat(entrada, desde, autor)
+        if not salida:
+            for resultado in resultados:
+                sys.stdout.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+            return
+        with open(salida, 'a' if desde else 'w', encoding='utf-8') as f:
+            for resultado in resultados:
+                f.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+    print(f"💬 {resultado['pedidos']} pedidos de {resultado['mensajes']} mensajes "
+          f"guardados en {salida} (offset {resultado['offset']})")
+
+
+# Fin de la carga de la aplicación (el tiempo se escribe en el log)
+arranque.cargada()
+
 if __name__ == '__main__':
     print("🤖 Iniciando Mock IA - FLORES Y PLANTAS LOLI")
     print("🌸 Sistema de procesamiento de pedidos por lenguaje natural")
     print("📝 Endpoint principal: POST /procesar-pedido")
+    print("📦 Lotes de mensajes (NDJSON): POST /procesar-pedidos")
+    print("💬 Chat exportado de WhatsApp (NDJSON): POST /procesar-chat")
     print("📚 Ejemplos disponibles: GET /ejemplos")
     print("🧪 Test de extracción: POST /test")
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    arranque.precalentar(precalentar, en_segundo_plano=True)
+    # Depurador y recarga solo con FLASK_DEBUG=1
+    app.run(host='0.0.0.0', port=5001, debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
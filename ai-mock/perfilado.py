@@ -0,0 +1,283 @@
+"""
+Perfilado de peticiones bajo demanda (cProfile)
+
+Desactivado por defecto: sin token ni muestreo, activar_perfilado no
+toca la app (ni middleware ni hooks), así que no cuesta nada. Activado:
+
+    - una petición con la cabecera X-Perfilar: <token> (o ?perfilar=<token>)
+      se ejecuta bajo cProfile
+    - con muestreo=N se perfila además una de cada N peticiones de cada
+      proceso (salvo /metrics, /health, /ready y /perfiles)
+    - GET /perfiles lista los perfiles guardados y GET /perfiles/<nombre>
+      descarga uno (?formato=texto: las funciones más costosas, ordenadas
+      por ?orden=cumulative|tottime|ncalls). Ambas piden el token
+
+Cada perfil es un archivo .prof de pstats (se abre con
+`python -m pstats` o snakeviz), acompañado de un .json con la ruta, el
+estado y la duración. La respuesta perfilada lleva su nombre en la
+cabecera X-Perfil. Se conservan los `maximo` perfiles más recientes.
+
+Solo se perfila una petición a la vez por proceso: si ya hay otra en
+curso, la nueva se atiende sin perfilar. El perfil incluye el envío del
+cuerpo y lo que se ejecuta al cerrar la respuesta, pero no lo que pasa
+en otros procesos (pool de lotes) ni en otros hilos (cola de trabajos).
+
+Este archivo es el mismo en ai-mock y en pdf-service (ver
+comprobar_compartidos.sh).
+"""
+import cProfile
+from datetime import datetime
+import hmac
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from urllib.parse import parse_qs
+
+from flask import Response, jsonify, request, send_file
+
+CABECERA = 'X-Perfilar'
+PARAMETRO = 'perfilar'
+
+# Rutas que el muestreo no elige (las de /perfiles no se perfilan nunca)
+RUTAS_SIN_MUESTREO = ('/metrics', '/health', '/ready', '/perfiles')
+
+ORDENES = ('cumulative', 'tottime', 'ncalls')
+FUNCIONES_RESUMEN = 40
+
+_RE_RUTA = re.compile(r'[^\w.-]+')
+_RE_NOMBRE = re.compile(r'^[\w.-]+\.prof$')
+
+
+def _token_correcto(valor, token):
+    return valor is not None and hmac.compare_digest(
+        valor.encode('utf-8', 'replace'), token.encode('utf-8')
+    )
+
+
+class _RespuestaPerfilada:
+    """
+    Envuelve el cuerpo de la respuesta para seguir perfilando mientras
+    el servidor lo envía y al cerrarlo
+    """
+
+    def __init__(self, respuesta, perfil, terminar):
+        self.respuesta = respuesta
+        self.perfil = perfil
+        self.terminar = terminar
+
+    def __iter__(self):
+        iterador = iter(self.respuesta)
+        while True:
+            self.perfil.enable()
+            try:
+                trozo = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                self.perfil.disable()
+            yield trozo
+
+    def close(self):
+        try:
+            cerrar = getattr(self.respuesta, 'close', None)
+            if cerrar is not None:
+                self.perfil.runcall(cerrar)
+        finally:
+            self.terminar()
+
+
+class Perfilador:
+    """Middleware WSGI que ejecuta bajo cProfile las peticiones elegidas"""
+
+    def __init__(self, wsgi_app, servicio, directorio, token=None, muestreo=0, maximo=200):
+        self.wsgi_app = wsgi_app
+        self.servicio = servicio
+        self.directorio = directorio
+        self.token = token or None
+        self.muestreo = muestreo
+        self.maximo = maximo
+        self._contador = itertools.count(1)
+        self._secuencia = itertools.count(1)
+        self._ocupado = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _motivo(self, environ):
+        """'token', 'muestreo' o None si la petición no se perfila"""
+        ruta = environ.get('PATH_INFO', '')
+        if ruta.startswith('/perfiles'):
+            return None
+        if self.token:
+            valor = environ.get('HTTP_X_PERFILAR')
+            consulta = environ.get('QUERY_STRING', '')
+            if valor is None and f'{PARAMETRO}=' in consulta:
+                valor = parse_qs(consulta).get(PARAMETRO, [None])[0]
+            if _token_correcto(valor, self.token):
+                return 'token'
+        if (self.muestreo and not ruta.startswith(RUTAS_SIN_MUESTREO)
+                and next(self._contador) % self.muestreo == 0):
+            return 'muestreo'
+        return None
+
+    def __call__(self, environ, start_response):
+        motivo = self._motivo(environ)
+        if motivo is None or not self._ocupado.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        try:
+            ruta = _RE_RUTA.sub('-', environ.get('PATH_INFO', '').strip('/'))[:60] or 'raiz'
+            nombre = (f"{self.servicio}_{datetime.now():%Y%m%dT%H%M%S}_{os.getpid()}"
+                      f"_{next(self._secuencia)}_{ruta}.prof")
+            datos = {
+                'nombre': nombre,
+                'metodo': environ.get('REQUEST_METHOD'),
+                'ruta': environ.get('PATH_INFO'),
+                'motivo': motivo,
+                'pid': os.getpid(),
+                'fecha': datetime.now().isoformat(),
+            }
+
+            def start_response_perfilada(estado, cabeceras, exc_info=None):
+                datos['estado'] = int(estado.split(' ', 1)[0])
+                cabeceras.append(('X-Perfil', nombre))
+                return start_response(estado, cabeceras, exc_info)
+
+            perfil = cProfile.Profile()
+            inicio = time.perf_counter()
+            respuesta = perfil.runcall(self.wsgi_app, environ, start_response_perfilada)
+        except BaseException:
+            self._ocupado.release()
+            raise
+
+        def terminar():
+            try:
+                datos['duracion_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+                self._guardar(perfil, datos)
+            finally:
+                self._ocupado.release()
+
+        return _RespuestaPerfilada(respuesta, perfil, terminar)
+
+    def _guardar(self, perfil, datos):
+        """Escribe el perfil y sus datos, y borra los más antiguos"""
+        ruta = os.path.join(self.directorio, datos['nombre'])
+        perfil.dump_stats(f'{ruta}.tmp')
+        os.replace(f'{ruta}.tmp', ruta)
+        with open(f'{ruta[:-5]}.json', 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False)
+
+        nombres = self._nombres()
+        for antiguo in nombres[:max(len(nombres) - self.maximo, 0)]:
+            for extension in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(self.directorio, antiguo[:-5] + extension))
+                except OSError:
+                    pass
+
+    def _nombres(self):
+        """Perfiles de este servicio, del más antiguo al más reciente"""
+        prefijo = f'{self.servicio}_'
+        try:
+            archivos = os.listdir(self.directorio)
+        except OSError:
+            return []
+        nombres = [n for n in archivos if n.startswith(prefijo) and n.endswith('.prof')]
+        return sorted(nombres, key=lambda n: os.path.getmtime(os.path.join(self.directorio, n)))
+
+    def listar(self):
+        perfiles = []
+        for nombre in reversed(self._nombres()):
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                with open(f'{ruta[:-5]}.json', encoding='utf-8') as f:
+                    datos = json.load(f)
+            except (OSError, ValueError):
+                datos = {'nombre': nombre}
+            try:
+                datos['size'] = os.path.getsize(ruta)
+            except OSError:
+                continue
+            perfiles.append(datos)
+        return perfiles
+
+    def ruta(self, nombre):
+        """Ruta de un perfil de este servicio, o None si no existe"""
+        if not _RE_NOMBRE.match(nombre) or not nombre.startswith(f'{self.servicio}_'):
+            return None
+        ruta = os.path.join(self.directorio, nombre)
+        return ruta if os.path.isfile(ruta) else None
+
+
+def resumen_perfil(ruta, orden='cumulative', funciones=FUNCIONES_RESUMEN):
+    """Texto con las funciones más costosas de un perfil"""
+    salida = io.StringIO()
+    pstats.Stats(ruta, stream=salida).sort_stats(orden).print_stats(funciones)
+    return salida.getvalue()
+
+
+def activar_perfilado(app, servicio, directorio, token=None, muestreo=0, maximo=200):
+    """
+    Instala el perfilado en la app si hay token o muestreo; si no, no
+    hace nada. Devuelve el Perfilador o None
+    """
+    if not token and not muestreo:
+        return None
+
+    perfilador = Perfilador(app.wsgi_app, servicio, directorio, token, muestreo, maximo)
+    app.wsgi_app = perfilador
+    if not token:
+        return perfilador
+
+    def autorizado():
+        valor = request.headers.get(CABECERA) or request.args.get(PARAMETRO)
+        return _token_correcto(valor, token)
+
+    @app.route('/perfiles', methods=['GET'])
+    def listar_perfiles():
+        """Perfiles guardados en este servicio, del más reciente al más antiguo"""
+        if not autorizado():
+            return jsonify({
+                'error': 'No autorizado'
+            }), 403
+        perfiles = perfilador.listar()
+        return jsonify({
+            'success': True,
+            'count': len(perfiles),
+            'muestreo': perfilador.muestreo,
+            'max_perfiles': perfilador.maximo,
+            'perfiles': perfiles
+        })
+
+    @app.route('/perfiles/<nombre>', methods=['GET'])
+    def descargar_perfil(nombre):
+        """Descarga un perfil (.prof) o, con ?formato=texto, su resumen"""
+        if not autorizado():
+            return jsonify({
+                'error': 'No autorizado'
+            }), 403
+        ruta = perfilador.ruta(nombre)
+        if ruta is None:
+            return jsonify({
+                'error': 'Perfil no encontrado'
+            }), 404
+
+        if request.args.get('formato') == 'texto':
+            orden = request.args.get('orden', 'cumulative')
+            if orden not in ORDENES:
+                return jsonify({
+                    'error': f"orden debe ser uno de: {', '.join(ORDENES)}"
+                }), 400
+            return Response(resumen_perfil(ruta, orden), mimetype='text/plain')
+
+        return send_file(
+            ruta,
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=nombre
+        )
+
+    return perfilador
@@ -0,0 +1,133 @@
+"""
+Lectura de chats exportados de WhatsApp (.txt)
+
+Cada mensaje empieza en una línea con fecha, hora y autor; si tiene
+varias líneas, las siguientes van sin prefijo:
+
+    12/03/25, 10:15 - María García: Hola, quería
+    2 ramos de rosas a 30 euros
+    [12/03/25, 10:15:32] María García: ...      (exportado desde iPhone)
+
+El archivo se lee línea a línea y cada mensaje se entrega en cuanto
+empieza el siguiente, así que la memoria no depende del tamaño del
+chat. Cada mensaje lleva la posición (en bytes) donde termina: volver a
+leer desde ahí continúa justo después de él.
+"""
+import re
+
+# Fecha día/mes/año (formato español), hora con segundos y "a. m." opcionales
+_RE_CABECERA = re.compile(
+    r'\u200e?\[?(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4}),?\s(\d{1,2}):(\d{2})(?::\d{2})?'
+    r'(?:\s?([ap])\.?\s?m\.?)?(?:\]\s|\s-\s)',
+    re.IGNORECASE
+)
+
+# Una línea más larga se lee en trozos de este tamaño
+MAX_BYTES_LINEA = 64 * 1024
+
+
+class Mensaje:
+    """Un mensaje del chat y su posición en el archivo"""
+
+    def __init__(self, inicio, fecha, hora, autor, lineas):
+        self.inicio = inicio
+        self.fin = inicio
+        self.fecha = fecha
+        self.hora = hora
+        self.autor = autor
+        self.lineas = lineas
+        self.caracteres = sum(len(linea) for linea in lineas)
+
+    @property
+    def texto(self):
+        return '\n'.join(self.lineas)
+
+
+def _leer_cabecera(linea):
+    """
+    Devuelve (fecha DD/MM/YYYY, hora HH:MM, autor, texto) si la línea
+    empieza un mensaje, o None si es continuación del anterior
+    Los avisos del sistema (sin autor) tienen autor None
+    """
+    match = _RE_CABECERA.match(linea)
+    if not match:
+        return None
+    dia, mes, anio, hora, minuto, meridiano = match.groups()
+    if not (1 <= int(dia) <= 31 and 1 <= int(mes) <= 12):
+        return None
+    if len(anio) == 2:
+        anio = '20' + anio
+    hora = int(hora)
+    if meridiano:
+        hora = hora % 12 + (12 if meridiano.lower() == 'p' else 0)
+    
+    autor, separador, texto = linea[match.end():].partition(': ')
+    if not separador:
+        autor, texto = None, linea[match.end():]
+    return f"{int(dia):02d}/{int(mes):02d}/{anio}", f"{hora:02d}:{minuto}", autor, texto
+
+
+def leer_mensajes(archivo, desde=0, max_caracteres=None):
+    """
+    Genera los mensajes de un chat exportado
+    
+    archivo: binario con readline (archivo abierto, subida, cuerpo de la
+    petición). Si no admite seek, los primeros desde bytes se leen y
+    se descartan. Las líneas anteriores a la primera cabecera (el final
+    de un mensaje cortado por desde) se ignoran.
+    
+    Con max_caracteres, un mensaje deja de crecer al pasar de ese
+    tamaño (se queda en algo más de max_caracteres)
+    """
+    posicion = _saltar(archivo, desde)
+    actual = None
+    linea_partida = False
+    
+    while True:
+        datos = archivo.readline(MAX_BYTES_LINEA)
+        if not datos:
+            break
+        inicio = posicion
+        posicion += len(datos)
+        linea = datos.decode('utf-8', errors='replace')
+        if inicio == 0:
+            linea = linea.lstrip('\ufeff')
+        completa = linea.endswith('\n')
+        linea = linea.rstrip('\r\n')
+        
+        # El trozo siguiente de una línea larga nunca es una cabecera
+        cabecera = None if linea_partida else _leer_cabecera(linea)
+        linea_partida = not completa
+        
+        if cabecera is not None:
+            if actual is not None:
+                actual.fin = inicio
+                yield actual
+            fecha, hora, autor, texto = cabecera
+            actual = Mensaje(inicio, fecha, hora, autor, [texto])
+        elif actual is not None:
+            if max_caracteres is None or actual.caracteres <= max_caracteres:
+                actual.lineas.append(linea)
+                actual.caracteres += len(linea) + 1
+    
+    if actual is not None:
+        actual.fin = posicion
+        yield actual
+
+
+def _saltar(archivo, desde):
+    """Coloca el archivo en el byte desde y devuelve la posición"""
+    if desde <= 0:
+        return 0
+    try:
+        archivo.seek(desde)
+        return desde
+    except (AttributeError, OSError, ValueError):
+        pass
+    pendiente = desde
+    while pendiente:
+        datos = archivo.read(min(pendiente, MAX_BYTES_LINEA))
+        if not datos:
+            break
+        pendiente -= len(datos)
+    return desde - pendiente
@@ -0,0 +1,68 @@
+"""
+Cliente HTTP con una conexión persistente (keep-alive) por hilo
+
+Lo usan el generador de carga y el sustituto de n8n: cada hilo reutiliza
+su conexión con cada servicio, como haría un cliente real bajo carga.
+"""
+import http.client
+import json
+import threading
+from urllib.parse import urlsplit
+
+
+class ClienteHTTP:
+    """Peticiones a un servicio (http://host:puerto) desde varios hilos"""
+
+    def __init__(self, url, timeout=30):
+        partes = urlsplit(url)
+        self.host = partes.hostname
+        self.puerto = partes.port or 80
+        self.base = partes.path.rstrip('/')
+        self.timeout = timeout
+        self._hilos = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._hilos, 'conexion', None)
+        if conexion is None:
+            conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=self.timeout)
+            self._hilos.conexion = conexion
+        return conexion
+
+    def cerrar(self):
+        conexion = getattr(self._hilos, 'conexion', None)
+        if conexion is not None:
+            conexion.close()
+            self._hilos.conexion = None
+
+    def peticion(self, metodo, ruta, cuerpo=None, cabeceras=None):
+        """
+        Devuelve (estado, cabeceras, cuerpo en bytes)
+        Si la conexión guardada estaba cerrada se reintenta una vez; los
+        demás errores de red se propagan
+        """
+        for intento in range(2):
+            conexion = self._conexion()
+            try:
+                conexion.request(metodo, self.base + ruta, body=cuerpo, headers=cabeceras or {})
+                respuesta = conexion.getresponse()
+                datos = respuesta.read()
+            except (ConnectionError, http.client.HTTPException):
+                self.cerrar()
+                if intento:
+                    raise
+                continue
+            except OSError:
+                self.cerrar()
+                raise
+            if respuesta.will_close:
+                self.cerrar()
+            return respuesta.status, respuesta.headers, datos
+
+    def post_json(self, ruta, datos, cabeceras=None):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        return self.peticion('POST', ruta, cuerpo, {
+            'Content-Type': 'application/json', **(cabeceras or {})
+        })
+
+    def get(self, ruta):
+        return self.peticion('GET', ruta)
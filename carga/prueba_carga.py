@@ -0,0 +1,472 @@
+"""
+Prueba de carga del flujo completo (Mock IA + servicio de PDFs)
+
+Envía mensajes de un corpus sintético a la concurrencia y al ritmo
+indicados y, en cada escenario, mide:
+
+    - peticiones completadas por segundo y errores (por tipo)
+    - latencia p50, p95, p99 y máxima en ms
+    - CPU (núcleos de media) y memoria residente de cada servicio, leídas
+      de su /metrics una vez por segundo durante la prueba
+
+Escenarios:
+    ia       POST /procesar-pedido del Mock IA
+    pdf      POST /generar-factura con facturas ya construidas
+    flujo    POST al webhook de n8n; sin --webhook-url se arranca un
+             sustituto local (stub_n8n.py) que encadena los dos servicios
+             como el flujo real
+    directo  POST /factura-desde-texto (texto → factura en una llamada)
+
+Con --tasa las peticiones salen a ese ritmo (carga abierta) y la latencia
+se mide desde el instante en que tocaba enviarlas, así que un servicio
+saturado no esconde sus colas. Sin --tasa, cada hilo envía la siguiente
+petición en cuanto recibe la respuesta.
+
+Las facturas se envían sin número y consumen la numeración: conviene
+arrancar los servicios con un INVOICES_DIR (y su catálogo) de pruebas.
+
+Los resultados se guardan en JSON (--salida) y se pueden comparar con los
+de otra versión (--baseline): si algún escenario empeora más de la
+tolerancia, se muestran las diferencias y el script termina con código 1.
+
+Uso (con los servicios arrancados, desde la raíz del repositorio):
+    python carga/prueba_carga.py --escenarios ia pdf --concurrencia 16 --duracion 30
+    python carga/prueba_carga.py --escenarios flujo --tasa 50 --salida carga.json
+    python carga/prueba_carga.py --baseline carga_v1.json --salida carga_v2.json
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cliente import ClienteHTTP  # noqa: E402
+from stub_n8n import RUTA_WEBHOOK  # noqa: E402
+
+ESCENARIOS = ['ia', 'pdf', 'flujo', 'directo']
+
+IVA = 0.10
+
+CLIENTES = [
+    'María García', 'Juan Pérez', 'Ana López', 'Hotel Plaza', 'Familia Rodríguez',
+    'Carmen Ruiz', 'Restaurante El Patio', 'José Martínez', 'Lucía Fernández',
+]
+# (producto en plural para el mensaje, nombre en la factura, precio)
+PRODUCTOS = [
+    ('ramos de rosas', 'Ramos De Rosas', 30),
+    ('centros de mesa', 'Centros De Mesa', 45),
+    ('plantas de interior', 'Plantas De Interior', 18),
+    ('coronas de flores', 'Coronas De Flores', 95),
+    ('bouquets de novia', 'Bouquets De Novia', 150),
+    ('ramos de girasoles', 'Ramos De Girasoles', 25),
+    ('arreglos florales', 'Arreglos Florales', 85),
+]
+PLANTILLAS = [
+    'Para {cliente}: {lineas}',
+    'Hola! Soy {cliente}, quería {lineas}. Gracias',
+    'Cliente: {cliente}. {lineas}',
+    'Buenas tardes\nPedido a nombre de {cliente}\n{lineas}',
+]
+MENSAJES_SIN_PEDIDO = [
+    'Hola, ¿abrís el domingo?',
+    '¿Tenéis tulipanes blancos?',
+    'Gracias por todo, las flores llegaron perfectas',
+]
+
+# Métricas comparadas con la línea base: (clave, mayor es peor)
+METRICAS = [
+    ('peticiones_por_segundo', False),
+    ('p50_ms', True),
+    ('p95_ms', True),
+    ('p99_ms', True),
+]
+
+# Servicios cuyo /metrics se muestrea: (nombre, opción con su URL, prefijo)
+SERVICIOS = [
+    ('ai-mock', 'ia_url', 'ai_mock'),
+    ('pdf-service', 'pdf_url', 'pdf_service'),
+]
+
+
+def generar_corpus(n, proporcion_sin_pedido=0.0, semilla=2025):
+    """
+    n pedidos sintéticos: (texto del mensaje, factura equivalente o None
+    si el mensaje no es un pedido)
+    """
+    azar = random.Random(semilla)
+    fecha = datetime.now().strftime('%d/%m/%Y')
+    corpus = []
+    for _ in range(n):
+        if azar.random() < proporcion_sin_pedido:
+            corpus.append((azar.choice(MENSAJES_SIN_PEDIDO), None))
+            continue
+        cliente = azar.choice(CLIENTES)
+        lineas = []
+        items = []
+        for producto, nombre, precio in azar.sample(PRODUCTOS, azar.randint(1, 4)):
+            cantidad = azar.randint(1, 6)
+            lineas.append(f'{cantidad} {producto} a {precio} euros')
+            base = cantidad * precio
+            items.append({
+                'producto': nombre,
+                'cantidad': cantidad,
+                'base': round(base, 2),
+                'iva': round(base * IVA, 2),
+                'total': round(base * (1 + IVA), 2)
+            })
+        texto = azar.choice(PLANTILLAS).format(cliente=cliente, lineas=' y '.join(lineas))
+        corpus.append((texto, {
+            'fecha': fecha,
+            'cliente': {'nombre': cliente},
+            'items': items
+        }))
+    return corpus
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))
+    return ordenados[indice]
+
+
+def crear_envio(escenario, args):
+    """
+    Devuelve la función que envía un elemento del corpus y devuelve el
+    estado HTTP (o None si ese escenario no lo puede enviar)
+    """
+    if escenario == 'pdf':
+        servicio = ClienteHTTP(args.pdf_url)
+        
+        def enviar(texto, factura):
+            if factura is None:
+                return None
+            return servicio.post_json('/generar-factura', factura)[0]
+        return enviar
+    
+    if escenario == 'ia':
+        servicio, ruta = ClienteHTTP(args.ia_url), '/procesar-pedido'
+    elif escenario == 'directo':
+        servicio, ruta = ClienteHTTP(args.pdf_url), '/factura-desde-texto'
+    else:
+        servicio, ruta = ClienteHTTP(args.webhook_url), ''
+    
+    def enviar(texto, factura):
+        return servicio.post_json(ruta, {'texto': texto})[0]
+    return enviar
+
+
+class _Plan:
+    """Reparte los turnos entre los hilos y, con tasa, su instante de salida"""
+
+    def __init__(self, peticiones, duracion, tasa):
+        self.peticiones = peticiones
+        self.tasa = tasa
+        self.inicio = time.perf_counter()
+        self.fin = self.inicio + duracion if duracion else None
+        self.siguiente = 0
+        self._lock = threading.Lock()
+
+    def tomar(self):
+        """(índice, instante previsto o None), o None si la prueba ha terminado"""
+        with self._lock:
+            indice = self.siguiente
+            if self.peticiones and indice >= self.peticiones:
+                return None
+            previsto = self.inicio + indice / self.tasa if self.tasa else None
+            if self.fin is not None and (previsto or time.perf_counter()) >= self.fin:
+                return None
+            self.siguiente += 1
+            return indice, previsto
+
+
+def _trabajador(plan, enviar, corpus, resultados):
+    while True:
+        turno = plan.tomar()
+        if turno is None:
+            return
+        indice, previsto = turno
+        if previsto is not None:
+            espera = previsto - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+        texto, factura = corpus[indice % len(corpus)]
+        inicio = previsto if previsto is not None else time.perf_counter()
+        try:
+            estado = enviar(texto, factura)
+        except Exception as e:
+            estado = type(e).__name__
+        if estado is None:
+            continue
+        resultados.append((time.perf_counter() - inicio, estado, factura is not None))
+
+
+class MuestreoServicio(threading.Thread):
+    """Lee la CPU y la memoria de un servicio en su /metrics cada intervalo"""
+
+    def __init__(self, nombre, url, prefijo, intervalo=1.0):
+        super().__init__(daemon=True)
+        self.nombre = nombre
+        self.servicio = ClienteHTTP(url, timeout=5)
+        self.metrica_cpu = f'{prefijo}_process_cpu_seconds'
+        self.metrica_rss = f'{prefijo}_process_resident_memory_bytes'
+        self.intervalo = intervalo
+        self.muestras = []
+        self.parar = threading.Event()
+
+    def _leer(self):
+        try:
+            estado, _, datos = self.servicio.get('/metrics')
+        except OSError:
+            return None
+        if estado != 200:
+            return None
+        valores = {self.metrica_cpu: 0.0, self.metrica_rss: 0.0}
+        for linea in datos.decode('utf-8', errors='replace').splitlines():
+            nombre = linea.split('{', 1)[0].split(' ', 1)[0]
+            if nombre in valores:
+                valores[nombre] += float(linea.rsplit(' ', 1)[1])
+        return time.perf_counter(), valores[self.metrica_cpu], valores[self.metrica_rss]
+
+    def run(self):
+        while True:
+            muestra = self._leer()
+            if muestra is not None:
+                self.muestras.append(muestra)
+            if self.parar.wait(self.intervalo):
+                break
+        muestra = self._leer()
+        if muestra is not None:
+            self.muestras.append(muestra)
+
+    def resumen(self):
+        if len(self.muestras) < 2:
+            return {'muestras': len(self.muestras)}
+        (t0, cpu0, _), (t1, cpu1, _) = self.muestras[0], self.muestras[-1]
+        rss = [m[2] / (1024 * 1024) for m in self.muestras]
+        # La CPU es la de los workers vivos: si uno se recicla, baja
+        return {
+            'muestras': len(self.muestras),
+            'cpu_segundos': round(max(cpu1 - cpu0, 0.0), 2),
+            'cpu_nucleos_medios': round(max(cpu1 - cpu0, 0.0) / (t1 - t0), 2),
+            'rss_mb_medio': round(statistics.mean(rss), 1),
+            'rss_mb_max': round(max(rss), 1),
+        }
+
+
+def ejecutar_escenario(escenario, corpus, args):
+    enviar = crear_envio(escenario, args)
+    
+    # Calentamiento: abre las conexiones y llena las cachés de los servicios
+    calentamiento = _Plan(args.calentamiento, None, None)
+    hilos = [threading.Thread(target=_trabajador, args=(calentamiento, enviar, corpus, []))
+             for _ in range(min(args.concurrencia, args.calentamiento))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    
+    muestreos = [
+        MuestreoServicio(nombre, getattr(args, opcion), prefijo)
+        for nombre, opcion, prefijo in SERVICIOS
+    ]
+    for muestreo in muestreos:
+        muestreo.start()
+    
+    resultados = []
+    plan = _Plan(args.peticiones, args.duracion, args.tasa)
+    hilos = [threading.Thread(target=_trabajador, args=(plan, enviar, corpus, resultados))
+             for _ in range(args.concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - plan.inicio
+    
+    for muestreo in muestreos:
+        muestreo.parar.set()
+    for muestreo in muestreos:
+        muestreo.join()
+    
+    # Un mensaje sin pedido debe recibir 400: eso no es un error
+    correctas = 0
+    errores = {}
+    latencias = []
+    for latencia, estado, es_pedido in resultados:
+        latencias.append(latencia * 1000)
+        if isinstance(estado, int) and (200 <= estado < 300 or (not es_pedido and estado == 400)):
+            correctas += 1
+        else:
+            errores[str(estado)] = errores.get(str(estado), 0) + 1
+    
+    total = len(resultados)
+    return {
+        'concurrencia': args.concurrencia,
+        'tasa_objetivo': args.tasa,
+        'peticiones': total,
+        'correctas': correctas,
+        'errores': total - correctas,
+        'tasa_errores': round((total - correctas) / total, 4) if total else None,
+        'errores_por_tipo': errores,
+        'duracion_s': round(duracion, 2),
+        'peticiones_por_segundo': round(correctas / duracion, 1) if duracion else None,
+        'p50_ms': round(percentil(latencias, 50), 2) if latencias else None,
+        'p95_ms': round(percentil(latencias, 95), 2) if latencias else None,
+        'p99_ms': round(percentil(latencias, 99), 2) if latencias else None,
+        'max_ms': round(max(latencias), 2) if latencias else None,
+        'media_ms': round(statistics.mean(latencias), 2) if latencias else None,
+        'servicios': {m.nombre: m.resumen() for m in muestreos},
+    }
+
+
+def arrancar_stub(args):
+    """Arranca stub_n8n.py en otro proceso y espera a que responda"""
+    proceso = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_n8n.py'),
+        '--puerto', str(args.puerto_stub), '--ia-url', args.ia_url, '--pdf-url', args.pdf_url,
+    ], stdout=subprocess.DEVNULL)
+    cliente = ClienteHTTP(f'http://127.0.0.1:{args.puerto_stub}', timeout=1)
+    for _ in range(50):
+        try:
+            if cliente.get('/healthz')[0] == 200:
+                return proceso
+        except OSError:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise RuntimeError(f'El sustituto de n8n no arrancó en el puerto {args.puerto_stub}')
+
+
+def comparar(resultados, baseline, tolerancia, tolerancia_errores):
+    """Devuelve las líneas de diferencia que superan la tolerancia"""
+    regresiones = []
+    for nombre, actual in resultados['escenarios'].items():
+        base = baseline.get('escenarios', {}).get(nombre)
+        if base is None:
+            continue
+        for clave, mayor_es_peor in METRICAS:
+            antes, ahora = base.get(clave), actual.get(clave)
+            if not antes or ahora is None:
+                continue
+            cambio = (ahora - antes) / antes
+            if not mayor_es_peor:
+                cambio = -cambio
+            if cambio > tolerancia:
+                regresiones.append(
+                    f"  {nombre:<10} {clave:<24} {antes:>10} -> {ahora:<10} "
+                    f"({cambio:+.1%} peor, tolerancia {tolerancia:.0%})"
+                )
+        # Los errores se comparan en puntos: pasar de 0 a 2% ya es peor
+        antes, ahora = base.get('tasa_errores') or 0, actual.get('tasa_errores') or 0
+        if ahora - antes > tolerancia_errores:
+            regresiones.append(
+                f"  {nombre:<10} {'tasa_errores':<24} {antes:>10.2%} -> {ahora:<10.2%} "
+                f"(tolerancia {tolerancia_errores:.0%})"
+            )
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--escenarios', nargs='+', choices=ESCENARIOS, default=['ia', 'pdf', 'flujo'])
+    parser.add_argument('--concurrencia', type=int, default=8, help='Hilos que envían peticiones')
+    parser.add_argument('--tasa', type=float, default=0,
+                        help='Peticiones por segundo en total (0 = tan rápido como respondan)')
+    parser.add_argument('--duracion', type=float, default=20, help='Segundos por escenario')
+    parser.add_argument('--peticiones', type=int, default=0,
+                        help='Peticiones por escenario (0 = sin límite, solo --duracion)')
+    parser.add_argument('--calentamiento', type=int, default=20, help='Peticiones previas sin medir')
+    parser.add_argument('--corpus', type=int, default=2000, help='Mensajes distintos del corpus')
+    parser.add_argument('--sin-pedido', type=float, default=0.0,
+                        help='Proporción de mensajes que no son un pedido (deben dar 400)')
+    parser.add_argument('--semilla', type=int, default=2025)
+    parser.add_argument('--ia-url', default='http://localhost:5001')
+    parser.add_argument('--pdf-url', default='http://localhost:5000')
+    parser.add_argument('--webhook-url',
+                        help='Webhook de n8n real (por defecto se arranca stub_n8n.py)')
+    parser.add_argument('--puerto-stub', type=int, default=5679)
+    parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+    parser.add_argument('--baseline', help='JSON de una ejecución anterior con el que comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.15,
+                        help='Empeoramiento relativo admitido en ritmo y latencias (0.15 = 15%%)')
+    parser.add_argument('--tolerancia-errores', type=float, default=0.01,
+                        help='Aumento admitido de la tasa de errores (0.01 = 1 punto)')
+    args = parser.parse_args()
+
+    corpus = generar_corpus(args.corpus, args.sin_pedido, args.semilla)
+    resultados = {
+        'fecha': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'configuracion': {
+            clave: valor for clave, valor in vars(args).items()
+            if clave not in ('salida', 'baseline')
+        },
+        'escenarios': {},
+    }
+
+    stub = None
+    if 'flujo' in args.escenarios and not args.webhook_url:
+        stub = arrancar_stub(args)
+        args.webhook_url = f'http://127.0.0.1:{args.puerto_stub}{RUTA_WEBHOOK}'
+
+    ritmo = f'{args.tasa:g} pet/s' if args.tasa else 'sin límite'
+    print(f"Concurrencia {args.concurrencia}, ritmo {ritmo}, {args.duracion:g} s por escenario\n")
+    print(f"{'escenario':<10} {'pet/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errores':>8}   CPU (núcleos) / RSS máx (MB)")
+    try:
+        for escenario in args.escenarios:
+            r = ejecutar_escenario(escenario, corpus, args)
+            resultados['escenarios'][escenario] = r
+            servicios = '  '.join(
+                f"{nombre} {s['cpu_nucleos_medios']:.2f}/{s['rss_mb_max']:.0f}"
+                for nombre, s in r['servicios'].items() if 'cpu_segundos' in s
+            )
+            print(f"{escenario:<10} {r['peticiones_por_segundo'] or 0:>8.1f} {r['p50_ms'] or 0:>8.1f} "
+                  f"{r['p95_ms'] or 0:>8.1f} {r['p99_ms'] or 0:>8.1f} {r['tasa_errores'] or 0:>8.2%}   "
+                  f"{servicios or '(sin /metrics)'}")
+            if r['errores_por_tipo']:
+                print(f"{'':<10} errores: {r['errores_por_tipo']}")
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    distintas = [
+        clave for clave in ('concurrencia', 'tasa', 'duracion', 'corpus', 'sin_pedido')
+        if baseline.get('configuracion', {}).get(clave) != resultados['configuracion'][clave]
+    ]
+    if distintas:
+        print(f"\n⚠️  La línea base usó otra configuración ({', '.join(distintas)}): "
+              f"la comparación puede no ser válida")
+
+    regresiones = comparar(resultados, baseline, args.tolerancia, args.tolerancia_errores)
+    if regresiones:
+        print(f"\n❌ Regresiones respecto a {args.baseline}:")
+        print('\n'.join(regresiones))
+        return 1
+
+    print(f"\n✅ Sin regresiones respecto a {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Sustituto local del webhook de n8n para las pruebas de carga
+
+Hace lo mismo que el flujo de n8n con cada mensaje: POST /procesar-pedido
+al Mock IA y, con la factura que devuelve, POST /generar-factura al
+servicio de PDFs. Responde con la respuesta del servicio de PDFs (o con
+el error del Mock IA) y la cabecera Server-Timing de cada tramo. El id
+del mensaje, si viene, se envía como Idempotency-Key: reenviar el mismo
+mensaje no genera otra factura.
+
+    POST /webhook/pedido   {"texto": "...", "numero": "2025-001", "mensaje_id": "..."}
+
+Uso:
+    python carga/stub_n8n.py --puerto 5679
+    python carga/stub_n8n.py --ia-url http://localhost:5001 --pdf-url http://localhost:5000
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cliente import ClienteHTTP  # noqa: E402
+
+RUTA_WEBHOOK = '/webhook/pedido'
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    servicio_ia = None
+    servicio_pdf = None
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, estado, cuerpo, cabeceras=None):
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            self._responder(200, b'{"status": "ok"}')
+        else:
+            self._responder(404, b'{"error": "No encontrado"}')
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path != RUTA_WEBHOOK:
+            self._responder(404, b'{"error": "No encontrado"}')
+            return
+        try:
+            pedido = json.loads(cuerpo)
+            inicio = time.perf_counter()
+            estado, _, datos = self.servicio_ia.peticion(
+                'POST', '/procesar-pedido', cuerpo, {'Content-Type': 'application/json'}
+            )
+            tiempo_ia = time.perf_counter() - inicio
+            if estado != 200:
+                self._responder(estado, datos, {
+                    'Server-Timing': f'ia;dur={tiempo_ia * 1000:.1f}'
+                })
+                return
+            
+            factura = json.loads(datos)['factura']
+            if pedido.get('numero'):
+                factura['numero'] = pedido['numero']
+            inicio = time.perf_counter()
+            cabeceras = {}
+            if pedido.get('mensaje_id'):
+                cabeceras['Idempotency-Key'] = str(pedido['mensaje_id'])
+            estado, _, datos = self.servicio_pdf.post_json('/generar-factura', factura, cabeceras)
+            tiempo_pdf = time.perf_counter() - inicio
+            self._responder(estado, datos, {
+                'Server-Timing': f'ia;dur={tiempo_ia * 1000:.1f}, pdf;dur={tiempo_pdf * 1000:.1f}'
+            })
+        except Exception as e:
+            detalle = json.dumps({'error': 'Error en el flujo', 'details': str(e)}).encode('utf-8')
+            self._responder(502, detalle)
+
+
+def crear_servidor(puerto, ia_url, pdf_url, host='127.0.0.1'):
+    """Servidor del webhook (un hilo por conexión); se arranca con serve_forever()"""
+    manejador = type('Manejador', (_Manejador,), {
+        'servicio_ia': ClienteHTTP(ia_url),
+        'servicio_pdf': ClienteHTTP(pdf_url),
+    })
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--puerto', type=int, default=5679)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--ia-url', default='http://localhost:5001')
+    parser.add_argument('--pdf-url', default='http://localhost:5000')
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.puerto, args.ia_url, args.pdf_url, args.host)
+    print(f"🔁 Sustituto de n8n en http://{args.host}:{args.puerto}{RUTA_WEBHOOK}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
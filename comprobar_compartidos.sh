@@ -0,0 +1,34 @@
+#!/bin/bash
+
+# Comprueba que los módulos compartidos por ai-mock y pdf-service son
+# idénticos en los dos servicios. Cada imagen de Docker se construye solo
+# con su carpeta, así que cada servicio lleva su copia: al cambiar uno de
+# estos archivos hay que copiarlo al otro servicio.
+# Uso: ./comprobar_compartidos.sh  (desde la raíz del proyecto)
+
+COMPARTIDOS=(
+    "arranque.py"
+    "metricas.py"
+    "perfilado.py"
+)
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m'
+
+cd "$(dirname "$0")"
+
+DISTINTOS=0
+for archivo in "${COMPARTIDOS[@]}"; do
+    if cmp -s "ai-mock/$archivo" "pdf-service/$archivo"; then
+        echo -e "  ${GREEN}✓${NC} $archivo"
+    else
+        echo -e "  ${RED}✗${NC} $archivo ${RED}(distinto en ai-mock y pdf-service)${NC}"
+        DISTINTOS=$((DISTINTOS + 1))
+    fi
+done
+
+if [ $DISTINTOS -gt 0 ]; then
+    echo -e "${RED}❌ $DISTINTOS módulos compartidos no coinciden${NC}"
+    exit 1
+fi
@@ -0,0 +1,39 @@
+"""
+Ajustes de las facturas que comparten app.py y renderizado.py
+
+Datos de la empresa, IVA, logo y perfil de salida del PDF. No importa
+nada pesado, así que /health e /info los usan sin cargar ReportLab.
+"""
+import os
+
+# IVA fijo al 10%
+IVA = 0.10
+
+# Logo de la cabecera (si no existe, la factura sale sin logo)
+LOGO_PATH = os.environ.get('LOGO_PATH', '/app/logo.png')
+
+# Perfiles de salida del PDF (PDF_PERFIL), de más pequeño a más rápido:
+#   estandar  lo que hace ReportLab por defecto: páginas comprimidas y
+#             codificadas en ASCII85, logo a su resolución original
+#   compacto  páginas comprimidas sin ASCII85 (un 20% menos) y logo
+#             reducido a logo_dpi para los 20 mm en que se imprime
+#   rapido    páginas sin comprimir (menos CPU, más bytes), logo reducido
+# El logo se reduce y comprime una sola vez (ver obtener_logo)
+PERFILES_PDF = {
+    'estandar': {'compresion': 1, 'ascii85': True, 'logo_dpi': None},
+    'compacto': {'compresion': 1, 'ascii85': False, 'logo_dpi': 150},
+    'rapido': {'compresion': 0, 'ascii85': False, 'logo_dpi': 150},
+}
+PDF_PERFIL = os.environ.get('PDF_PERFIL', 'estandar')
+if PDF_PERFIL not in PERFILES_PDF:
+    raise ValueError(f"PDF_PERFIL debe ser uno de: {', '.join(PERFILES_PDF)}")
+PERFIL = PERFILES_PDF[PDF_PERFIL]
+
+# Datos de la empresa (tu floristería)
+DATOS_EMPRESA = {
+    "nombre": "FLORES Y PLANTAS LOLI",
+    "direccion": "C/ Escritor Jiménez Lora 15",
+    "cp": "CP: 14014",
+    "email": "lolifloresyplantas@gmail.com",
+    "telefono": "+34 957 25 14 20",
+}
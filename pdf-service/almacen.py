@@ -0,0 +1,207 @@
+"""
+Almacenamiento de facturas repartido por año y mes
+
+    invoices/2025/03/factura_2025-001.pdf   meses abiertos (archivos sueltos)
+    invoices/2025/02.zip                    meses cerrados y compactados
+
+Los meses cerrados se pueden compactar en un único zip por mes; las
+facturas se siguen leyendo directamente desde el archivo comprimido.
+Los PDFs antiguos que estén sueltos en la raíz también se encuentran
+(hasta que se migren con migrar()).
+"""
+from datetime import date, datetime
+import glob
+import os
+import re
+import zipfile
+
+_RE_ANIO = re.compile(r'^\d{4}$')
+_RE_MES = re.compile(r'^\d{2}$')
+_RE_ZIP_MES = re.compile(r'^(\d{2})\.zip$')
+
+
+class Ubicacion:
+    """Dónde está guardada una factura: archivo suelto o miembro de un zip"""
+
+    def __init__(self, filename, ruta, miembro=None):
+        self.filename = filename
+        self.ruta = ruta
+        self.miembro = miembro
+
+    @property
+    def comprimida(self):
+        return self.miembro is not None
+
+    def metadatos(self):
+        """
+        Devuelve (tamaño, mtime, etag) sin leer el contenido
+        El ETag sale de mtime/tamaño en archivos sueltos y del CRC32 del
+        contenido en los miembros de un zip
+        """
+        if not self.comprimida:
+            st = os.stat(self.ruta)
+            return st.st_size, st.st_mtime, f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        with zipfile.ZipFile(self.ruta) as zf:
+            info = zf.getinfo(self.miembro)
+        mtime = datetime(*info.date_time).timestamp()
+        return info.file_size, mtime, f"{info.CRC:08x}-{info.file_size:x}"
+
+    def stat(self):
+        """Devuelve (tamaño, mtime) de la factura"""
+        size, mtime, _ = self.metadatos()
+        return size, mtime
+
+    def leer(self):
+        """Devuelve el contenido del PDF"""
+        if not self.comprimida:
+            with open(self.ruta, 'rb') as f:
+                return f.read()
+        with zipfile.ZipFile(self.ruta) as zf:
+            return zf.read(self.miembro)
+
+
+class Almacen:
+    """Facturas guardadas en raiz/YYYY/MM, con los meses cerrados en zip"""
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+        os.makedirs(raiz, exist_ok=True)
+
+    # ===== ESCRITURA =====
+
+    def carpeta(self, fecha_iso=None):
+        """
+        Carpeta (creada si hace falta) donde se guarda una factura de esa
+        fecha (YYYY-MM-DD); sin fecha se usa el mes actual
+        """
+        anio, mes = (fecha_iso or date.today().isoformat()).split('-')[:2]
+        carpeta = os.path.join(self.raiz, anio, mes)
+        os.makedirs(carpeta, exist_ok=True)
+        return carpeta
+
+    # ===== LECTURA =====
+
+    def localizar(self, filename, fecha_iso=None):
+        """
+        Busca una factura por nombre y devuelve su Ubicacion o None
+        Con la fecha se va directo a su mes; si no, se recorren todos
+        """
+        if os.path.basename(filename) != filename or not filename.endswith('.pdf'):
+            return None
+
+        if fecha_iso:
+            anio, mes = fecha_iso.split('-')[:2]
+            meses = [(anio, mes)]
+        else:
+            meses = []
+
+        # Archivos sueltos: primero el mes conocido, luego cualquier mes y
+        # por último la raíz (facturas anteriores al reparto por meses)
+        candidatos = [os.path.join(self.raiz, a, m, filename) for a, m in meses]
+        candidatos += sorted(glob.glob(os.path.join(glob.escape(self.raiz), '*', '*', glob.escape(filename))))
+        candidatos.append(os.path.join(self.raiz, filename))
+        for ruta in candidatos:
+            if os.path.isfile(ruta):
+                return Ubicacion(filename, ruta)
+
+        # Meses compactados
+        zips = [os.path.join(self.raiz, a, f"{m}.zip") for a, m in meses]
+        zips += sorted(glob.glob(os.path.join(glob.escape(self.raiz), '*', '*.zip')))
+        for ruta_zip in zips:
+            if not os.path.isfile(ruta_zip):
+                continue
+            with zipfile.ZipFile(ruta_zip) as zf:
+                if filename in zf.NameToInfo:
+                    return Ubicacion(filename, ruta_zip, miembro=filename)
+        return None
+
+    def recorrer(self):
+        """Recorre todas las facturas guardadas y devuelve sus Ubicacion"""
+        for nombre in sorted(os.listdir(self.raiz)):
+            ruta = os.path.join(self.raiz, nombre)
+            if nombre.endswith('.pdf') and os.path.isfile(ruta):
+                yield Ubicacion(nombre, ruta)
+            elif _RE_ANIO.match(nombre) and os.path.isdir(ruta):
+                yield from self._recorrer_anio(ruta)
+
+    def _recorrer_anio(self, ruta_anio):
+        for nombre in sorted(os.listdir(ruta_anio)):
+            ruta = os.path.join(ruta_anio, nombre)
+            if _RE_MES.match(nombre) and os.path.isdir(ruta):
+                for filename in sorted(os.listdir(ruta)):
+                    if filename.endswith('.pdf'):
+                        yield Ubicacion(filename, os.path.join(ruta, filename))
+            elif _RE_ZIP_MES.match(nombre):
+                with zipfile.ZipFile(ruta) as zf:
+                    miembros = zf.namelist()
+                for filename in miembros:
+                    yield Ubicacion(filename, ruta, miembro=filename)
+
+    # ===== MANTENIMIENTO =====
+
+    def compactar(self, meses_abiertos=1):
+        """
+        Compacta en YYYY/MM.zip cada mes cerrado (anterior a los
+        meses_abiertos más recientes) que tenga archivos sueltos
+        Devuelve la lista de meses compactados como 'YYYY/MM'
+        """
+        hoy = date.today()
+        indice_limite = hoy.year * 12 + hoy.month - meses_abiertos
+
+        compactados = []
+        for anio in sorted(os.listdir(self.raiz)):
+            ruta_anio = os.path.join(self.raiz, anio)
+            if not (_RE_ANIO.match(anio) and os.path.isdir(ruta_anio)):
+                continue
+            for mes in sorted(os.listdir(ruta_anio)):
+                ruta_mes = os.path.join(ruta_anio, mes)
+                if not (_RE_MES.match(mes) and os.path.isdir(ruta_mes)):
+                    continue
+                if int(anio) * 12 + int(mes) - 1 >= indice_limite:
+                    continue
+                if self._compactar_mes(ruta_mes, os.path.join(ruta_anio, f"{mes}.zip")):
+                    compactados.append(f"{anio}/{mes}")
+        return compactados
+
+    def _compactar_mes(self, ruta_mes, ruta_zip):
+        sueltos = sorted(f for f in os.listdir(ruta_mes) if f.endswith('.pdf'))
+        if not sueltos:
+            return False
+
+        # Se reescribe el zip completo: los archivos sueltos sustituyen a
+        # los miembros con el mismo nombre (facturas regeneradas)
+        tmp = f"{ruta_zip}.tmp"
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as nuevo:
+            if os.path.isfile(ruta_zip):
+                with zipfile.ZipFile(ruta_zip) as viejo:
+                    for info in viejo.infolist():
+                        if info.filename not in sueltos:
+                            nuevo.writestr(info, viejo.read(info))
+            for filename in sueltos:
+                nuevo.write(os.path.join(ruta_mes, filename), arcname=filename)
+        os.replace(tmp, ruta_zip)
+
+        for filename in sueltos:
+            os.remove(os.path.join(ruta_mes, filename))
+        try:
+            os.rmdir(ruta_mes)
+        except OSError:
+            pass
+        return True
+
+    def migrar(self, fecha_de):
+        """
+        Mueve los PDFs sueltos en la raíz a su carpeta YYYY/MM
+        fecha_de(ruta) devuelve la fecha ISO de la factura o None
+        (en ese caso se usa la fecha de modificación del archivo)
+        Devuelve el número de facturas movidas
+        """
+        movidas = 0
+        for nombre in sorted(os.listdir(self.raiz)):
+            ruta = os.path.join(self.raiz, nombre)
+            if not (nombre.endswith('.pdf') and os.path.isfile(ruta)):
+                continue
+            fecha_iso = fecha_de(ruta) or date.fromtimestamp(os.path.getmtime(ruta)).isoformat()
+            os.replace(ruta, os.path.join(self.carpeta(fecha_iso), nombre))
+            movidas += 1
+        return movidas
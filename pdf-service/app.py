@@ -1,224 +1,529 @@
-from flask import Flask, request, jsonify, send_file
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.pdfgen import canvas
-from datetime import datetime
+import time
+
+# Desde aquí se mide la carga de la aplicación (ver arranque)
+_inicio_carga = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, send_file
+import click
+from prometheus_client import Counter
+from werkzeug.http import is_resource_modified
+from werkzeug.serving import is_running_from_reloader
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+import hashlib
+import io
+import json
+import math
 import os
+import sys
+import tempfile
+
+from ajustes import DATOS_EMPRESA, IVA, PDF_PERFIL
+from almacen import Almacen
+from arranque import ARRANQUE_RAPIDO, Arranque
+from catalogo import (
+    Catalogo, ClaveReutilizada, FacturaDuplicada, fecha_a_iso, leer_metadatos_pdf,
+    nombre_factura
+)
+from cola import ColaFacturas, ColaLlena
+from extraccion import ErrorExtraccion, ExtractorHTTP, ExtractorLocal
+from libro import FormatoNoDisponible, exportar_csv, exportar_parquet
+from metricas import instrumentar
+from perfilado import activar_perfilado
 
 app = Flask(__name__)
 
-# IVA fijo al 10%
-IVA = 0.10
+# Con un proxy delante (Apache/lighttpd) que entienda X-Sendfile, el
+# servidor envía el PDF directamente desde disco
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+
+# Métricas Prometheus por ruta y GET /metrics (las del render, en
+# renderizado)
+instrumentar(app, 'pdf_service')
+BYTES_ESCRITOS = Counter(
+    'pdf_service_pdf_bytes_written_total', 'Bytes de PDF escritos en disco'
+)
+
+# Tiempos de arranque y GET /ready
+arranque = Arranque('pdf-service', _inicio_carga)
+arranque.registrar(app)
+
+# Módulos pesados que no se importan al arrancar, sino al precalentar o
+# en la primera petición que los usa: el render (ReportLab y Pillow) y la
+# unión de PDFs (pypdf)
+MODULOS_DIFERIDOS = ['renderizado', 'combinado']
 
 # Configuración de directorios
-INVOICES_DIR = '/app/invoices'
-LOGO_PATH = '/app/logo.png'
-
-# Datos de la empresa (tu floristería)
-DATOS_EMPRESA = {
-    "nombre": "FLORES Y PLANTAS LOLI",
-    "direccion": "C/ Escritor Jiménez Lora 15",
-    "cp": "CP: 14014",
-    "email": "lolifloresyplantas@gmail.com",
-    "telefono": "+34 957 25 14 20",
-}
+INVOICES_DIR = os.environ.get('INVOICES_DIR', '/app/invoices')
+
+# Procesos para la generación por lotes (por defecto, uno por núcleo)
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 1))
+MAX_FACTURAS_LOTE = 500
+
+# Índice de facturas para /facturas
+CATALOGO_DB = os.environ.get('CATALOGO_DB', os.path.join(INVOICES_DIR, 'catalogo.db'))
+MAX_POR_PAGINA = 500
+MAX_METADATOS = 1000
+MAX_FACTURAS_COMBINADAS = int(os.environ.get('MAX_FACTURAS_COMBINADAS', 2000))
+
+# Horas que se recuerda una Idempotency-Key
+IDEMPOTENCIA_HORAS = int(os.environ.get('IDEMPOTENCIA_HORAS', 24))
+
+# Libro de IVA: tamaño de los trozos enviados al cliente y memoria que
+# usa el Parquet antes de pasar a un archivo temporal
+TAMANO_TROZO = 64 * 1024
+MAX_PARQUET_EN_MEMORIA = 8 * 1024 * 1024
+
+# Cola de trabajos asíncronos (?async=1)
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(INVOICES_DIR, '.trabajos'))
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+JOBS_MAX_PENDIENTES = int(os.environ.get('JOBS_MAX_PENDIENTES', 100))
+JOBS_RECUPERAR_SEGUNDOS = int(os.environ.get('JOBS_RECUPERAR_SEGUNDOS', 30))
+
+# Mock IA para /factura-desde-texto: en el mismo proceso si AI_MOCK_DIR
+# apunta a su código, si no por HTTP (ver extraccion)
+AI_MOCK_DIR = os.environ.get('AI_MOCK_DIR')
+AI_MOCK_URL = os.environ.get('AI_MOCK_URL', 'http://localhost:5001')
+AI_MOCK_TIMEOUT = int(os.environ.get('AI_MOCK_TIMEOUT', 10))
+
+# Perfilado bajo demanda (ver perfilado): con PERFILADO_TOKEN, la cabecera
+# X-Perfilar perfila una petición; con PERFILADO_MUESTREO=N, una de cada N
+PERFILADO_DIR = os.environ.get('PERFILADO_DIR', os.path.join(INVOICES_DIR, '.perfiles'))
+PERFILADO_TOKEN = os.environ.get('PERFILADO_TOKEN')
+PERFILADO_MUESTREO = int(os.environ.get('PERFILADO_MUESTREO', 0))
+PERFILADO_MAX = int(os.environ.get('PERFILADO_MAX', 200))
 
 # Crear directorio de facturas si no existe
 os.makedirs(INVOICES_DIR, exist_ok=True)
 
+# El pool se crea en la primera petición por lotes
+_pool_lotes = None
+
+# El extractor se crea en la primera petición de /factura-desde-texto
+_extractor = None
+
+almacen = Almacen(INVOICES_DIR)
+catalogo = Catalogo(CATALOGO_DB)
+
+activar_perfilado(
+    app, 'pdf-service', PERFILADO_DIR,
+    token=PERFILADO_TOKEN, muestreo=PERFILADO_MUESTREO, maximo=PERFILADO_MAX
+)
+
+
+def obtener_renderizado():
+    """Devuelve el módulo de render, importándolo si hace falta"""
+    return arranque.importar('renderizado')
 
-def generar_factura_pdf(factura_num, fecha, cliente, items_raw, carpeta_destino):
+
+def generar_factura_pdf(factura_num, fecha, cliente, items_raw, carpeta_destino, huella=None):
     """
-    Genera el PDF con el diseño exacto de tu aplicación Tkinter
-    Mantiene el mismo estilo limpio y profesional
+    Genera el PDF de la factura en carpeta_destino y devuelve su ruta
     """
+    ruta_archivo = os.path.join(carpeta_destino, nombre_factura(factura_num))
+    tmp = _temporal(ruta_archivo)
+    try:
+        obtener_renderizado().renderizar_factura(tmp, factura_num, fecha, cliente, items_raw, huella)
+        os.replace(tmp, ruta_archivo)
+    except BaseException:
+        _borrar(tmp)
+        raise
+    BYTES_ESCRITOS.inc(os.path.getsize(ruta_archivo))
+    return ruta_archivo
+
+
+def generar_factura_bytes(factura_num, fecha, cliente, items_raw, huella=None):
+    """
+    Genera el PDF de la factura en memoria y devuelve sus bytes
+    """
+    buffer = io.BytesIO()
+    obtener_renderizado().renderizar_factura(buffer, factura_num, fecha, cliente, items_raw, huella)
+    return buffer.getvalue()
+
+
+def guardar_factura_bytes(contenido, factura_num, carpeta_destino):
+    """
+    Escribe en disco un PDF ya renderizado (archivo temporal + rename,
+    para que nunca se lea una factura a medio escribir)
+    """
+    ruta_archivo = os.path.join(carpeta_destino, nombre_factura(factura_num))
+    tmp = _temporal(ruta_archivo)
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(contenido)
+        os.replace(tmp, ruta_archivo)
+    except BaseException:
+        _borrar(tmp)
+        raise
+    BYTES_ESCRITOS.inc(len(contenido))
+    return ruta_archivo
+
+
+def _temporal(ruta_archivo):
+    """
+    Archivo temporal único junto a ruta_archivo: la misma factura puede
+    escribirse a la vez desde un reintento y desde la respuesta original
+    """
+    fd, tmp = tempfile.mkstemp(
+        prefix=os.path.basename(ruta_archivo) + '.', suffix='.tmp',
+        dir=os.path.dirname(ruta_archivo)
+    )
+    os.close(fd)
+    return tmp
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+def validar_factura(data):
+    """
+    Valida el JSON de una factura
+    Devuelve el mensaje de error o None si es correcta
+    """
+    if not isinstance(data, dict):
+        return 'La factura debe ser un objeto JSON'
     
-    nombre_archivo = f"factura_{factura_num}.pdf"
-    ruta_archivo = os.path.join(carpeta_destino, nombre_archivo)
-    
-    # Crear el canvas para dibujar
-    c = canvas.Canvas(ruta_archivo, pagesize=A4)
-    width, height = A4
-    
-    # ===== LOGO Y DATOS EMPRESA (ESQUINA SUPERIOR IZQUIERDA) =====
-    y_pos = height - 30*mm
-    
-    # Logo (si existe)
-    if os.path.exists(LOGO_PATH):
-        try:
-            c.drawImage(LOGO_PATH, 25*mm, y_pos, width=20*mm, height=20*mm, 
-                       preserveAspectRatio=True, mask='auto')
-        except:
-            try:
-                c.drawImage(LOGO_PATH, 25*mm, y_pos, width=20*mm, height=20*mm, 
-                           preserveAspectRatio=True)
-            except:
-                pass
-    
-    # Datos empresa
-    c.setFont("Helvetica", 9)
-    c.setFillColor(colors.black)
-    text_x = 25*mm
-    text_y = y_pos - 5*mm
-    c.drawString(text_x, text_y, DATOS_EMPRESA['direccion'])
-    text_y -= 4*mm
-    c.drawString(text_x, text_y, DATOS_EMPRESA['cp'])
-    text_y -= 4*mm
-    c.drawString(text_x, text_y, DATOS_EMPRESA['email'])
-    text_y -= 4*mm
-    c.drawString(text_x, text_y, DATOS_EMPRESA['telefono'])
-    
-    # ===== DATOS FACTURA (ESQUINA SUPERIOR DERECHA) =====
-    c.setFont("Helvetica-Bold", 11)
-    factura_x = width - 70*mm
-    factura_y = height - 30*mm
-    c.drawRightString(factura_x + 50*mm, factura_y, f"FACTURA: {factura_num}")
-    c.setFont("Helvetica", 10)
-    factura_y -= 6*mm
-    c.drawRightString(factura_x + 50*mm, factura_y, f"Fecha: {fecha}")
-    
-    # ===== SECCIÓN DATOS CLIENTE =====
-    y_pos = height - 75*mm
-    
-    # Línea superior
-    c.setStrokeColor(colors.black)
-    c.setLineWidth(0.5)
-    c.line(25*mm, y_pos, width - 25*mm, y_pos)
-    
-    y_pos -= 8*mm
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(25*mm, y_pos, "Datos cliente")
-    
-    y_pos -= 6*mm
-    c.setFont("Helvetica", 9)
-    c.drawString(25*mm, y_pos, f"Nombre: {cliente}")
-    
-    y_pos -= 8*mm
-    # Línea inferior
-    c.line(25*mm, y_pos, width - 25*mm, y_pos)
-    
-    # ===== TABLA DE PRODUCTOS =====
-    y_pos -= 15*mm
-    
-    # Dimensiones de la tabla
-    tabla_x = 25*mm
-    tabla_width = width - 50*mm
-    col_widths = [
-        tabla_width * 0.40,  # Producto
-        tabla_width * 0.15,  # Cantidad
-        tabla_width * 0.15,  # Base
-        tabla_width * 0.15,  # IVA
-        tabla_width * 0.15   # Total
-    ]
-    
-    # Cabecera de la tabla
-    c.setFont("Helvetica-Bold", 9)
-    c.setFillColor(colors.black)
-    
-    x_offset = tabla_x
-    c.drawString(x_offset + 2*mm, y_pos, "Producto")
-    x_offset += col_widths[0]
-    c.drawCentredString(x_offset + col_widths[1]/2, y_pos, "Cantidad")
-    x_offset += col_widths[1]
-    c.drawRightString(x_offset + col_widths[2] - 2*mm, y_pos, "Base")
-    x_offset += col_widths[2]
-    c.drawRightString(x_offset + col_widths[3] - 2*mm, y_pos, "IVA")
-    x_offset += col_widths[3]
-    c.drawRightString(x_offset + col_widths[4] - 2*mm, y_pos, "Total")
-    
-    # Línea debajo de cabecera
-    y_pos -= 4*mm
-    c.setStrokeColor(colors.black)
-    c.setLineWidth(0.5)
-    c.line(tabla_x, y_pos, tabla_x + tabla_width, y_pos)
-    
-    # Dibujar filas de productos
-    y_pos -= 8*mm
-    c.setFont("Helvetica", 9)
-    
-    # Calcular totales
-    subtotal_acumulado = 0
-    iva_acumulado = 0
-    total_acumulado = 0
-    
-    for item in items_raw:
-        concepto = item['producto']
-        cantidad = item['cantidad']
-        precio_base = item['base'] / cantidad  # Precio unitario sin IVA
-        
-        x_offset = tabla_x
-        c.drawString(x_offset + 2*mm, y_pos, concepto[:50])
-        
-        x_offset += col_widths[0]
-        c.drawCentredString(x_offset + col_widths[1]/2, y_pos, str(cantidad))
-        
-        x_offset += col_widths[1]
-        c.drawRightString(x_offset + col_widths[2] - 2*mm, y_pos, f"{precio_base:.2f} €")
-        
-        x_offset += col_widths[2]
-        iva_item = precio_base * IVA
-        c.drawRightString(x_offset + col_widths[3] - 2*mm, y_pos, f"{iva_item:.2f} €")
-        
-        x_offset += col_widths[3]
-        total_item = item['total']
-        c.drawRightString(x_offset + col_widths[4] - 2*mm, y_pos, f"{total_item:.2f} €")
-        
-        # Acumular totales
-        subtotal_acumulado += item['base']
-        iva_acumulado += item['iva']
-        total_acumulado += item['total']
-        
-        # Línea separadora fina
-        y_pos -= 4*mm
-        c.setStrokeColor(colors.lightgrey)
-        c.setLineWidth(0.3)
-        c.line(tabla_x, y_pos, tabla_x + tabla_width, y_pos)
-        y_pos -= 4*mm
-    
-    # Línea final de tabla
-    c.setStrokeColor(colors.black)
-    c.setLineWidth(0.5)
-    c.line(tabla_x, y_pos + 4*mm, tabla_x + tabla_width, y_pos + 4*mm)
-    
-    # ===== TOTALES (PARTE INFERIOR DERECHA) =====
-    y_pos -= 10*mm
-    totales_x = width - 65*mm
-    totales_label_x = totales_x - 35*mm
-    
-    c.setFont("Helvetica", 9)
+    # Validar campos requeridos (sin número se asigna el siguiente)
+    required_fields = ['fecha', 'cliente', 'items']
+    for field in required_fields:
+        if field not in data:
+            return f'Campo requerido faltante: {field}'
     
-    # Base Imponible
-    c.drawString(totales_label_x, y_pos, "Base Imponible")
-    c.drawRightString(totales_x + 40*mm, y_pos, f"{subtotal_acumulado:.2f} €")
+    # Validar items
+    if not data['items'] or len(data['items']) == 0:
+        return 'Debe haber al menos un item en la factura'
     
-    # IVA
-    y_pos -= 6*mm
-    c.drawString(totales_label_x, y_pos, "IVA")
-    c.drawCentredString(totales_x + 10*mm, y_pos, "10%")
-    c.drawRightString(totales_x + 40*mm, y_pos, f"{iva_acumulado:.2f} €")
+    return None
+
+
+def serie_factura(data):
+    """Serie de numeración de una factura: el año de su fecha"""
+    return (fecha_a_iso(data['fecha']) or '')[:4] or None
+
+
+def sin_numero(data):
+    """True si la factura no trae número (se le asignará al guardarla)"""
+    return data.get('numero') in (None, '')
+
+
+def _normalizar_texto(valor):
+    return ' '.join(str(valor).split())
+
+
+def _normalizar_importe(valor):
+    return round(float(valor), 2)
+
+
+def huella_factura(data):
+    """
+    Hash SHA-256 de los datos normalizados de una factura validada
+    Espacios sobrantes, formato de la fecha y decimales no cambian la huella
+    Se calcula antes de numerar. Sin número solo sirve para comprobar la
+    Idempotency-Key: dos pedidos iguales sin número ni clave son dos
+    facturas
+    """
+    normalizada = {
+        'numero': None if sin_numero(data) else _normalizar_texto(data['numero']),
+        'fecha': fecha_a_iso(data['fecha']) or _normalizar_texto(data['fecha']),
+        'cliente': _normalizar_texto(data['cliente']['nombre']),
+        'items': [
+            {
+                'producto': _normalizar_texto(item['producto']),
+                'cantidad': _normalizar_importe(item['cantidad']),
+                'base': _normalizar_importe(item['base']),
+                'iva': _normalizar_importe(item['iva']),
+                'total': _normalizar_importe(item['total'])
+            }
+            for item in data['items']
+        ]
+    }
+    texto = json.dumps(normalizada, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def factura_previa(data, huella, clave=None, sobrescribir=False):
+    """
+    Sin registrar nada, devuelve la factura del catálogo ya registrada para
+    esta petición o None: la de la Idempotency-Key (a una factura sin
+    número se le pone el suyo) o, si trae número, la registrada con la
+    misma huella
+    En 'ubicacion' va la Ubicacion de su PDF, o None si aún no está en
+    disco (pendiente de escribir o perdido)
+    Lanza ClaveReutilizada, o FacturaDuplicada si el número ya existe con
+    otros datos (salvo con sobrescribir)
+    """
+    fila = catalogo.comprobar(data.get('numero'), huella, clave, sobrescribir)
+    return _con_ubicacion(data, fila) if fila else None
+
+
+def reservar_factura(data, huella, clave=None, sobrescribir=False):
+    """
+    Registra la factura en el catálogo como pendiente, con su clave, antes
+    de generar el PDF (ver Catalogo.reservar). Si no trae número recibe
+    aquí el siguiente de su serie, y ya no se devuelve aunque el PDF no
+    llegue a escribirse: la factura queda pendiente con ese número
+    Devuelve la factura ya registrada para esta petición (como
+    factura_previa) o None si es nueva
+    """
+    fila, nueva = catalogo.reservar(
+        dict(
+            totales_factura(data),
+            numero=data.get('numero'),
+            cliente=data['cliente']['nombre'],
+            fecha=data['fecha'],
+            huella=huella,
+            datos=data
+        ),
+        clave, sobrescribir, serie_factura(data), IDEMPOTENCIA_HORAS
+    )
+    if nueva:
+        data['numero'] = fila['numero']
+        return None
+    return _con_ubicacion(data, fila)
+
+
+def _con_ubicacion(data, fila):
+    data['numero'] = fila['numero']
+    return dict(fila, ubicacion=almacen.localizar(fila['filename'], fila['fecha_iso']))
+
+
+def totales_factura(data):
+    """Subtotal, IVA, total y número de líneas de una factura validada"""
+    items = data['items']
+    return {
+        'subtotal': round(sum(item['base'] for item in items), 2),
+        'iva': round(sum(item['iva'] for item in items), 2),
+        'total': round(sum(item['total'] for item in items), 2),
+        'num_items': len(items)
+    }
+
+
+def resumen_factura(data, archivo, size):
+    """Construye el resumen de una factura generada para la respuesta"""
+    return {
+        'numero': data['numero'],
+        'filename': os.path.basename(archivo),
+        'path': archivo,
+        'cliente': data['cliente']['nombre'],
+        'fecha': data['fecha'],
+        **totales_factura(data),
+        'size': size,
+        'size_kb': round(size / 1024, 1)
+    }
+
+
+def generar_reservada(data, huella):
+    """
+    Escribe en disco el PDF de una factura ya reservada en el catálogo, la
+    da por generada y devuelve su resumen
+    """
+    archivo = generar_factura_pdf(
+        data['numero'],
+        data['fecha'],
+        data['cliente']['nombre'],
+        data['items'],
+        almacen.carpeta(fecha_a_iso(data['fecha'])),
+        huella
+    )
+    size = os.path.getsize(archivo)
+    catalogo.completar(os.path.basename(archivo), size)
+    return dict(resumen_factura(data, archivo, size), huella=huella)
+
+
+def resumen_previa(data, previa, huella):
+    """
+    Resumen de una factura que ya estaba registrada con los mismos datos
+    Si su PDF no llegó a escribirse, se genera ahora con el mismo número
+    """
+    ubicacion = previa['ubicacion']
+    if ubicacion is None:
+        return dict(generar_reservada(data, huella), reutilizada=True)
+    archivo = ubicacion.ruta
+    if ubicacion.comprimida:
+        archivo = os.path.join(archivo, ubicacion.miembro)
+    size, _ = ubicacion.stat()
+    return dict(resumen_factura(data, archivo, size), huella=huella, reutilizada=True)
+
+
+def emitir_factura(data, sobrescribir=False, huella=None, clave=None):
+    """
+    Genera el PDF de una factura validada y la registra en el catálogo
+    Si es un reenvío (ver factura_previa), devuelve la existente sin
+    renderizar ('reutilizada': True en el resumen). Una factura sin
+    número recibe el siguiente de su serie al reservarla
+    """
+    if huella is None:
+        huella = huella_factura(data)
+    previa = reservar_factura(data, huella, clave, sobrescribir)
+    if previa is not None:
+        return resumen_previa(data, previa, huella)
+    return dict(generar_reservada(data, huella), reutilizada=False)
+
+
+def _generar_factura_lote(data, huella):
+    """
+    Genera una factura dentro de un proceso del pool
+    Los errores se devuelven en el resultado para no romper el lote
+    La factura llega ya reservada (y numerada) por el proceso padre
+    """
+    try:
+        return {'success': True, 'factura': dict(generar_reservada(data, huella), reutilizada=False)}
+    except Exception as e:
+        return {
+            'success': False,
+            'error': 'Error al generar la factura',
+            'details': str(e)
+        }
+
+
+def obtener_pool_lotes():
+    """Devuelve el pool de procesos para lotes, creándolo si hace falta"""
+    global _pool_lotes
+    if _pool_lotes is None:
+        # Los procesos del pool se crean con fork: que hereden el render ya
+        # importado y no a medias por el precalentamiento en segundo plano
+        obtener_renderizado()
+        _pool_lotes = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pool_lotes
+
+
+def _procesar_trabajo(trabajo):
+    """
+    Genera en el pool de procesos la factura de un trabajo asíncrono
+    ({'factura', 'huella', 'clave', 'sobrescribir'}; los encolados antes
+    solo traían la factura). La reserva, con la clave y el número, se
+    resuelve aquí, antes
+    """
+    if 'factura' not in trabajo:
+        trabajo = {'factura': trabajo}
+    data = trabajo['factura']
+    huella = trabajo.get('huella') or huella_factura(data)
+    previa = reservar_factura(data, huella, trabajo.get('clave'), trabajo.get('sobrescribir', False))
+    if previa is not None:
+        return resumen_previa(data, previa, huella)
     
-    # Línea antes del total
-    y_pos -= 4*mm
-    c.setStrokeColor(colors.black)
-    c.setLineWidth(0.5)
-    c.line(totales_label_x, y_pos, totales_x + 40*mm, y_pos)
+    resultado = obtener_pool_lotes().submit(_generar_factura_lote, data, huella).result()
+    if not resultado['success']:
+        raise RuntimeError(resultado['details'])
+    return resultado['factura']
+
+
+cola_facturas = ColaFacturas(
+    JOBS_DIR,
+    _procesar_trabajo,
+    max_pendientes=JOBS_MAX_PENDIENTES,
+    workers=JOBS_WORKERS,
+    intervalo_recuperacion=JOBS_RECUPERAR_SEGUNDOS
+)
+
+
+def reiniciar_pool_lotes():
+    """Descarta el pool actual (por ejemplo, si un proceso ha muerto)"""
+    global _pool_lotes
+    if _pool_lotes is not None:
+        _pool_lotes.shutdown(wait=False, cancel_futures=True)
+        _pool_lotes = None
+
+
+def obtener_extractor():
+    """Devuelve el extractor de pedidos, creándolo si hace falta"""
+    global _extractor
+    if _extractor is None:
+        if AI_MOCK_DIR:
+            _extractor = ExtractorLocal(AI_MOCK_DIR)
+        else:
+            _extractor = ExtractorHTTP(AI_MOCK_URL, AI_MOCK_TIMEOUT)
+    return _extractor
+
+
+def clave_idempotencia(peticion, data):
+    """
+    Idempotency-Key de la petición o, si no viene, el id del mensaje que
+    reenvía n8n ("mensaje_id" en el cuerpo)
+    """
+    clave = peticion.headers.get('Idempotency-Key') or data.get('mensaje_id')
+    return str(clave) if clave else None
+
+
+def quiere_pdf(peticion):
+    """True si el cliente pide el PDF en el cuerpo de la respuesta"""
+    if peticion.args.get('formato') == 'pdf':
+        return True
+    mejor = peticion.accept_mimetypes.best_match(['application/json', 'application/pdf'])
+    return mejor == 'application/pdf'
+
+
+def responder_pdf(data, huella, sobrescribir=False, clave=None, guardar=True):
+    """
+    Respuesta con el PDF de una factura validada, renderizado en memoria
+    (o el ya generado con los mismos datos). Antes de enviarlo se registra
+    en el catálogo como pendiente, con su número, huella y clave, para que
+    un reintento la encuentre; después solo queda escribir el PDF en disco.
+    Con guardar=False no se registra ni se guarda (necesita una factura
+    con número: sin guardarla no se le asigna ninguno)
+    """
+    fecha = data['fecha']
+    if guardar:
+        previa = reservar_factura(data, huella, clave, sobrescribir)
+    else:
+        previa = factura_previa(data, huella, clave, sobrescribir=True)
     
-    # Total
-    y_pos -= 7*mm
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(totales_label_x, y_pos, "Total")
-    c.drawRightString(totales_x + 40*mm, y_pos, f"{total_acumulado:.2f} €")
+    pendiente = None
+    if previa is not None and previa['ubicacion'] is not None:
+        contenido = previa['ubicacion'].leer()
+    else:
+        # Nueva, o registrada pero aún sin PDF en disco: se genera con su
+        # número y se escribe después de enviarla
+        contenido = generar_factura_bytes(
+            data['numero'], fecha, data['cliente']['nombre'], data['items'], huella
+        )
+        if guardar:
+            pendiente = contenido
+    respuesta = Response(
+        contenido, status=201 if previa is None else 200, mimetype='application/pdf'
+    )
+    if previa is not None:
+        respuesta.headers['Idempotent-Replayed'] = 'true'
     
-    # Guardar PDF
-    c.save()
+    numero = data['numero']
+    if pendiente is not None:
+        def guardar_pdf():
+            guardar_factura_bytes(pendiente, numero, almacen.carpeta(fecha_a_iso(fecha)))
+            catalogo.completar(nombre_factura(numero), len(pendiente))
+        
+        respuesta.call_on_close(guardar_pdf)
     
-    return ruta_archivo
+    respuesta.headers['Content-Disposition'] = (
+        f'inline; filename="{nombre_factura(numero)}"'
+    )
+    respuesta.headers['X-Factura-Numero'] = str(numero)
+    return respuesta
+
+
+def server_timing(tiempos):
+    """Cabecera Server-Timing a partir de {etapa: segundos}"""
+    return ', '.join(f'{etapa};dur={duracion * 1000:.1f}' for etapa, duracion in tiempos.items())
+
+
+def precalentar():
+    """
+    Importa los módulos diferidos y prepara el primer render (logo,
+    fuentes, ReportLab). Ver arranque: con gunicorn se llama en el proceso
+    maestro o, con ARRANQUE_RAPIDO=1, en cada worker en segundo plano
+    """
+    for nombre in MODULOS_DIFERIDOS:
+        arranque.importar(nombre)
+    obtener_renderizado().precalentar()
 
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Endpoint de health check"""
+    """Endpoint de health check (liveness; la disponibilidad, en /ready)"""
     return jsonify({
         'status': 'healthy',
         'service': 'pdf-generator-flores-loli',
@@ -249,6 +554,25 @@ def generar_factura():
         }
       ]
     }
+    
+    Sin "numero", se asigna el siguiente de la serie del año de la fecha
+    (2026-000123) al registrar la factura, antes de generar el PDF. Cada petición sin número es una
+    factura nueva, aunque los datos coincidan con otra: para que un
+    reintento devuelva la ya generada hay que enviar Idempotency-Key (o
+    "mensaje_id" en el cuerpo).
+    
+    Modos opcionales:
+    - ?async=1: encola la factura y devuelve el id del trabajo; la clave
+      y el número se comprueban antes, como en el modo normal
+    - ?formato=pdf (o Accept: application/pdf): devuelve directamente el
+      PDF renderizado en memoria; se guarda en disco después de enviar la
+      respuesta, salvo con ?guardar=0
+    
+    Idempotencia: si la factura con ese número ya se generó con los mismos
+    datos, o la Idempotency-Key ya se usó, se devuelve la existente (200 y
+    cabecera Idempotent-Replayed) sin volver a renderizarla. Un número ya
+    usado con otros datos devuelve 409, salvo con ?sobrescribir=1.
+    Reutilizar la clave con otros datos devuelve 422.
     """
     try:
         if not request.is_json:
@@ -258,61 +582,183 @@ def generar_factura():
         
         data = request.get_json()
         
-        # Validar campos requeridos
-        required_fields = ['numero', 'fecha', 'cliente', 'items']
-        for field in required_fields:
-            if field not in data:
+        error = validar_factura(data)
+        if error:
+            return jsonify({
+                'error': error
+            }), 400
+        
+        huella = huella_factura(data)
+        sobrescribir = request.args.get('sobrescribir') in ('1', 'true')
+        clave = clave_idempotencia(request, data)
+        
+        # Modo asíncrono: clave y número se comprueban antes de encolar (un
+        # reenvío devuelve la factura ya generada) y viajan con el trabajo
+        if request.args.get('async') in ('1', 'true'):
+            previa = factura_previa(data, huella, clave, sobrescribir)
+            if previa is not None:
+                return jsonify({
+                    'success': True,
+                    'message': 'Factura ya generada con los mismos datos',
+                    'factura': resumen_previa(data, previa, huella),
+                    'timestamp': datetime.now().isoformat()
+                }), 200, {'Idempotent-Replayed': 'true'}
+            try:
+                job_id = cola_facturas.encolar({
+                    'factura': data,
+                    'huella': huella,
+                    'clave': clave,
+                    'sobrescribir': sobrescribir
+                })
+            except ColaLlena:
+                return jsonify({
+                    'error': 'Cola de facturas llena, inténtalo más tarde'
+                }), 429, {'Retry-After': '5'}
+            
+            return jsonify({
+                'success': True,
+                'message': 'Factura encolada',
+                'job_id': job_id,
+                'estado': 'queued',
+                'url': f'/jobs/{job_id}',
+                'timestamp': datetime.now().isoformat()
+            }), 202, {'Location': f'/jobs/{job_id}'}
+        
+        # Modo PDF directo: se responde con los bytes y se guarda después
+        if quiere_pdf(request):
+            guardar = request.args.get('guardar', '1') not in ('0', 'false')
+            if not guardar and sin_numero(data):
                 return jsonify({
-                    'error': f'Campo requerido faltante: {field}'
+                    'error': 'Sin guardar (guardar=0) la factura necesita "numero"'
                 }), 400
+            return responder_pdf(data, huella, sobrescribir, clave, guardar)
+        
+        # Generar PDF (o reutilizar el ya generado con los mismos datos)
+        factura = emitir_factura(data, sobrescribir, huella, clave)
+        
+        if factura['reutilizada']:
+            return jsonify({
+                'success': True,
+                'message': 'Factura ya generada con los mismos datos',
+                'factura': factura,
+                'timestamp': datetime.now().isoformat()
+            }), 200, {'Idempotent-Replayed': 'true'}
+        
+        return jsonify({
+            'success': True,
+            'message': 'Factura generada correctamente',
+            'factura': factura,
+            'timestamp': datetime.now().isoformat()
+        }), 201
+        
+    except FacturaDuplicada as e:
+        return jsonify({
+            'error': 'Factura duplicada',
+            'details': str(e)
+        }), 409
         
-        # Validar items
-        if not data['items'] or len(data['items']) == 0:
+    except ClaveReutilizada as e:
+        return jsonify({
+            'error': 'Idempotency-Key ya usada con otra factura',
+            'factura': e.filename
+        }), 422
+        
+    except Exception as e:
+        return jsonify({
+            'error': 'Error al generar la factura',
+            'details': str(e)
+        }), 500
+
+
+@app.route('/factura-desde-texto', methods=['POST'])
+def factura_desde_texto():
+    """
+    Pedido en lenguaje natural → factura en una sola llamada (sustituye a
+    /procesar-pedido del Mock IA seguido de /generar-factura)
+    
+    Formato esperado (el de /procesar-pedido del Mock IA):
+    {
+        "texto": "Para Juan Pérez: 2 ramos de rosas a 30 euros",
+        "numero": "2025-001",  // Opcional
+        "mensaje_id": "wamid.HBgL..."  // Opcional: id del mensaje en n8n
+    }
+    
+    Devuelve el resumen de la factura o, con ?formato=pdf (o Accept:
+    application/pdf), el PDF; idempotencia y ?sobrescribir=1 como en
+    /generar-factura. Sin número, solo la cabecera Idempotency-Key o
+    "mensaje_id" hacen que un reintento devuelva la factura ya generada. La cabecera Server-Timing (y 'tiempos_ms' en JSON)
+    da la duración de cada etapa: extraccion, factura y total
+    """
+    inicio = time.perf_counter()
+    try:
+        if not request.is_json:
             return jsonify({
-                'error': 'Debe haber al menos un item en la factura'
+                'error': 'Content-Type debe ser application/json'
             }), 400
         
-        if len(data['items']) > 10:
+        data = request.get_json()
+        texto = data.get('texto') if isinstance(data, dict) else None
+        if not isinstance(texto, str) or not texto.strip():
             return jsonify({
-                'error': 'Máximo 10 productos por factura'
+                'error': 'Campo "texto" requerido'
             }), 400
         
-        # Extraer datos
-        numero = data['numero']
-        fecha = data['fecha']
-        cliente_nombre = data['cliente']['nombre']
-        items = data['items']
-        
-        # Generar PDF
-        archivo = generar_factura_pdf(
-            numero, 
-            fecha, 
-            cliente_nombre, 
-            items,
-            INVOICES_DIR
-        )
+        extractor = obtener_extractor()
+        tiempos = {}
+        try:
+            pedido = extractor.interpretar(texto, data.get('numero'))
+        except ErrorExtraccion as e:
+            return jsonify(e.respuesta), e.estado
+        tiempos['extraccion'] = time.perf_counter() - inicio
+        
+        factura_data = pedido.get('factura')
+        error = validar_factura(factura_data)
+        if error:
+            return jsonify({
+                'error': 'Respuesta no válida del Mock IA',
+                'details': error
+            }), 502
+        
+        huella = huella_factura(factura_data)
+        sobrescribir = request.args.get('sobrescribir') in ('1', 'true')
+        clave = clave_idempotencia(request, data)
         
-        # Calcular totales para la respuesta
-        subtotal = sum(item['base'] for item in items)
-        iva_total = sum(item['iva'] for item in items)
-        total = sum(item['total'] for item in items)
+        if quiere_pdf(request):
+            respuesta = responder_pdf(factura_data, huella, sobrescribir, clave)
+            tiempos['factura'] = time.perf_counter() - inicio - tiempos['extraccion']
+            tiempos['total'] = time.perf_counter() - inicio
+            respuesta.headers['Server-Timing'] = server_timing(tiempos)
+            return respuesta
         
+        factura = emitir_factura(factura_data, sobrescribir, huella, clave)
+        tiempos['factura'] = time.perf_counter() - inicio - tiempos['extraccion']
+        tiempos['total'] = time.perf_counter() - inicio
+        
+        cabeceras = {'Server-Timing': server_timing(tiempos)}
+        if factura['reutilizada']:
+            cabeceras['Idempotent-Replayed'] = 'true'
         return jsonify({
             'success': True,
-            'message': 'Factura generada correctamente',
-            'factura': {
-                'numero': numero,
-                'filename': os.path.basename(archivo),
-                'path': archivo,
-                'cliente': cliente_nombre,
-                'fecha': fecha,
-                'subtotal': round(subtotal, 2),
-                'iva': round(iva_total, 2),
-                'total': round(total, 2),
-                'num_items': len(items)
-            },
+            'message': ('Factura ya generada con los mismos datos' if factura['reutilizada']
+                        else 'Factura generada correctamente'),
+            'factura': factura,
+            'pedido': pedido.get('resumen'),
+            'extraccion': extractor.modo,
+            'tiempos_ms': {etapa: round(duracion * 1000, 1) for etapa, duracion in tiempos.items()},
             'timestamp': datetime.now().isoformat()
-        }), 201
+        }), 200 if factura['reutilizada'] else 201, cabeceras
+        
+    except FacturaDuplicada as e:
+        return jsonify({
+            'error': 'Factura duplicada',
+            'details': str(e)
+        }), 409
+        
+    except ClaveReutilizada as e:
+        return jsonify({
+            'error': 'Idempotency-Key ya usada con otra factura',
+            'factura': e.filename
+        }), 422
         
     except Exception as e:
         return jsonify({
@@ -321,26 +767,245 @@ def generar_factura():
         }), 500
 
 
+@app.route('/generar-facturas', methods=['POST'])
+def generar_facturas():
+    """
+    Endpoint para generar varias facturas en una sola llamada
+    Reparte el renderizado entre un pool de procesos
+    
+    Formato esperado: lista de facturas con el mismo formato que
+    /generar-factura, directamente o dentro de {"facturas": [...]}
+    
+    Devuelve un resultado por factura, en el mismo orden; una factura
+    incorrecta no hace fallar al resto del lote. Las duplicadas (número ya
+    usado con otros datos, en el catálogo o antes en el lote) llevan
+    'estado': 409 en su resultado
+    """
+    try:
+        if not request.is_json:
+            return jsonify({
+                'error': 'Content-Type debe ser application/json'
+            }), 400
+        
+        data = request.get_json()
+        lote = data.get('facturas') if isinstance(data, dict) else data
+        
+        if not isinstance(lote, list) or len(lote) == 0:
+            return jsonify({
+                'error': 'Debe enviarse una lista de facturas no vacía'
+            }), 400
+        
+        if len(lote) > MAX_FACTURAS_LOTE:
+            return jsonify({
+                'error': f'Máximo {MAX_FACTURAS_LOTE} facturas por lote'
+            }), 400
+        
+        # Validar antes de enviar nada al pool
+        resultados = [None] * len(lote)
+        validas = []
+        for indice, factura in enumerate(lote):
+            error = validar_factura(factura)
+            if error:
+                resultados[indice] = {'success': False, 'error': error}
+            else:
+                validas.append(indice)
+        
+        # Un número repetido dentro del lote: con los mismos datos es la
+        # misma factura, y con otros, un 409 (se generarían las dos en el
+        # mismo archivo). Las que no traen número son siempre facturas
+        # nuevas
+        huellas = {}
+        por_numero = {}
+        repetidas = {}
+        for indice in validas:
+            factura = lote[indice]
+            huella = huellas[indice] = huella_factura(factura)
+            if sin_numero(factura):
+                continue
+            primera = por_numero.setdefault(_normalizar_texto(factura['numero']), indice)
+            if primera == indice:
+                continue
+            if huellas[primera] == huella:
+                repetidas[indice] = primera
+            else:
+                resultados[indice] = {
+                    'success': False,
+                    'error': 'Factura duplicada',
+                    'details': (f"La factura {factura['numero']} aparece antes en el lote "
+                                f"(índice {primera}) con otros datos"),
+                    'estado': 409
+                }
+        # Cada factura se reserva (y numera) aquí, en el orden del lote;
+        # el pool solo escribe los PDFs
+        pendientes = {}
+        pool = obtener_pool_lotes()
+        for indice in validas:
+            if resultados[indice] is not None or indice in repetidas:
+                continue
+            factura = lote[indice]
+            try:
+                previa = reservar_factura(factura, huellas[indice])
+                if previa is not None:
+                    resultados[indice] = {
+                        'success': True,
+                        'factura': resumen_previa(factura, previa, huellas[indice])
+                    }
+                    continue
+            except FacturaDuplicada as e:
+                resultados[indice] = {
+                    'success': False,
+                    'error': 'Factura duplicada',
+                    'details': str(e),
+                    'estado': 409
+                }
+                continue
+            except Exception as e:
+                resultados[indice] = {
+                    'success': False,
+                    'error': 'Error al generar la factura',
+                    'details': str(e)
+                }
+                continue
+            pendientes[indice] = pool.submit(_generar_factura_lote, factura, huellas[indice])
+        
+        for indice, futuro in pendientes.items():
+            try:
+                resultados[indice] = futuro.result()
+            except BrokenProcessPool as e:
+                # Un proceso murió: se recrea el pool en el siguiente lote
+                reiniciar_pool_lotes()
+                resultados[indice] = {
+                    'success': False,
+                    'error': 'Error al generar la factura',
+                    'details': str(e)
+                }
+            except Exception as e:
+                resultados[indice] = {
+                    'success': False,
+                    'error': 'Error al generar la factura',
+                    'details': str(e)
+                }
+        
+        for indice, primera in repetidas.items():
+            resultados[indice] = dict(resultados[primera])
+            if resultados[indice]['success']:
+                resultados[indice]['factura'] = dict(resultados[primera]['factura'], reutilizada=True)
+        
+        for indice, resultado in enumerate(resultados):
+            resultado['indice'] = indice
+        
+        generadas = sum(1 for r in resultados if r['success'])
+        
+        return jsonify({
+            'success': generadas == len(resultados),
+            'message': f'{generadas} de {len(resultados)} facturas generadas',
+            'total': len(resultados),
+            'generadas': generadas,
+            'errores': len(resultados) - generadas,
+            'resultados': resultados,
+            'timestamp': datetime.now().isoformat()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'error': 'Error al generar el lote de facturas',
+            'details': str(e)
+        }), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def estado_trabajo(job_id):
+    """Endpoint para consultar el estado de un trabajo asíncrono"""
+    trabajo = cola_facturas.estado(job_id)
+    if trabajo is None:
+        return jsonify({
+            'error': 'Trabajo no encontrado'
+        }), 404
+    
+    resultado = trabajo.get('resultado') or {}
+    return jsonify({
+        'job_id': trabajo['id'],
+        'estado': trabajo['estado'],
+        'filename': resultado.get('filename'),
+        'factura': trabajo.get('resultado'),
+        'error': trabajo.get('error'),
+        'creado': trabajo['creado'],
+        'actualizado': trabajo['actualizado']
+    })
+
+
+def leer_importe(valor):
+    """Importe de un parámetro de la URL; None si no viene, ValueError si no es un número"""
+    if valor in (None, ''):
+        return None
+    importe = float(valor)
+    if not math.isfinite(importe):
+        raise ValueError(valor)
+    return importe
+
+
 @app.route('/facturas', methods=['GET'])
 def listar_facturas():
-    """Endpoint para listar todas las facturas generadas"""
+    """
+    Endpoint para listar las facturas generadas desde el catálogo
+    
+    Parámetros opcionales:
+    - pagina (desde 1) y por_pagina (por defecto 50)
+    - orden: fecha, numero, cliente, total, size o created (por defecto);
+      con prefijo '-' para orden descendente, p. ej. orden=-total
+    - cliente: texto contenido en el nombre del cliente
+    - desde / hasta: rango de fechas (DD/MM/YYYY o YYYY-MM-DD)
+    - min_total / max_total: rango de importes
+    """
     try:
+        try:
+            pagina = max(int(request.args.get('pagina', 1)), 1)
+            por_pagina = min(max(int(request.args.get('por_pagina', 50)), 1), MAX_POR_PAGINA)
+        except ValueError:
+            return jsonify({
+                'error': 'pagina y por_pagina deben ser números enteros'
+            }), 400
+        
+        try:
+            min_total = leer_importe(request.args.get('min_total'))
+            max_total = leer_importe(request.args.get('max_total'))
+        except ValueError:
+            return jsonify({
+                'error': 'min_total y max_total deben ser números'
+            }), 400
+        
+        orden = request.args.get('orden', '-created')
+        total, filas = catalogo.buscar(
+            cliente=request.args.get('cliente'),
+            desde=request.args.get('desde'),
+            hasta=request.args.get('hasta'),
+            min_total=min_total,
+            max_total=max_total,
+            orden=orden.lstrip('-'),
+            descendente=orden.startswith('-'),
+            pagina=pagina,
+            por_pagina=por_pagina
+        )
+        
         facturas = []
-        for filename in sorted(os.listdir(INVOICES_DIR), reverse=True):
-            if filename.endswith('.pdf'):
-                filepath = os.path.join(INVOICES_DIR, filename)
-                stat = os.stat(filepath)
-                facturas.append({
-                    'filename': filename,
-                    'size': stat.st_size,
-                    'size_mb': round(stat.st_size / 1024 / 1024, 2),
-                    'created': datetime.fromtimestamp(stat.st_ctime).isoformat()
-                })
+        for fila in filas:
+            fila.pop('fecha_iso')
+            fila.pop('huella')
+            fila.pop('datos')
+            # Las pendientes aún no tienen PDF ni tamaño
+            size = fila['size'] or 0
+            fila['size_kb'] = round(size / 1024, 1)
+            fila['size_mb'] = round(size / 1024 / 1024, 2)
+            facturas.append(fila)
         
         return jsonify({
             'success': True,
             'empresa': DATOS_EMPRESA['nombre'],
             'count': len(facturas),
+            'total_facturas': total,
+            'pagina': pagina,
+            'por_pagina': por_pagina,
+            'paginas': (total + por_pagina - 1) // por_pagina,
             'facturas': facturas
         })
         
@@ -351,21 +1016,110 @@ def listar_facturas():
         }), 500
 
 
+def localizar_factura(filename):
+    """Busca una factura en el almacén usando la fecha del catálogo"""
+    fila = catalogo.obtener(filename)
+    return almacen.localizar(filename, fila['fecha_iso'] if fila else None)
+
+
+@app.route('/facturas/metadatos', methods=['POST'])
+def metadatos_facturas():
+    """
+    Endpoint para comprobar en bloque qué facturas han cambiado sin
+    descargarlas
+    
+    Formato esperado:
+    {"facturas": ["factura_2025-001.pdf", ...]}
+    o, con los ETag que ya tiene el cliente:
+    {"facturas": {"factura_2025-001.pdf": "<etag>", ...}}
+    """
+    try:
+        if not request.is_json:
+            return jsonify({
+                'error': 'Content-Type debe ser application/json'
+            }), 400
+        
+        data = request.get_json()
+        consulta = data.get('facturas') if isinstance(data, dict) else None
+        if isinstance(consulta, list):
+            consulta = dict.fromkeys(consulta)
+        if not isinstance(consulta, dict) or not consulta:
+            return jsonify({
+                'error': 'Campo "facturas" requerido (lista o diccionario)'
+            }), 400
+        
+        if len(consulta) > MAX_METADATOS:
+            return jsonify({
+                'error': f'Máximo {MAX_METADATOS} facturas por consulta'
+            }), 400
+        
+        resultados = {}
+        for filename, etag_cliente in consulta.items():
+            ubicacion = localizar_factura(filename)
+            if ubicacion is None:
+                resultados[filename] = {'existe': False}
+                continue
+            
+            size, mtime, etag = ubicacion.metadatos()
+            resultados[filename] = {
+                'existe': True,
+                'etag': etag,
+                'size': size,
+                'last_modified': datetime.fromtimestamp(mtime).isoformat(),
+                'modificada': etag_cliente is None or etag_cliente.strip('"') != etag
+            }
+        
+        return jsonify({
+            'success': True,
+            'count': len(resultados),
+            'facturas': resultados
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'error': 'Error al consultar las facturas',
+            'details': str(e)
+        }), 500
+
+
 @app.route('/factura/<filename>', methods=['GET'])
 def descargar_factura(filename):
-    """Endpoint para descargar una factura específica"""
+    """
+    Endpoint para descargar una factura específica
+    La factura puede estar suelta en su carpeta del mes o dentro del zip
+    de un mes ya compactado
+    
+    Admite peticiones condicionales (If-None-Match / If-Modified-Since,
+    responde 304 sin enviar el PDF) y descargas parciales con Range
+    """
     try:
-        filepath = os.path.join(INVOICES_DIR, filename)
-        if not os.path.exists(filepath):
+        ubicacion = localizar_factura(filename)
+        if ubicacion is None:
             return jsonify({
                 'error': 'Factura no encontrada'
             }), 404
         
+        _, mtime, etag = ubicacion.metadatos()
+        
+        # Comprobar la caché del cliente antes de leer nada del zip
+        modificada = datetime.fromtimestamp(mtime, timezone.utc)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modificada):
+            respuesta = Response(status=304)
+            respuesta.set_etag(etag)
+            respuesta.last_modified = mtime
+            return respuesta
+        
+        # Los archivos sueltos se pasan por ruta: el servidor WSGI los
+        # envía con sendfile (o X-Sendfile si está activado)
+        origen = io.BytesIO(ubicacion.leer()) if ubicacion.comprimida else ubicacion.ruta
         return send_file(
-            filepath,
+            origen,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            etag=etag,
+            last_modified=mtime,
+            conditional=True
         )
         
     except Exception as e:
@@ -375,13 +1129,152 @@ def descargar_factura(filename):
         }), 500
 
 
+@app.route('/facturas/combinadas', methods=['GET', 'POST'])
+def facturas_combinadas():
+    """
+    Endpoint que une en un único PDF varias facturas, enviado al cliente
+    a medida que se va montando
+    
+    GET con filtros (como en /facturas): desde, hasta y cliente
+    POST con una lista explícita, en ese orden:
+    {"facturas": ["factura_2025-001.pdf", ...]}
+    """
+    try:
+        if request.method == 'POST':
+            if not request.is_json:
+                return jsonify({
+                    'error': 'Content-Type debe ser application/json'
+                }), 400
+            data = request.get_json()
+            nombres = data.get('facturas') if isinstance(data, dict) else None
+            if not isinstance(nombres, list) or not nombres:
+                return jsonify({
+                    'error': 'Campo "facturas" requerido (lista de nombres)'
+                }), 400
+            total = len(nombres)
+        else:
+            desde = request.args.get('desde')
+            hasta = request.args.get('hasta')
+            cliente = request.args.get('cliente')
+            total = catalogo.contar(desde, hasta, cliente)
+        
+        if total == 0:
+            return jsonify({
+                'error': 'Ninguna factura coincide con el filtro'
+            }), 404
+        if total > MAX_FACTURAS_COMBINADAS:
+            return jsonify({
+                'error': f'Máximo {MAX_FACTURAS_COMBINADAS} facturas por PDF combinado',
+                'coincidencias': total
+            }), 400
+        
+        # Con la lista explícita se comprueba todo antes de empezar a enviar
+        if request.method == 'POST':
+            ubicaciones = [localizar_factura(nombre) for nombre in nombres]
+            faltan = [n for n, u in zip(nombres, ubicaciones) if u is None]
+            if faltan:
+                return jsonify({
+                    'error': 'Facturas no encontradas',
+                    'facturas': faltan
+                }), 404
+        else:
+            ubicaciones = (
+                almacen.localizar(fila['filename'], fila['fecha_iso'])
+                for fila in catalogo.recorrer(desde, hasta, cliente)
+            )
+        
+        fuentes = (
+            io.BytesIO(u.leer()) if u.comprimida else u.ruta
+            for u in ubicaciones if u is not None
+        )
+        return Response(
+            arranque.importar('combinado').combinar_pdfs(fuentes),
+            mimetype='application/pdf',
+            headers={'Content-Disposition': 'attachment; filename="facturas.pdf"'}
+        )
+        
+    except Exception as e:
+        return jsonify({
+            'error': 'Error al combinar facturas',
+            'details': str(e)
+        }), 500
+
+
+def _leer_en_trozos(archivo):
+    """Envía un archivo abierto por trozos y lo cierra al terminar"""
+    try:
+        while True:
+            trozo = archivo.read(TAMANO_TROZO)
+            if not trozo:
+                break
+            yield trozo
+    finally:
+        archivo.close()
+
+
+@app.route('/libro-iva', methods=['GET'])
+def libro_iva():
+    """
+    Endpoint que exporta el libro de IVA de un rango de fechas desde el
+    catálogo: una fila por factura y los totales de cada mes
+    
+    Parámetros:
+    - desde / hasta: rango de fechas (DD/MM/YYYY o YYYY-MM-DD), opcionales
+    - formato: csv (por defecto) o parquet
+    """
+    desde = request.args.get('desde')
+    hasta = request.args.get('hasta')
+    formato = request.args.get('formato', 'csv')
+    for fecha in (desde, hasta):
+        if fecha and not fecha_a_iso(fecha):
+            return jsonify({
+                'error': f'Fecha no válida: {fecha}',
+                'formato': 'DD/MM/YYYY o YYYY-MM-DD'
+            }), 400
+    if formato not in ('csv', 'parquet'):
+        return jsonify({
+            'error': 'formato debe ser csv o parquet'
+        }), 400
+    
+    nombre = f"libro_iva_{fecha_a_iso(desde) or 'inicio'}_{fecha_a_iso(hasta) or 'hoy'}.{formato}"
+    cabeceras = {'Content-Disposition': f'attachment; filename="{nombre}"'}
+    facturas = catalogo.recorrer(desde, hasta)
+    
+    if formato == 'csv':
+        return Response(exportar_csv(facturas), mimetype='text/csv', headers=cabeceras)
+    
+    # Parquet escribe el índice al final: se genera por grupos de filas en
+    # un temporal (en memoria mientras es pequeño) y luego se envía
+    try:
+        archivo = tempfile.SpooledTemporaryFile(max_size=MAX_PARQUET_EN_MEMORIA)
+        exportar_parquet(facturas, archivo)
+        archivo.seek(0)
+    except FormatoNoDisponible as e:
+        return jsonify({
+            'error': 'Formato no disponible',
+            'details': str(e)
+        }), 501
+    except Exception as e:
+        return jsonify({
+            'error': 'Error al exportar el libro de IVA',
+            'details': str(e)
+        }), 500
+    return Response(
+        _leer_en_trozos(archivo),
+        mimetype='application/vnd.apache.parquet',
+        headers=cabeceras
+    )
+
+
 @app.route('/info', methods=['GET'])
 def info_empresa():
     """Endpoint con información de la empresa"""
     return jsonify({
         'empresa': DATOS_EMPRESA,
         'iva': f"{IVA * 100}%",
-        'max_productos': 10,
+        'max_productos': 'Sin límite (la tabla continúa en varias páginas)',
+        'max_facturas_lote': MAX_FACTURAS_LOTE,
+        'perfil_pdf': PDF_PERFIL,
         'formatos_aceptados': {
             'fecha': 'DD/MM/YYYY',
             'numero': 'Texto libre (ej: 2025-001)',
@@ -390,6 +1283,79 @@ def info_empresa():
     })
 
 
+@app.cli.command('reindexar')
+def reindexar():
+    """Reconstruye el catálogo a partir de los PDFs existentes"""
+    indexadas = catalogo.reindexar(almacen.recorrer())
+    print(f"📇 {indexadas} facturas indexadas en {CATALOGO_DB}")
+
+
+@app.cli.command('regenerar-pendientes')
+def regenerar_pendientes():
+    """Escribe el PDF de las facturas registradas que se quedaron sin él"""
+    regeneradas = 0
+    for fila in catalogo.pendientes():
+        ubicacion = almacen.localizar(fila['filename'], fila['fecha_iso'])
+        if ubicacion is not None:
+            catalogo.completar(fila['filename'], ubicacion.stat()[0])
+            continue
+        if not fila['datos']:
+            print(f"⚠️  {fila['filename']}: sin datos para generarla")
+            continue
+        generar_reservada(json.loads(fila['datos']), fila['huella'])
+        regeneradas += 1
+    print(f"🧾 {regeneradas} facturas pendientes generadas")
+
+
+@app.cli.command('migrar-almacen')
+def migrar_almacen():
+    """Reparte en carpetas YYYY/MM los PDFs sueltos en el directorio raíz"""
+    def fecha_de(ruta):
+        with open(ruta, 'rb') as f:
+            return fecha_a_iso(leer_metadatos_pdf(f.read()).get('fecha'))
+    
+    movidas = almacen.migrar(fecha_de)
+    print(f"📦 {movidas} facturas movidas a {INVOICES_DIR}/YYYY/MM")
+
+
+@app.cli.command('compactar')
+@click.option('--meses-abiertos', default=1, show_default=True,
+              help='Meses recientes que se dejan sin compactar')
+def compactar(meses_abiertos):
+    """Compacta cada mes cerrado en un único YYYY/MM.zip"""
+    compactados = almacen.compactar(meses_abiertos)
+    print(f"🗜️  Meses compactados: {', '.join(compactados) or 'ninguno'}")
+
+
+@app.cli.command('exportar-libro')
+@click.option('--desde', help='Fecha inicial (DD/MM/YYYY o YYYY-MM-DD)')
+@click.option('--hasta', help='Fecha final (DD/MM/YYYY o YYYY-MM-DD)')
+@click.option('--formato', type=click.Choice(['csv', 'parquet']), default='csv', show_default=True)
+@click.option('--salida', help='Archivo de salida (CSV por defecto a la salida estándar)')
+def exportar_libro(desde, hasta, formato, salida):
+    """Exporta el libro de IVA con los totales de cada mes"""
+    facturas = catalogo.recorrer(desde, hasta)
+    if formato == 'parquet':
+        if not salida:
+            raise click.UsageError('--salida es obligatorio con --formato parquet')
+        try:
+            exportar_parquet(facturas, salida)
+        except FormatoNoDisponible as e:
+            raise click.ClickException(str(e))
+    elif salida:
+        with open(salida, 'w', encoding='utf-8', newline='') as f:
+            for trozo in exportar_csv(facturas):
+                f.write(trozo)
+    else:
+        for trozo in exportar_csv(facturas):
+            sys.stdout.write(trozo)
+        return
+    print(f"📒 Libro de IVA guardado en {salida}")
+
+
+# Fin de la carga de la aplicación (el tiempo se escribe en el log)
+arranque.cargada()
+
 if __name__ == '__main__':
     print("🌸 Iniciando servicio de generación de PDFs - FLORES Y PLANTAS LOLI")
     print(f"📁 Directorio de facturas: {INVOICES_DIR}")
@@ -397,4 +1363,11 @@ if __name__ == '__main__':
     print(f"📞 Teléfono: {DATOS_EMPRESA['telefono']}")
     print(f"📧 Email: {DATOS_EMPRESA['email']}")
     print(f"📊 IVA: {IVA * 100}%")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Depurador y recarga solo si se piden (FLASK_DEBUG=1): el depurador
+    # permite ejecutar código desde el navegador
+    debug = os.environ.get('FLASK_DEBUG') == '1'
+    # Con el reloader, solo el proceso hijo procesa la cola
+    if not debug or is_running_from_reloader():
+        cola_facturas.iniciar()
+    arranque.precalentar(precalentar, en_segundo_plano=True)
+    app.run(host='0.0.0.0', port=5000, debug=debug)
\ No newline at end of file
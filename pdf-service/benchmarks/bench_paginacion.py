@@ -0,0 +1,71 @@
+"""
+Benchmark de la tabla paginada de generar_factura_pdf
+
+Renderiza en memoria facturas con un número creciente de líneas (los
+productos se pasan como generador) y comprueba que el tiempo por línea se
+mantiene constante, es decir, que el coste crece de forma lineal.
+
+Uso (desde pdf-service/):
+    python benchmarks/bench_paginacion.py
+    python benchmarks/bench_paginacion.py --lineas 10 100 1000 10000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import renderizado  # noqa: E402
+
+
+def productos(n):
+    """Genera n líneas sin construir la lista completa"""
+    for i in range(n):
+        yield {
+            'producto': f'Ramo de rosas {i}',
+            'cantidad': 2,
+            'base': 60.0,
+            'iva': 6.0,
+            'total': 66.0
+        }
+
+
+def medir(n, repeticiones):
+    """Mejor tiempo (segundos) de renderizar una factura de n líneas"""
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        renderizado.renderizar_factura(io.BytesIO(), 'BENCH', '01/01/2026', 'Cliente', productos(n))
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lineas', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    # Calentar caches (logo, fuentes)
+    medir(1, 1)
+
+    print(f"{'líneas':>8} {'total (ms)':>12} {'ms/línea':>10}")
+    por_linea = []
+    for n in args.lineas:
+        duracion = medir(n, args.repeticiones)
+        por_linea.append(duracion / n)
+        print(f"{n:>8} {duracion * 1000:>12.1f} {duracion / n * 1000:>10.3f}")
+
+    # Con crecimiento lineal, el coste por línea de la factura más grande
+    # se parece al de las intermedias (el coste fijo pesa menos cuanto más
+    # líneas hay, por eso se compara con la segunda medida)
+    if len(por_linea) >= 3:
+        ratio = por_linea[-1] / por_linea[1]
+        print(f"\nms/línea (mayor) / ms/línea ({args.lineas[1]} líneas): {ratio:.2f}")
+
+
+if __name__ == '__main__':
+    main()
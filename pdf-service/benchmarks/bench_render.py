@@ -0,0 +1,236 @@
+"""
+Suite de benchmarks de generar_factura_pdf
+
+Genera facturas sintéticas directamente con generar_factura_pdf (sin HTTP)
+en varios escenarios: 1, 10, 100 y 250 productos, nombres de producto
+largos, y con o sin logo. Cada escenario se repite con cada perfil de
+salida (PDF_PERFIL: estandar, compacto, rapido) y al final se compara el
+tiempo y los bytes por factura de cada perfil con los de 'estandar'.
+Por escenario y perfil mide:
+
+    - latencia por factura (p50, p90, p99, máx) en ms
+    - facturas por segundo de CPU (throughput por núcleo)
+    - pico de memoria residente (RSS) del proceso
+    - tamaño del PDF generado
+
+Cada escenario se ejecuta en un proceso nuevo para que el pico de RSS sea
+solo suyo. Los resultados se guardan en JSON y se pueden comparar con una
+línea base: si algún escenario empeora más de la tolerancia, el script
+muestra las diferencias y termina con código 1.
+
+Uso (desde pdf-service/):
+    python benchmarks/bench_render.py --salida resultados.json
+    python benchmarks/bench_render.py --baseline benchmarks/baseline.json
+    python benchmarks/bench_render.py --baseline benchmarks/baseline.json --actualizar-baseline
+    python benchmarks/bench_render.py --perfiles compacto --logo logo_grande.png
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SERVICIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGO_POR_DEFECTO = os.path.join(SERVICIO, 'logo.png')
+
+# nombre: (número de productos, nombre de producto largo, con logo)
+ESCENARIOS = {
+    '1_item': (1, False, True),
+    '10_items': (10, False, True),
+    '100_items': (100, False, True),
+    '250_items': (250, False, True),
+    '10_items_nombres_largos': (10, True, True),
+    '10_items_sin_logo': (10, False, False),
+}
+
+PERFILES = ['estandar', 'compacto', 'rapido']
+
+# Métricas comparadas con la línea base: (clave, mayor es peor)
+METRICAS = [
+    ('p50_ms', True),
+    ('p99_ms', True),
+    ('facturas_por_segundo_cpu', False),
+    ('pico_rss_mb', True),
+    ('tamano_bytes', True),
+]
+
+
+def productos(n, nombres_largos):
+    for i in range(n):
+        nombre = f'Ramo de rosas rojas {i}'
+        if nombres_largos:
+            nombre = f'Centro de mesa con gerberas, lirios y paniculata para evento {i} ' * 3
+        yield {
+            'producto': nombre,
+            'cantidad': 2,
+            'base': 60.0,
+            'iva': 6.0,
+            'total': 66.0
+        }
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))
+    return ordenados[indice]
+
+
+def ejecutar_escenario(nombre, perfil, iteraciones, calentamiento, logo):
+    """Se ejecuta en un proceso nuevo: importa app y mide un escenario"""
+    n_items, nombres_largos, con_logo = ESCENARIOS[nombre]
+    carpeta = tempfile.mkdtemp(prefix='bench_render_')
+    os.environ['INVOICES_DIR'] = carpeta
+    os.environ['PDF_PERFIL'] = perfil
+    os.environ['LOGO_PATH'] = logo if con_logo else os.path.join(carpeta, 'sin_logo.png')
+    sys.path.insert(0, SERVICIO)
+    import app
+
+    def generar(i):
+        return app.generar_factura_pdf(
+            f'BENCH-{i}', '01/01/2026', 'Cliente de prueba',
+            productos(n_items, nombres_largos), carpeta
+        )
+
+    for i in range(calentamiento):
+        generar(i)
+
+    latencias = []
+    cpu_inicio = time.process_time()
+    for i in range(iteraciones):
+        inicio = time.perf_counter()
+        ruta = generar(i)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    cpu_total = time.process_time() - cpu_inicio
+
+    return {
+        'perfil': perfil,
+        'items': n_items,
+        'nombres_largos': nombres_largos,
+        'logo': con_logo,
+        'iteraciones': iteraciones,
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p90_ms': round(percentil(latencias, 90), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'max_ms': round(max(latencias), 3),
+        'media_ms': round(statistics.mean(latencias), 3),
+        'facturas_por_segundo_cpu': round(iteraciones / cpu_total, 1) if cpu_total else None,
+        # ru_maxrss viene en KB en Linux
+        'pico_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'tamano_bytes': os.path.getsize(ruta),
+    }
+
+
+def comparar(resultados, baseline, tolerancia, tolerancia_tamano):
+    """Devuelve las líneas de diferencia que superan la tolerancia"""
+    regresiones = []
+    for nombre, actual in resultados['escenarios'].items():
+        base = baseline.get('escenarios', {}).get(nombre)
+        if base is None:
+            continue
+        for clave, mayor_es_peor in METRICAS:
+            antes, ahora = base.get(clave), actual.get(clave)
+            if not antes or ahora is None:
+                continue
+            cambio = (ahora - antes) / antes
+            if not mayor_es_peor:
+                cambio = -cambio
+            limite = tolerancia_tamano if clave == 'tamano_bytes' else tolerancia
+            if cambio > limite:
+                regresiones.append(
+                    f"  {nombre:<36} {clave:<26} {antes:>12} -> {ahora:<12} "
+                    f"({cambio:+.1%} peor, tolerancia {limite:.0%})"
+                )
+    return regresiones
+
+
+def comparar_perfiles(escenarios):
+    """Líneas con el tiempo y los bytes de cada perfil frente a 'estandar'"""
+    lineas = []
+    for clave, r in escenarios.items():
+        perfil, nombre = clave.split('/', 1)
+        base = escenarios.get(f'estandar/{nombre}')
+        if perfil == 'estandar' or base is None:
+            continue
+        lineas.append(
+            f"  {nombre:<26} {perfil:<9} "
+            f"{r['p50_ms']:>8.2f} ms ({r['p50_ms'] / base['p50_ms'] - 1:+.0%})  "
+            f"{r['tamano_bytes']:>8} B ({r['tamano_bytes'] / base['tamano_bytes'] - 1:+.0%})"
+        )
+    return lineas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de generar_factura_pdf')
+    parser.add_argument('--escenarios', nargs='+', choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument('--perfiles', nargs='+', choices=PERFILES, default=PERFILES)
+    parser.add_argument('--iteraciones', type=int, default=50)
+    parser.add_argument('--calentamiento', type=int, default=5)
+    parser.add_argument('--logo', default=LOGO_POR_DEFECTO)
+    parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+    parser.add_argument('--baseline', help='JSON de una ejecución anterior con el que comparar')
+    parser.add_argument('--actualizar-baseline', action='store_true',
+                        help='Sobrescribe --baseline con los resultados de esta ejecución')
+    parser.add_argument('--tolerancia', type=float, default=0.15,
+                        help='Empeoramiento relativo admitido en tiempos y memoria (0.15 = 15%%)')
+    parser.add_argument('--tolerancia-tamano', type=float, default=0.05,
+                        help='Empeoramiento relativo admitido en el tamaño del PDF')
+    args = parser.parse_args()
+
+    resultados = {
+        'fecha': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'escenarios': {},
+    }
+
+    contexto = multiprocessing.get_context('spawn')
+    print(f"{'escenario':<26} {'perfil':<9} {'p50 ms':>8} {'p99 ms':>8} {'fact/s CPU':>11} {'RSS MB':>8} {'bytes':>8}")
+    for nombre in args.escenarios:
+        for perfil in args.perfiles:
+            with contexto.Pool(1) as pool:
+                r = pool.apply(ejecutar_escenario, (nombre, perfil, args.iteraciones, args.calentamiento, args.logo))
+            resultados['escenarios'][f'{perfil}/{nombre}'] = r
+            print(f"{nombre:<26} {perfil:<9} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                  f"{r['facturas_por_segundo_cpu']:>11.1f} {r['pico_rss_mb']:>8.1f} {r['tamano_bytes']:>8}")
+    
+    lineas = comparar_perfiles(resultados['escenarios'])
+    if lineas:
+        print("\nPerfiles frente a 'estandar' (p50 y bytes por factura):")
+        print('\n'.join(lineas))
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+
+    if not args.baseline:
+        return 0
+
+    if args.actualizar_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {args.baseline}")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regresiones = comparar(resultados, baseline, args.tolerancia, args.tolerancia_tamano)
+    if regresiones:
+        print(f"\n❌ Regresiones respecto a {args.baseline}:")
+        print('\n'.join(regresiones))
+        return 1
+
+    print(f"\n✅ Sin regresiones respecto a {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,423 @@
+"""
+Catálogo de facturas indexado en SQLite
+
+Evita recorrer el directorio de facturas en cada /facturas: cada factura
+generada se registra aquí con sus datos y /facturas consulta el índice
+con paginación, orden y filtros.
+
+Guarda también la huella (hash de los datos normalizados) de cada factura
+y las claves Idempotency-Key ya usadas, para no renderizar dos veces la
+misma petición.
+
+Una factura puede registrarse antes de que su PDF esté en disco (estado
+'pendiente', con sus datos para poder generarlo): así un reintento que
+llega mientras se escribe la encuentra y no crea otra. Las que llegan
+sin número lo reciben al registrarse, en la misma transacción (ver
+numeracion).
+"""
+from datetime import datetime, timedelta
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from numeracion import ESQUEMA as ESQUEMA_SERIES, tomar_numero
+
+# Estado de una factura: 'pendiente' hasta que su PDF está en disco
+PENDIENTE = 'pendiente'
+GENERADA = 'generada'
+
+# Columnas por las que se puede ordenar /facturas
+CAMPOS_ORDEN = {
+    'fecha': 'fecha_iso',
+    'numero': 'numero',
+    'cliente': 'cliente',
+    'total': 'total',
+    'size': 'size',
+    'created': 'created',
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS facturas (
+    filename  TEXT PRIMARY KEY,
+    numero    TEXT NOT NULL,
+    cliente   TEXT,
+    fecha     TEXT,
+    fecha_iso TEXT,
+    subtotal  REAL,
+    iva       REAL,
+    total     REAL,
+    num_items INTEGER,
+    size      INTEGER,
+    created   TEXT,
+    huella    TEXT,
+    estado    TEXT,
+    datos     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_facturas_fecha ON facturas (fecha_iso);
+CREATE INDEX IF NOT EXISTS idx_facturas_cliente ON facturas (cliente COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_facturas_total ON facturas (total);
+CREATE INDEX IF NOT EXISTS idx_facturas_created ON facturas (created);
+
+CREATE TABLE IF NOT EXISTS claves_idempotencia (
+    clave    TEXT PRIMARY KEY,
+    huella   TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    created  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_claves_created ON claves_idempotencia (created);
+"""
+
+# Metadatos JSON que se guardan en /Keywords del propio PDF
+_RE_KEYWORDS = re.compile(rb'/Keywords \(((?:[^()\\]|\\.)*)\)', re.DOTALL)
+
+
+class FacturaDuplicada(Exception):
+    """Ya existe una factura con ese número generada con otros datos"""
+
+
+class ClaveReutilizada(Exception):
+    """La Idempotency-Key ya se usó con otra factura (filename)"""
+
+    def __init__(self, filename):
+        super().__init__(f"Idempotency-Key ya usada con la factura {filename}")
+        self.filename = filename
+
+
+def nombre_factura(factura_num):
+    """Nombre del archivo PDF de una factura"""
+    return f"factura_{factura_num}.pdf"
+
+
+def fecha_a_iso(fecha):
+    """Convierte DD/MM/YYYY (o YYYY-MM-DD) a YYYY-MM-DD; None si no se puede"""
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(str(fecha), formato).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def leer_metadatos_pdf(contenido):
+    """
+    Lee los metadatos que generar_factura_pdf guarda en /Keywords
+    Devuelve un dict vacío para PDFs antiguos que no los tienen
+    """
+    match = _RE_KEYWORDS.search(contenido)
+    if not match:
+        return {}
+    texto = re.sub(rb'\\(.)', rb'\1', match.group(1))
+    try:
+        return json.loads(texto.decode('ascii'))
+    except ValueError:
+        return {}
+
+
+class Catalogo:
+    """Índice SQLite de facturas; una conexión por hilo y proceso"""
+
+    def __init__(self, ruta_db):
+        self.ruta_db = ruta_db
+        self._local = threading.local()
+
+    def _conexion(self):
+        # Las conexiones no se comparten entre procesos (pool, gunicorn)
+        con = getattr(self._local, 'con', None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.ruta_db, timeout=30)
+            con.row_factory = sqlite3.Row
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            con.executescript(ESQUEMA)
+            con.executescript(ESQUEMA_SERIES)
+            self._migrar(con)
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def _migrar(self, con):
+        # Catálogos creados antes de guardar la huella y el estado
+        columnas = {fila['name'] for fila in con.execute('PRAGMA table_info(facturas)')}
+        for columna in ('huella', 'estado', 'datos'):
+            if columna not in columnas:
+                with con:
+                    con.execute(f'ALTER TABLE facturas ADD COLUMN {columna} TEXT')
+        con.execute('CREATE INDEX IF NOT EXISTS idx_facturas_huella ON facturas (huella)')
+
+    def _insertar(self, con, factura, size, created=None):
+        con.execute(
+            """
+            INSERT OR REPLACE INTO facturas
+                (filename, numero, cliente, fecha, fecha_iso,
+                 subtotal, iva, total, num_items, size, created, huella,
+                 estado, datos)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                factura['filename'],
+                str(factura['numero']),
+                factura.get('cliente'),
+                factura.get('fecha'),
+                fecha_a_iso(factura.get('fecha')),
+                factura.get('subtotal'),
+                factura.get('iva'),
+                factura.get('total'),
+                factura.get('num_items'),
+                size,
+                created or datetime.now().isoformat(),
+                factura.get('huella'),
+                factura.get('estado', GENERADA),
+                json.dumps(factura['datos'], ensure_ascii=False) if factura.get('datos') else None,
+            )
+        )
+
+    def registrar(self, factura, size, created=None):
+        """Inserta o actualiza una factura a partir de su resumen"""
+        con = self._conexion()
+        with con:
+            self._insertar(con, factura, size, created)
+
+    def _previa(self, con, numero, huella, clave, sobrescribir):
+        # La factura ya registrada para esta petición: la de la clave o,
+        # si trae número, la de la misma huella. Sin número no se compara
+        # el contenido: solo la clave identifica un reenvío
+        if clave:
+            usada = con.execute(
+                'SELECT huella, filename FROM claves_idempotencia WHERE clave = ?', (clave,)
+            ).fetchone()
+            if usada and usada['huella'] != huella:
+                raise ClaveReutilizada(usada['filename'])
+            if usada:
+                fila = con.execute(
+                    'SELECT * FROM facturas WHERE filename = ?', (usada['filename'],)
+                ).fetchone()
+                if fila:
+                    return dict(fila)
+        if numero in (None, ''):
+            return None
+        fila = con.execute(
+            'SELECT * FROM facturas WHERE huella = ? ORDER BY created DESC LIMIT 1', (huella,)
+        ).fetchone()
+        if fila:
+            return dict(fila)
+        if not sobrescribir and self._existe(con, nombre_factura(numero)):
+            raise FacturaDuplicada(
+                f"La factura {numero} ya existe con otros datos "
+                f"(usa ?sobrescribir=1 para reemplazarla)"
+            )
+        return None
+
+    def _existe(self, con, filename):
+        return con.execute(
+            'SELECT 1 FROM facturas WHERE filename = ?', (filename,)
+        ).fetchone() is not None
+
+    def comprobar(self, numero, huella, clave=None, sobrescribir=False):
+        """
+        Sin registrar nada, devuelve la fila de la factura ya registrada
+        para esta petición (ver reservar) o None
+        Lanza ClaveReutilizada o FacturaDuplicada
+        """
+        return self._previa(self._conexion(), numero, huella, clave, sobrescribir)
+
+    def reservar(self, factura, clave=None, sobrescribir=False, serie=None,
+                 retencion_horas=24):
+        """
+        Registra como pendiente una factura antes de escribir su PDF, con sus
+        datos ('datos', la factura validada) y su Idempotency-Key, en una
+        sola transacción BEGIN IMMEDIATE: comprueba la clave y el número y,
+        si no trae número, le da el siguiente de la serie (el año actual
+        por defecto). completar la da por generada
+        Devuelve (fila, nueva): la fila registrada ahora o, si nueva es
+        False, la que ya había para esta petición
+        Lanza ClaveReutilizada o FacturaDuplicada
+        """
+        con = self._conexion()
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            fila = self._previa(con, factura['numero'], factura['huella'], clave, sobrescribir)
+            nueva = fila is None
+            if nueva:
+                numero = factura['numero']
+                if numero in (None, ''):
+                    numero = tomar_numero(
+                        con, str(serie or datetime.now().year),
+                        lambda n: self._existe(con, nombre_factura(n))
+                    )
+                fila = dict(
+                    factura,
+                    numero=numero,
+                    filename=nombre_factura(numero),
+                    estado=PENDIENTE,
+                    datos=dict(factura['datos'], numero=numero)
+                )
+                self._insertar(con, fila, None)
+                fila = dict(con.execute(
+                    'SELECT * FROM facturas WHERE filename = ?', (fila['filename'],)
+                ).fetchone())
+            if clave:
+                self._insertar_clave(con, clave, factura['huella'], fila['filename'], retencion_horas)
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        return fila, nueva
+
+    def completar(self, filename, size):
+        """Marca como generada una factura pendiente cuyo PDF ya está en disco"""
+        con = self._conexion()
+        with con:
+            con.execute(
+                'UPDATE facturas SET estado = ?, size = ? WHERE filename = ?',
+                (GENERADA, size, filename)
+            )
+
+    def obtener(self, filename):
+        """Devuelve la fila de una factura o None"""
+        fila = self._conexion().execute(
+            'SELECT * FROM facturas WHERE filename = ?', (filename,)
+        ).fetchone()
+        return dict(fila) if fila else None
+
+    def pendientes(self):
+        """Facturas registradas cuyo PDF no se ha llegado a escribir"""
+        filas = self._conexion().execute(
+            'SELECT * FROM facturas WHERE estado = ? ORDER BY created', (PENDIENTE,)
+        ).fetchall()
+        return [dict(fila) for fila in filas]
+
+    def obtener_clave(self, clave):
+        """Devuelve la huella y la factura asociadas a una Idempotency-Key o None"""
+        fila = self._conexion().execute(
+            'SELECT * FROM claves_idempotencia WHERE clave = ?', (clave,)
+        ).fetchone()
+        return dict(fila) if fila else None
+
+    def _insertar_clave(self, con, clave, huella, filename, retencion_horas):
+        # Guarda la clave y olvida las de más de retencion_horas
+        ahora = datetime.now()
+        limite = (ahora - timedelta(hours=retencion_horas)).isoformat()
+        con.execute('DELETE FROM claves_idempotencia WHERE created < ?', (limite,))
+        con.execute(
+            'INSERT OR IGNORE INTO claves_idempotencia VALUES (?, ?, ?, ?)',
+            (clave, huella, filename, ahora.isoformat())
+        )
+
+    def buscar(self, cliente=None, desde=None, hasta=None, min_total=None,
+               max_total=None, orden='created', descendente=True, pagina=1,
+               por_pagina=50):
+        """
+        Devuelve (total_coincidencias, filas de la página pedida)
+        Las fechas desde/hasta se aceptan como DD/MM/YYYY o YYYY-MM-DD
+        """
+        condiciones = []
+        parametros = []
+        if cliente:
+            condiciones.append('cliente LIKE ? COLLATE NOCASE')
+            parametros.append(f'%{cliente}%')
+        if desde:
+            condiciones.append('fecha_iso >= ?')
+            parametros.append(fecha_a_iso(desde) or desde)
+        if hasta:
+            condiciones.append('fecha_iso <= ?')
+            parametros.append(fecha_a_iso(hasta) or hasta)
+        if min_total is not None:
+            condiciones.append('total >= ?')
+            parametros.append(min_total)
+        if max_total is not None:
+            condiciones.append('total <= ?')
+            parametros.append(max_total)
+
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+        columna = CAMPOS_ORDEN.get(orden, 'created')
+        sentido = 'DESC' if descendente else 'ASC'
+
+        con = self._conexion()
+        total = con.execute(
+            f'SELECT COUNT(*) FROM facturas {where}', parametros
+        ).fetchone()[0]
+        filas = con.execute(
+            f"""
+            SELECT * FROM facturas {where}
+            ORDER BY {columna} {sentido}, filename {sentido}
+            LIMIT ? OFFSET ?
+            """,
+            parametros + [por_pagina, (pagina - 1) * por_pagina]
+        ).fetchall()
+        return total, [dict(fila) for fila in filas]
+
+    def _filtro_rango(self, desde, hasta, cliente):
+        # Filtro de recorrer y contar: solo facturas con fecha reconocible
+        condiciones = ['fecha_iso IS NOT NULL']
+        parametros = []
+        if cliente:
+            condiciones.append('cliente LIKE ? COLLATE NOCASE')
+            parametros.append(f'%{cliente}%')
+        if desde:
+            condiciones.append('fecha_iso >= ?')
+            parametros.append(fecha_a_iso(desde) or desde)
+        if hasta:
+            condiciones.append('fecha_iso <= ?')
+            parametros.append(fecha_a_iso(hasta) or hasta)
+        return ' AND '.join(condiciones), parametros
+
+    def contar(self, desde=None, hasta=None, cliente=None):
+        """Número de facturas que devolvería recorrer con el mismo filtro"""
+        where, parametros = self._filtro_rango(desde, hasta, cliente)
+        return self._conexion().execute(
+            f'SELECT COUNT(*) FROM facturas WHERE {where}', parametros
+        ).fetchone()[0]
+
+    def recorrer(self, desde=None, hasta=None, cliente=None, lote=500):
+        """
+        Recorre las facturas de un rango de fechas ordenadas por fecha y
+        número, leyendo del cursor de lote en lote (memoria constante)
+        """
+        where, parametros = self._filtro_rango(desde, hasta, cliente)
+        cursor = self._conexion().execute(
+            f"""
+            SELECT filename, numero, fecha, fecha_iso, cliente, subtotal, iva, total
+            FROM facturas WHERE {where}
+            ORDER BY fecha_iso, numero
+            """,
+            parametros
+        )
+        try:
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    break
+                for fila in filas:
+                    yield dict(fila)
+        finally:
+            cursor.close()
+
+    def reindexar(self, ubicaciones):
+        """
+        Reconstruye el índice desde las facturas guardadas
+        (las Ubicacion que devuelve Almacen.recorrer). Las pendientes cuyo
+        PDF aún no está en disco se conservan
+        Devuelve el número de facturas indexadas
+        """
+        indexadas = 0
+        con = self._conexion()
+        with con:
+            con.execute('DELETE FROM facturas WHERE estado IS NOT ?', (PENDIENTE,))
+            for ubicacion in ubicaciones:
+                filename = ubicacion.filename
+                size, mtime = ubicacion.stat()
+                factura = leer_metadatos_pdf(ubicacion.leer())
+                factura['filename'] = filename
+                if 'numero' not in factura:
+                    # PDF anterior al catálogo: solo se conoce el nombre
+                    factura['numero'] = filename.removeprefix('factura_').removesuffix('.pdf')
+                self._insertar(
+                    con,
+                    factura,
+                    size,
+                    created=datetime.fromtimestamp(mtime).isoformat()
+                )
+                indexadas += 1
+        return indexadas
@@ -0,0 +1,247 @@
+"""
+Cola de trabajos asíncronos para la generación de facturas
+
+Cada trabajo se guarda como un JSON en disco (un archivo por trabajo), de
+forma que los pendientes sobreviven a un reinicio del contenedor. Mientras
+un trabajo se está procesando, su archivo .lock queda bloqueado con flock:
+si el proceso muere, el bloqueo desaparece y el trabajo se puede recuperar.
+El .lock se borra en cuanto el trabajo termina.
+
+Cada proceso revisa el directorio cada cierto tiempo y recoge los
+trabajos pendientes que nadie está procesando: los de un worker que ha
+terminado (reciclado por max_requests o muerto) no esperan a que arranque
+otro.
+"""
+from datetime import datetime, timedelta
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Estados posibles de un trabajo
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ColaLlena(Exception):
+    """La cola ha alcanzado su tamaño máximo"""
+
+
+class ColaFacturas:
+    """
+    Cola acotada de trabajos con un pool fijo de hilos consumidores
+
+    procesar(payload) debe devolver un dict con el resultado o lanzar una
+    excepción si el trabajo falla
+    """
+
+    def __init__(self, directorio, procesar, max_pendientes=100, workers=2,
+                 retencion_horas=72, intervalo_recuperacion=30):
+        self.directorio = directorio
+        self.procesar = procesar
+        self.workers = workers
+        self.retencion = timedelta(hours=retencion_horas)
+        self.intervalo_recuperacion = intervalo_recuperacion
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._encolados = set()
+        self._hilos = []
+        self._lock = threading.Lock()
+        self._detenida = threading.Event()
+        os.makedirs(directorio, exist_ok=True)
+
+    # ===== PERSISTENCIA =====
+
+    def _ruta(self, job_id):
+        return os.path.join(self.directorio, f"{job_id}.json")
+
+    def _ruta_lock(self, job_id):
+        return os.path.join(self.directorio, f"{job_id}.lock")
+
+    def _guardar(self, trabajo):
+        """Escritura atómica: archivo temporal + rename"""
+        trabajo['actualizado'] = datetime.now().isoformat()
+        ruta = self._ruta(trabajo['id'])
+        tmp = f"{ruta}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(trabajo, f, ensure_ascii=False)
+        os.replace(tmp, ruta)
+
+    def _leer(self, job_id):
+        try:
+            with open(self._ruta(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # ===== API PÚBLICA =====
+
+    def encolar(self, payload):
+        """
+        Guarda el trabajo en disco y lo encola
+        Lanza ColaLlena si no hay hueco (el llamante responde 429)
+        """
+        self.iniciar()
+        ahora = datetime.now().isoformat()
+        trabajo = {
+            'id': uuid.uuid4().hex,
+            'estado': QUEUED,
+            'creado': ahora,
+            'payload': payload,
+        }
+        self._guardar(trabajo)
+        if not self._poner(trabajo['id']):
+            os.remove(self._ruta(trabajo['id']))
+            raise ColaLlena()
+        return trabajo['id']
+
+    def estado(self, job_id):
+        """Devuelve el trabajo sin el payload, o None si no existe"""
+        if not job_id.isalnum():
+            return None
+        trabajo = self._leer(job_id)
+        if trabajo is None:
+            return None
+        trabajo.pop('payload', None)
+        return trabajo
+
+    def pendientes(self):
+        """Número aproximado de trabajos esperando en la cola"""
+        return self._cola.qsize()
+
+    def iniciar(self):
+        """
+        Arranca los hilos consumidores y el que recupera trabajos
+        pendientes (al arrancar y cada intervalo_recuperacion segundos)
+        """
+        with self._lock:
+            if self._hilos:
+                return
+            for i in range(self.workers):
+                hilo = threading.Thread(
+                    target=self._consumir, name=f"cola-facturas-{i}", daemon=True
+                )
+                hilo.start()
+                self._hilos.append(hilo)
+            threading.Thread(
+                target=self._recuperar_siempre, name="cola-facturas-recuperar", daemon=True
+            ).start()
+
+    def detener(self, espera=30):
+        """
+        Deja de coger trabajos y espera hasta espera segundos a que terminen
+        los que están en marcha (al salir un worker). Los que quedan en la
+        cola siguen en disco y los recoge otro proceso
+        """
+        self._detenida.set()
+        limite = time.monotonic() + espera
+        for hilo in self._hilos:
+            hilo.join(max(0, limite - time.monotonic()))
+
+    # ===== PROCESAMIENTO =====
+
+    def _poner(self, job_id):
+        """Encola job_id si no está ya en la cola de este proceso; False si está llena"""
+        with self._lock:
+            if job_id in self._encolados:
+                return True
+            try:
+                self._cola.put_nowait(job_id)
+            except queue.Full:
+                return False
+            self._encolados.add(job_id)
+            return True
+
+    def _recuperar_siempre(self):
+        while not self._detenida.is_set():
+            try:
+                self._recuperar()
+            except Exception:
+                # Un trabajo ilegible no debe parar las siguientes pasadas
+                pass
+            self._detenida.wait(self.intervalo_recuperacion)
+
+    def _recuperar(self):
+        """
+        Vuelve a encolar los trabajos queued/running que nadie está
+        procesando (por ejemplo, tras un reinicio o los de un worker que
+        ha terminado) y purga los antiguos. Si la cola se llena, el resto
+        espera a la siguiente pasada
+        """
+        limite = datetime.now() - self.retencion
+        for nombre in sorted(os.listdir(self.directorio)):
+            if not nombre.endswith('.json'):
+                continue
+            job_id = nombre[:-len('.json')]
+            trabajo = self._leer(job_id)
+            if trabajo is None:
+                continue
+
+            if trabajo['estado'] in (DONE, FAILED):
+                if datetime.fromisoformat(trabajo['actualizado']) < limite:
+                    for ruta in (self._ruta(job_id), self._ruta_lock(job_id)):
+                        try:
+                            os.remove(ruta)
+                        except OSError:
+                            pass
+                continue
+
+            if self._libre(job_id) and not self._poner(job_id):
+                return
+
+    def _libre(self, job_id):
+        """True si ningún proceso tiene bloqueado el trabajo"""
+        with open(self._ruta_lock(job_id), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            return True
+
+    def _consumir(self):
+        while not self._detenida.is_set():
+            try:
+                job_id = self._cola.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                if not self._detenida.is_set():
+                    self._ejecutar(job_id)
+            finally:
+                with self._lock:
+                    self._encolados.discard(job_id)
+                self._cola.task_done()
+
+    def _ejecutar(self, job_id):
+        ruta_lock = self._ruta_lock(job_id)
+        with open(ruta_lock, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Otro proceso ya lo está generando
+                return
+
+            trabajo = self._leer(job_id)
+            if trabajo is not None and trabajo['estado'] not in (DONE, FAILED):
+                trabajo['estado'] = RUNNING
+                self._guardar(trabajo)
+
+                try:
+                    trabajo['resultado'] = self.procesar(trabajo['payload'])
+                    trabajo['estado'] = DONE
+                except Exception as e:
+                    trabajo['estado'] = FAILED
+                    trabajo['error'] = str(e)
+                self._guardar(trabajo)
+
+            # Terminado (aquí o en otro proceso): quien lo coja después lo
+            # verá terminado, así que el .lock ya no hace falta
+            try:
+                os.remove(ruta_lock)
+            except OSError:
+                pass
@@ -0,0 +1,160 @@
+"""
+Unión de varias facturas en un único PDF que se envía mientras se monta
+
+Cada factura se abre con pypdf y sus páginas se copian objeto a objeto
+directamente a la salida, con números de objeto nuevos. Nada se guarda
+salvo las posiciones para la tabla xref y la huella de cada objeto ya
+escrito: los objetos idénticos (logo, fuentes, formularios de la
+cabecera) se escriben una sola vez y el resto de páginas los reutilizan.
+
+El árbol de páginas y el catálogo se escriben al final, cuando ya se
+conocen todas las páginas (los números 1 y 2 se reservan al empezar).
+"""
+import hashlib
+import io
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+    StreamObject
+)
+
+ID_CATALOGO = 1
+ID_PAGINAS = 2
+
+# Referencias hacia arriba en el árbol: se rehacen, no se copian
+_CLAVES_OMITIDAS = {'/Parent', '/P'}
+
+
+class _Salida:
+    """Buffer de salida que recuerda la posición de cada objeto"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.enviados = 0
+        self.posiciones = {}
+        self.siguiente_id = ID_PAGINAS + 1
+        self.huellas = {}
+
+    def escribir(self, datos):
+        self.buffer.write(datos)
+
+    def objeto(self, id_objeto, cuerpo):
+        self.posiciones[id_objeto] = self.enviados + self.buffer.tell()
+        self.escribir(b'%d 0 obj\n%s\nendobj\n' % (id_objeto, cuerpo))
+
+    def nuevo_id(self):
+        id_objeto = self.siguiente_id
+        self.siguiente_id += 1
+        return id_objeto
+
+    def pendiente(self):
+        return self.buffer.tell()
+
+    def vaciar(self):
+        datos = self.buffer.getvalue()
+        self.enviados += len(datos)
+        self.buffer = io.BytesIO()
+        return datos
+
+
+def _serializar(obj):
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer)
+    return buffer.getvalue()
+
+
+class _Copiador:
+    """Copia los objetos de un documento a la salida, sin repetir ninguno"""
+
+    def __init__(self, salida):
+        self.salida = salida
+        self.copiados = {}
+        self.en_curso = set()
+
+    def copiar(self, obj):
+        if isinstance(obj, IndirectObject):
+            return self._copiar_referencia(obj)
+        if isinstance(obj, StreamObject):
+            copia = obj.__class__()
+            copia._data = obj._data
+            for clave, valor in obj.items():
+                copia[clave] = self.copiar(valor)
+            return copia
+        if isinstance(obj, DictionaryObject):
+            copia = DictionaryObject()
+            for clave, valor in obj.items():
+                if clave not in _CLAVES_OMITIDAS:
+                    copia[clave] = self.copiar(valor)
+            return copia
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copiar(valor) for valor in obj)
+        return obj
+
+    def _copiar_referencia(self, referencia):
+        clave = (referencia.idnum, referencia.generation)
+        if clave in self.copiados:
+            return IndirectObject(self.copiados[clave], 0, None)
+        if clave in self.en_curso:
+            raise ValueError(f'Referencia circular en el objeto {referencia.idnum}')
+
+        self.en_curso.add(clave)
+        cuerpo = _serializar(self.copiar(referencia.get_object()))
+        self.en_curso.discard(clave)
+
+        # Mismos bytes (con las referencias ya renumeradas) = mismo objeto
+        huella = hashlib.sha1(cuerpo).digest()
+        id_objeto = self.salida.huellas.get(huella)
+        if id_objeto is None:
+            id_objeto = self.salida.nuevo_id()
+            self.salida.huellas[huella] = id_objeto
+            self.salida.objeto(id_objeto, cuerpo)
+        self.copiados[clave] = id_objeto
+        return IndirectObject(id_objeto, 0, None)
+
+    def copiar_pagina(self, pagina):
+        copia = self.copiar(pagina)
+        copia[NameObject('/Parent')] = IndirectObject(ID_PAGINAS, 0, None)
+        id_objeto = self.salida.nuevo_id()
+        self.salida.objeto(id_objeto, _serializar(copia))
+        return id_objeto
+
+
+def combinar_pdfs(fuentes, tamano_trozo=64 * 1024):
+    """
+    Genera, por trozos de unos tamano_trozo bytes, un PDF con todas las
+    páginas de las fuentes (rutas o archivos binarios) en orden
+    """
+    salida = _Salida()
+    salida.escribir(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    paginas = []
+    for fuente in fuentes:
+        copiador = _Copiador(salida)
+        for pagina in PdfReader(fuente).pages:
+            paginas.append(copiador.copiar_pagina(pagina))
+            if salida.pendiente() >= tamano_trozo:
+                yield salida.vaciar()
+
+    arbol = DictionaryObject({
+        NameObject('/Type'): NameObject('/Pages'),
+        NameObject('/Kids'): ArrayObject(IndirectObject(p, 0, None) for p in paginas),
+        NameObject('/Count'): NumberObject(len(paginas)),
+    })
+    salida.objeto(ID_PAGINAS, _serializar(arbol))
+    catalogo = DictionaryObject({
+        NameObject('/Type'): NameObject('/Catalog'),
+        NameObject('/Pages'): IndirectObject(ID_PAGINAS, 0, None),
+    })
+    salida.objeto(ID_CATALOGO, _serializar(catalogo))
+
+    inicio_xref = salida.enviados + salida.pendiente()
+    total = salida.siguiente_id
+    salida.escribir(b'xref\n0 %d\n0000000000 65535 f \n' % total)
+    for id_objeto in range(1, total):
+        salida.escribir(b'%010d 00000 n \n' % salida.posiciones[id_objeto])
+    salida.escribir(
+        b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+        % (total, ID_CATALOGO, inicio_xref)
+    )
+    yield salida.vaciar()
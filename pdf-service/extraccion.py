@@ -0,0 +1,138 @@
+"""
+Extracción de pedidos para /factura-desde-texto
+
+Convierte el texto de un mensaje en la respuesta de POST /procesar-pedido
+del Mock IA, de una de estas dos formas:
+
+    local  AI_MOCK_DIR apunta al código de ai-mock: mock_ia se importa en
+           este proceso y se llama directamente a interpretar_pedido (sin
+           HTTP ni JSON). Sus tiempos por etapa (cliente, productos,
+           numero) se suman a las métricas de este servicio
+    http   si no, POST a AI_MOCK_URL/procesar-pedido por una conexión
+           persistente (keep-alive) por hilo, que se reabre si el Mock IA
+           la ha cerrado
+"""
+import http.client
+import json
+import sys
+import threading
+from urllib.parse import urlsplit
+
+
+class ErrorExtraccion(Exception):
+    """
+    El pedido no se pudo convertir en factura
+    estado y respuesta son los que se devuelven al cliente
+    """
+
+    def __init__(self, estado, respuesta):
+        super().__init__(respuesta.get('error'))
+        self.estado = estado
+        self.respuesta = respuesta
+
+
+class ExtractorLocal:
+    """Llama a mock_ia en el mismo proceso"""
+
+    modo = 'local'
+
+    def __init__(self, directorio):
+        # Al final: los módulos de pdf-service (metricas) tienen prioridad
+        if directorio not in sys.path:
+            sys.path.append(directorio)
+        import mock_ia
+        self.mock_ia = mock_ia
+
+    def interpretar(self, texto, numero=None):
+        mock_ia = self.mock_ia
+        if len(texto) > mock_ia.MAX_LONGITUD_TEXTO:
+            raise ErrorExtraccion(413, {
+                'error': mock_ia.ERROR_TEXTO_LARGO,
+                'max_caracteres': mock_ia.MAX_LONGITUD_TEXTO
+            })
+        resultado = mock_ia.interpretar_pedido(texto, numero)
+        if resultado is None:
+            raise ErrorExtraccion(400, {
+                'error': mock_ia.ERROR_SIN_PRODUCTOS,
+                'sugerencia': mock_ia.SUGERENCIA_FORMATO
+            })
+        return resultado
+
+
+class ExtractorHTTP:
+    """Llama al Mock IA por HTTP con una conexión persistente por hilo"""
+
+    modo = 'http'
+
+    def __init__(self, url, timeout=10):
+        partes = urlsplit(url)
+        self.host = partes.hostname
+        self.puerto = partes.port or 80
+        self.ruta = partes.path.rstrip('/') + '/procesar-pedido'
+        self.timeout = timeout
+        self._hilos = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._hilos, 'conexion', None)
+        if conexion is None:
+            conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=self.timeout)
+            self._hilos.conexion = conexion
+        return conexion
+
+    def _cerrar(self):
+        conexion = getattr(self._hilos, 'conexion', None)
+        if conexion is not None:
+            conexion.close()
+            self._hilos.conexion = None
+
+    def _enviar(self, cuerpo):
+        """
+        POST del pedido; devuelve (estado, cuerpo de la respuesta)
+        Si la conexión guardada estaba cerrada se reintenta una vez con
+        una nueva (interpretar un pedido no tiene efectos)
+        """
+        for intento in range(2):
+            conexion = self._conexion()
+            try:
+                conexion.request('POST', self.ruta, body=cuerpo, headers={
+                    'Content-Type': 'application/json'
+                })
+                respuesta = conexion.getresponse()
+                datos = respuesta.read()
+            except (ConnectionError, http.client.HTTPException) as e:
+                self._cerrar()
+                if intento:
+                    raise ErrorExtraccion(502, {
+                        'error': 'Mock IA no disponible',
+                        'details': str(e) or type(e).__name__
+                    })
+                continue
+            except OSError as e:
+                self._cerrar()
+                raise ErrorExtraccion(502, {
+                    'error': 'Mock IA no disponible',
+                    'details': str(e) or type(e).__name__
+                })
+            if respuesta.will_close:
+                self._cerrar()
+            return respuesta.status, datos
+
+    def interpretar(self, texto, numero=None):
+        pedido = {'texto': texto}
+        if numero is not None:
+            pedido['numero'] = numero
+        estado, datos = self._enviar(json.dumps(pedido, ensure_ascii=False).encode('utf-8'))
+        
+        try:
+            resultado = json.loads(datos)
+        except ValueError:
+            resultado = None
+        if not isinstance(resultado, dict):
+            raise ErrorExtraccion(502, {
+                'error': 'Respuesta no válida del Mock IA',
+                'estado_mock_ia': estado
+            })
+        if estado != 200:
+            # Los errores del pedido (400, 413) se devuelven tal cual
+            raise ErrorExtraccion(estado if 400 <= estado < 500 else 502, resultado)
+        return resultado
@@ -0,0 +1,100 @@
+"""
+Configuración de gunicorn para el servicio de PDFs en producción
+
+Todo se ajusta con variables de entorno (ver docker-compose.yml):
+    PORT                        puerto de escucha (5000)
+    GUNICORN_WORKERS            procesos worker (uno por núcleo)
+    GUNICORN_THREADS            hilos por worker (2)
+    GUNICORN_MAX_REQUESTS       peticiones antes de reciclar un worker (1000, 0 = nunca)
+    GUNICORN_MAX_REQUESTS_JITTER  aleatoriedad para no reciclar todos a la vez (100)
+    GUNICORN_TIMEOUT            segundos antes de matar un worker bloqueado (60)
+    GUNICORN_GRACEFUL_TIMEOUT   segundos para terminar peticiones al reiniciar (30)
+    PROMETHEUS_MULTIPROC_DIR    directorio para agregar las métricas de todos los workers
+    ARRANQUE_RAPIDO             1 = precalentar en cada worker en segundo plano (0)
+    JOBS_RECUPERAR_SEGUNDOS     cada cuánto recoge cada worker los trabajos huérfanos (30)
+
+La aplicación se carga en el proceso maestro (preload_app): ReportLab, las
+fuentes y el logo se preparan una vez y los workers los heredan al hacer
+fork (copy-on-write).
+
+Con ARRANQUE_RAPIDO=1 el maestro solo carga la aplicación (sin ReportLab
+ni pypdf) y crea los workers enseguida; cada worker precalienta en
+segundo plano y /ready devuelve 503 hasta que termina (ver arranque).
+Arranca antes, a cambio de que cada worker cargue su propia copia.
+
+Recarga en caliente: `docker compose kill -s HUP pdf-service` reinicia los
+workers de forma ordenada. Con preload_app el código de app.py no se
+relee; para desplegar código nuevo hay que reiniciar el contenedor.
+"""
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('GUNICORN_WORKERS', os.cpu_count() or 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+worker_class = 'gthread' if threads > 1 else 'sync'
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+
+def _preparar_metricas():
+    """
+    Vacía las métricas que hayan quedado de una ejecución anterior y crea
+    el directorio. Tiene que ser aquí y no en un hook: con preload_app la
+    app se importa en el maestro antes de on_starting y ya escribe sus
+    archivos. Al recargar con HUP este archivo se vuelve a leer, pero los
+    archivos del maestro y de los workers siguen en uso: solo se vacía
+    la primera vez
+    """
+    directorio = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not directorio or os.environ.get('_METRICAS_PREPARADAS'):
+        return
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.makedirs(directorio, exist_ok=True)
+    os.environ['_METRICAS_PREPARADAS'] = '1'
+
+
+_preparar_metricas()
+
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """En el maestro, antes de crear los workers: precalentar el render"""
+    import app
+    if app.ARRANQUE_RAPIDO:
+        server.log.info("Arranque rápido: cada worker precalentará en segundo plano")
+        return
+    app.arranque.precalentar(app.precalentar)
+    server.log.info("Render precalentado (fuentes y logo en memoria)")
+
+
+def post_fork(server, worker):
+    """
+    En cada worker: los hilos de la cola no sobreviven al fork, y con
+    arranque rápido aquí empieza el precalentamiento
+    """
+    import app
+    app.cola_facturas.iniciar()
+    if app.ARRANQUE_RAPIDO:
+        app.arranque.precalentar(app.precalentar, en_segundo_plano=True)
+
+
+def worker_exit(server, worker):
+    """
+    En el worker que termina (reciclado o parado): deja de coger trabajos y
+    espera a los que están en marcha; los encolados los recoge otro worker
+    """
+    import app
+    app.cola_facturas.detener(espera=graceful_timeout)
+
+
+def child_exit(server, worker):
+    """Las métricas de un worker que ha terminado dejan de contar como vivas"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,138 @@
+"""
+Libro de IVA exportado desde el catálogo de facturas
+
+Se calcula con los datos que generar_factura_pdf registra en el catálogo
+(sin abrir los PDFs): una fila por factura con número, fecha, cliente,
+base, IVA y total, y tras cada mes una fila con sus totales. Al final se
+añade el total del periodo.
+
+Las facturas llegan como generador y la salida se produce por bloques,
+así que exportar un año entero usa memoria constante.
+
+    CSV      siempre disponible
+    Parquet  formato columnar; necesita pyarrow (en requirements.txt; en una
+             instalación sin él responde 501)
+"""
+import csv
+import io
+
+COLUMNAS = ['tipo', 'mes', 'numero', 'fecha', 'cliente', 'base', 'iva', 'total', 'facturas']
+
+# Valores de la columna 'tipo'
+TIPO_FACTURA = 'factura'
+TIPO_TOTAL_MES = 'total_mes'
+TIPO_TOTAL = 'total'
+
+
+class FormatoNoDisponible(Exception):
+    """El formato pedido necesita una dependencia que no está instalada"""
+
+
+class _Acumulado:
+    def __init__(self):
+        self.base = self.iva = self.total = 0.0
+        self.facturas = 0
+
+    def sumar(self, base, iva, total):
+        self.base += base
+        self.iva += iva
+        self.total += total
+        self.facturas += 1
+
+    def fila(self, tipo, mes):
+        return {
+            'tipo': tipo,
+            'mes': mes,
+            'numero': None,
+            'fecha': None,
+            'cliente': None,
+            'base': round(self.base, 2),
+            'iva': round(self.iva, 2),
+            'total': round(self.total, 2),
+            'facturas': self.facturas,
+        }
+
+
+def filas_libro(facturas):
+    """
+    Convierte las facturas (ordenadas por fecha, como las devuelve
+    Catalogo.recorrer) en las filas del libro con los totales por mes
+    """
+    mes_actual = None
+    del_mes = _Acumulado()
+    del_periodo = _Acumulado()
+
+    for factura in facturas:
+        mes = factura['fecha_iso'][:7]
+        if mes_actual is not None and mes != mes_actual:
+            yield del_mes.fila(TIPO_TOTAL_MES, mes_actual)
+            del_mes = _Acumulado()
+        mes_actual = mes
+
+        base = factura['subtotal'] or 0.0
+        iva = factura['iva'] or 0.0
+        total = factura['total'] or 0.0
+        del_mes.sumar(base, iva, total)
+        del_periodo.sumar(base, iva, total)
+        yield {
+            'tipo': TIPO_FACTURA,
+            'mes': mes,
+            'numero': factura['numero'],
+            'fecha': factura['fecha'],
+            'cliente': factura['cliente'],
+            'base': base,
+            'iva': iva,
+            'total': total,
+            'facturas': None,
+        }
+
+    if mes_actual is not None:
+        yield del_mes.fila(TIPO_TOTAL_MES, mes_actual)
+    yield del_periodo.fila(TIPO_TOTAL, None)
+
+
+def exportar_csv(facturas, filas_por_bloque=500):
+    """Genera el libro en CSV como trozos de texto de filas_por_bloque filas"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS)
+    for i, fila in enumerate(filas_libro(facturas), 1):
+        escritor.writerow([fila[c] for c in COLUMNAS])
+        if i % filas_por_bloque == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def exportar_parquet(facturas, destino, filas_por_grupo=10000):
+    """
+    Escribe el libro en Parquet en destino (ruta o archivo binario),
+    un grupo de filas cada filas_por_grupo filas
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise FormatoNoDisponible('La exportación a Parquet necesita pyarrow (pip install pyarrow)')
+
+    esquema = pa.schema([
+        ('tipo', pa.string()),
+        ('mes', pa.string()),
+        ('numero', pa.string()),
+        ('fecha', pa.string()),
+        ('cliente', pa.string()),
+        ('base', pa.float64()),
+        ('iva', pa.float64()),
+        ('total', pa.float64()),
+        ('facturas', pa.int64()),
+    ])
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as escritor:
+        grupo = []
+        for fila in filas_libro(facturas):
+            grupo.append(fila)
+            if len(grupo) == filas_por_grupo:
+                escritor.write_table(pa.Table.from_pylist(grupo, schema=esquema))
+                grupo = []
+        if grupo:
+            escritor.write_table(pa.Table.from_pylist(grupo, schema=esquema))
@@ -0,0 +1,46 @@
+"""
+Numeración correlativa de facturas, compartida entre procesos
+
+Los contadores viven en la base del catálogo (tabla series): una serie
+por año y números correlativos dentro de ella (2026-000123). Solo numera
+pdf-service, y solo las facturas que va a guardar.
+
+Cada número se toma dentro de la misma transacción BEGIN IMMEDIATE que
+registra la factura en el catálogo (ver Catalogo.reservar), de uno en
+uno: los números salen en orden, un número tomado siempre tiene su fila
+y nunca se devuelve a la serie. Si el proceso muere antes de escribir el
+PDF, la factura queda pendiente con su número (se completa al
+reintentarla o con flask regenerar-pendientes).
+"""
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    serie     TEXT PRIMARY KEY,
+    siguiente INTEGER NOT NULL
+);
+"""
+
+DIGITOS = 6
+
+
+def formatear(serie, numero):
+    """2026, 123 -> 2026-000123"""
+    return f"{serie}-{numero:0{DIGITOS}d}"
+
+
+def tomar_numero(con, serie, ocupado):
+    """
+    Toma el siguiente número de la serie dentro de la transacción abierta
+    en con y lo devuelve formateado. Salta los que ocupado(numero) da por
+    usados: facturas que llegaron con ese número, o las de antes de que
+    la serie estuviera en esta base
+    """
+    fila = con.execute('SELECT siguiente FROM series WHERE serie = ?', (serie,)).fetchone()
+    siguiente = fila[0] if fila else 1
+    while ocupado(formatear(serie, siguiente)):
+        siguiente += 1
+    con.execute(
+        'INSERT OR REPLACE INTO series (serie, siguiente) VALUES (?, ?)',
+        (serie, siguiente + 1)
+    )
+    return formatear(serie, siguiente)
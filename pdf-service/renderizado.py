@@ -0,0 +1,521 @@
+"""
+Render de las facturas con ReportLab
+
+Es la parte pesada del servicio: importar ReportLab y Pillow, cargar las
+fuentes y codificar el logo. app.py no la importa al arrancar, sino al
+precalentar o la primera vez que genera una factura (ver arranque), así
+que /health, /info y /facturas no la necesitan.
+"""
+from contextlib import nullcontext
+import copy
+import io
+import json
+import os
+import threading
+import time
+
+from PIL import Image
+import reportlab
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.pdfgen import canvas
+from prometheus_client import Counter, Histogram
+
+from ajustes import DATOS_EMPRESA, IVA, LOGO_PATH, PERFIL
+
+# Tiempo de cada etapa de renderizar_factura y facturas renderizadas
+ETAPA = Histogram(
+    'pdf_service_render_stage_duration_seconds',
+    'Tiempo de cada etapa de generar_factura_pdf',
+    ['etapa'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+)
+FACTURAS = Counter(
+    'pdf_service_invoices_rendered_total', 'Facturas renderizadas'
+)
+
+# ReportLab lo lee al crear cada stream, así que vale para todo el proceso
+rl_config.useA85 = 1 if PERFIL['ascii85'] else 0
+
+# Geometría fija de la página y de la tabla de productos
+ANCHO_PAGINA, ALTO_PAGINA = A4
+TABLA_X = 25*mm
+TABLA_WIDTH = ANCHO_PAGINA - 50*mm
+COL_WIDTHS = [
+    TABLA_WIDTH * 0.40,  # Producto
+    TABLA_WIDTH * 0.15,  # Cantidad
+    TABLA_WIDTH * 0.15,  # Base
+    TABLA_WIDTH * 0.15,  # IVA
+    TABLA_WIDTH * 0.15   # Total
+]
+
+# Paginación de la tabla: alto de cada fila, posición de la cabecera de la
+# tabla en las páginas de continuación y espacio reservado al pie
+ALTO_FILA = 8*mm
+ALTO_ARRASTRE = 8*mm
+ALTO_TOTALES = 27*mm
+MARGEN_INFERIOR = 20*mm
+Y_TABLA_CONTINUACION = ALTO_PAGINA - 60*mm
+
+# Nombres de los form XObjects con las partes fijas de la factura
+FORM_CABECERA_EMPRESA = 'cabecera_empresa'
+FORM_CABECERA_TABLA = 'cabecera_tabla'
+
+# Versiones de ReportLab en las que se ha comprobado la copia del logo ya
+# codificado entre documentos (_registrar_logo usa su estructura interna).
+# Con otra versión, o si la comprobación de _cargar_logo falla, el logo se
+# dibuja solo con drawImage y se codifica en cada factura (más lento)
+VERSIONES_COPIA_LOGO = ('4.0.',)
+
+# Logo ya decodificado y codificado para PDF; se invalida cuando cambia
+# el mtime del archivo
+_logo_cache = {'mtime': None, 'reader': None, 'mask': None, 'xobjects': []}
+_logo_lock = threading.Lock()
+
+
+def _abrir_logo():
+    """
+    Devuelve el logo (ruta o imagen PIL) con la resolución del perfil: si
+    tiene más píxeles de los que caben en 20 mm a logo_dpi, se reduce
+    """
+    dpi = PERFIL['logo_dpi']
+    if not dpi:
+        return LOGO_PATH
+    imagen = Image.open(LOGO_PATH)
+    lado = round(20 / 25.4 * dpi)
+    if max(imagen.size) <= lado:
+        return LOGO_PATH
+    imagen.thumbnail((lado, lado), Image.LANCZOS)
+    return imagen
+
+
+def _cargar_logo():
+    """
+    Decodifica el logo una sola vez y averigua si admite mask='auto'
+    Devuelve (ImageReader, mask, xobjects) o (None, None, []) si no se
+    puede dibujar. xobjects son las imágenes ya comprimidas (logo y su
+    máscara de transparencia) tal como las genera ReportLab, o [] si no
+    se pueden copiar entre documentos (ver VERSIONES_COPIA_LOGO)
+    """
+    reader = ImageReader(_abrir_logo())
+    reader.getRGBData()
+    
+    # Probar en un canvas desechable, igual que el intento doble original
+    for mask in ('auto', None):
+        try:
+            prueba = _canvas_prueba()
+            prueba.drawImage(reader, 0, 0, width=20*mm, height=20*mm,
+                             preserveAspectRatio=True, mask=mask)
+        except Exception:
+            continue
+        return reader, mask, _xobjects_logo(prueba, reader, mask)
+    return None, None, []
+
+
+def _canvas_prueba():
+    return canvas.Canvas(io.BytesIO(), pagesize=A4, pageCompression=PERFIL['compresion'])
+
+
+def _xobjects_logo(prueba, reader, mask):
+    """
+    Imágenes del logo codificadas en el canvas de prueba, si la copia a
+    otros documentos funciona con esta versión de ReportLab: se comprueba
+    en un segundo canvas que drawImage las reutiliza y que el PDF se
+    escribe. Si no, [] (el logo se codifica en cada factura)
+    """
+    if not reportlab.Version.startswith(VERSIONES_COPIA_LOGO):
+        return []
+    try:
+        xobjects = [
+            obj for obj in prueba._doc.idToObject.values()
+            if isinstance(obj, PDFImageXObject)
+        ]
+        copia = _canvas_prueba()
+        _registrar_logo(copia, xobjects)
+        copia.drawImage(reader, 0, 0, width=20*mm, height=20*mm,
+                        preserveAspectRatio=True, mask=mask)
+        imagenes = [
+            obj for obj in copia._doc.idToObject.values()
+            if isinstance(obj, PDFImageXObject)
+        ]
+        copia.save()
+    except Exception:
+        return []
+    # drawImage no debe haber codificado imágenes nuevas
+    return xobjects if len(imagenes) == len(xobjects) else []
+
+
+def obtener_logo():
+    """
+    Devuelve el logo cacheado como (ImageReader, mask, xobjects)
+    Solo se vuelve a leer si el mtime del archivo ha cambiado
+    """
+    try:
+        mtime = os.stat(LOGO_PATH).st_mtime_ns
+    except OSError:
+        return None, None, []
+    
+    with _logo_lock:
+        if _logo_cache['mtime'] != mtime:
+            try:
+                reader, mask, xobjects = _cargar_logo()
+            except Exception:
+                reader, mask, xobjects = None, None, []
+            _logo_cache.update({
+                'mtime': mtime,
+                'reader': reader,
+                'mask': mask,
+                'xobjects': xobjects
+            })
+        return _logo_cache['reader'], _logo_cache['mask'], _logo_cache['xobjects']
+
+
+def _registrar_logo(c, xobjects):
+    """
+    Registra en el documento una copia de las imágenes ya codificadas del
+    logo. Así drawImage las encuentra por su nombre y no vuelve a
+    comprimirlas ni a codificarlas en cada factura. Usa la estructura
+    interna del documento de ReportLab: solo se llama con xobjects que
+    _xobjects_logo ha comprobado con la versión instalada
+    """
+    doc = c._doc
+    for obj in xobjects:
+        nombre_interno = doc.getXObjectName(obj.name)
+        if nombre_interno not in doc.idToObject:
+            copia = copy.copy(obj)
+            copia.__dict__.pop('__InternalName__', None)
+            doc.Reference(copia, nombre_interno)
+
+
+def definir_formularios(c):
+    """
+    Define en el documento los form XObjects con las partes que no cambian
+    entre facturas: logo + datos de la empresa y cabecera de la tabla.
+    Cada página solo los referencia con doForm
+    """
+    # ===== LOGO Y DATOS EMPRESA (ESQUINA SUPERIOR IZQUIERDA) =====
+    c.beginForm(FORM_CABECERA_EMPRESA)
+    y_pos = ALTO_PAGINA - 30*mm
+    
+    # Logo (si existe)
+    logo, mask, xobjects = obtener_logo()
+    if logo is not None:
+        if xobjects:
+            _registrar_logo(c, xobjects)
+        c.drawImage(logo, 25*mm, y_pos, width=20*mm, height=20*mm,
+                    preserveAspectRatio=True, mask=mask)
+    
+    # Datos empresa
+    c.setFont("Helvetica", 9)
+    c.setFillColor(colors.black)
+    text_x = 25*mm
+    text_y = y_pos - 5*mm
+    c.drawString(text_x, text_y, DATOS_EMPRESA['direccion'])
+    text_y -= 4*mm
+    c.drawString(text_x, text_y, DATOS_EMPRESA['cp'])
+    text_y -= 4*mm
+    c.drawString(text_x, text_y, DATOS_EMPRESA['email'])
+    text_y -= 4*mm
+    c.drawString(text_x, text_y, DATOS_EMPRESA['telefono'])
+    c.endForm()
+    
+    # ===== CABECERA DE LA TABLA (relativa a la línea base y=0) =====
+    c.beginForm(FORM_CABECERA_TABLA, lowerx=0, lowery=-10*mm,
+                upperx=ANCHO_PAGINA, uppery=10*mm)
+    c.setFont("Helvetica-Bold", 9)
+    c.setFillColor(colors.black)
+    
+    x_offset = TABLA_X
+    c.drawString(x_offset + 2*mm, 0, "Producto")
+    x_offset += COL_WIDTHS[0]
+    c.drawCentredString(x_offset + COL_WIDTHS[1]/2, 0, "Cantidad")
+    x_offset += COL_WIDTHS[1]
+    c.drawRightString(x_offset + COL_WIDTHS[2] - 2*mm, 0, "Base")
+    x_offset += COL_WIDTHS[2]
+    c.drawRightString(x_offset + COL_WIDTHS[3] - 2*mm, 0, "IVA")
+    x_offset += COL_WIDTHS[3]
+    c.drawRightString(x_offset + COL_WIDTHS[4] - 2*mm, 0, "Total")
+    
+    # Línea debajo de cabecera
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(0.5)
+    c.line(TABLA_X, -4*mm, TABLA_X + TABLA_WIDTH, -4*mm)
+    c.endForm()
+
+
+def _dibujar_encabezado(c, factura_num, fecha, cliente, pagina):
+    """
+    Dibuja la parte superior de una página de la factura
+    La primera página lleva los datos del cliente; las siguientes solo el
+    número de factura, para dejar más sitio a la tabla
+    Devuelve la posición y de la cabecera de la tabla
+    """
+    width, height = A4
+    
+    # Partes fijas (logo, empresa) como form XObject
+    c.doForm(FORM_CABECERA_EMPRESA)
+    
+    # ===== DATOS FACTURA (ESQUINA SUPERIOR DERECHA) =====
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 11)
+    factura_x = width - 70*mm
+    factura_y = height - 30*mm
+    c.drawRightString(factura_x + 50*mm, factura_y, f"FACTURA: {factura_num}")
+    c.setFont("Helvetica", 10)
+    factura_y -= 6*mm
+    c.drawRightString(factura_x + 50*mm, factura_y, f"Fecha: {fecha}")
+    
+    if pagina > 1:
+        factura_y -= 6*mm
+        c.drawRightString(factura_x + 50*mm, factura_y, f"Página {pagina}")
+        return Y_TABLA_CONTINUACION
+    
+    # ===== SECCIÓN DATOS CLIENTE =====
+    y_pos = height - 75*mm
+    
+    # Línea superior
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(0.5)
+    c.line(25*mm, y_pos, width - 25*mm, y_pos)
+    
+    y_pos -= 8*mm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(25*mm, y_pos, "Datos cliente")
+    
+    y_pos -= 6*mm
+    c.setFont("Helvetica", 9)
+    c.drawString(25*mm, y_pos, f"Nombre: {cliente}")
+    
+    y_pos -= 8*mm
+    # Línea inferior
+    c.line(25*mm, y_pos, width - 25*mm, y_pos)
+    
+    # ===== TABLA DE PRODUCTOS =====
+    return y_pos - 15*mm
+
+
+def _dibujar_cabecera_tabla(c, y_pos):
+    """Referencia la cabecera de la tabla y devuelve la y de la primera fila"""
+    c.saveState()
+    c.translate(0, y_pos)
+    c.doForm(FORM_CABECERA_TABLA)
+    c.restoreState()
+    return y_pos - 12*mm
+
+
+def _dibujar_arrastre(c, y_pos, etiqueta, subtotal, iva, total):
+    """
+    Dibuja una fila de suma parcial ("Suma y sigue" al pie de una página,
+    "Suma anterior" al principio de la siguiente)
+    """
+    c.setFont("Helvetica-Bold", 9)
+    c.setFillColor(colors.black)
+    
+    x_offset = TABLA_X
+    c.drawString(x_offset + 2*mm, y_pos, etiqueta)
+    x_offset += COL_WIDTHS[0] + COL_WIDTHS[1]
+    c.drawRightString(x_offset + COL_WIDTHS[2] - 2*mm, y_pos, f"{subtotal:.2f} €")
+    x_offset += COL_WIDTHS[2]
+    c.drawRightString(x_offset + COL_WIDTHS[3] - 2*mm, y_pos, f"{iva:.2f} €")
+    x_offset += COL_WIDTHS[3]
+    c.drawRightString(x_offset + COL_WIDTHS[4] - 2*mm, y_pos, f"{total:.2f} €")
+    
+    c.setFont("Helvetica", 9)
+
+
+def renderizar_factura(destino, factura_num, fecha, cliente, items_raw, huella=None):
+    """
+    Genera el PDF con el diseño exacto de tu aplicación Tkinter
+    Mantiene el mismo estilo limpio y profesional
+    
+    destino puede ser una ruta o un objeto tipo archivo (BytesIO)
+    items_raw puede ser cualquier iterable (también un generador): los
+    productos se consumen de uno en uno y la tabla continúa en páginas
+    nuevas, con la cabecera repetida y las sumas parciales arrastradas
+    huella (ver huella_factura) se guarda en los metadatos para que
+    reindexar la recupere
+    """
+    _renderizar(destino, factura_num, fecha, cliente, items_raw, huella, medir=True)
+
+
+def _etapa(nombre, medir):
+    """Cronómetro de la etapa en el histograma, o nada si medir es False"""
+    return ETAPA.labels(nombre).time() if medir else nullcontext()
+
+
+def _renderizar(destino, factura_num, fecha, cliente, items_raw, huella, medir):
+    """
+    Cuerpo de renderizar_factura; con medir=False no toca las métricas
+    (lo usa precalentar, que no es una factura)
+    """
+    
+    # Crear el canvas para dibujar
+    c = canvas.Canvas(destino, pagesize=A4, pageCompression=PERFIL['compresion'])
+    width, height = A4
+    
+    # Partes fijas (logo, empresa, cabecera de tabla) como form XObjects
+    with _etapa('logo', medir):
+        definir_formularios(c)
+    
+    inicio_dibujo = time.perf_counter()
+    pagina = 1
+    y_pos = _dibujar_encabezado(c, factura_num, fecha, cliente, pagina)
+    
+    # Dimensiones de la tabla
+    tabla_x = TABLA_X
+    tabla_width = TABLA_WIDTH
+    col_widths = COL_WIDTHS
+    
+    # Cabecera de la tabla
+    y_pos = _dibujar_cabecera_tabla(c, y_pos)
+    
+    # Dibujar filas de productos
+    c.setFont("Helvetica", 9)
+    
+    # Calcular totales
+    num_items = 0
+    subtotal_acumulado = 0
+    iva_acumulado = 0
+    total_acumulado = 0
+    
+    def salto_de_pagina(y_pos):
+        """Cierra la página con la suma parcial y abre la siguiente"""
+        nonlocal pagina
+        
+        # Línea final de tabla y "Suma y sigue"
+        c.setStrokeColor(colors.black)
+        c.setLineWidth(0.5)
+        c.line(tabla_x, y_pos + 4*mm, tabla_x + tabla_width, y_pos + 4*mm)
+        _dibujar_arrastre(c, y_pos - 2*mm, "Suma y sigue",
+                          subtotal_acumulado, iva_acumulado, total_acumulado)
+        c.showPage()
+        
+        pagina += 1
+        y_pos = _dibujar_encabezado(c, factura_num, fecha, cliente, pagina)
+        y_pos = _dibujar_cabecera_tabla(c, y_pos)
+        _dibujar_arrastre(c, y_pos, "Suma anterior",
+                          subtotal_acumulado, iva_acumulado, total_acumulado)
+        return y_pos - ALTO_FILA
+    
+    for item in items_raw:
+        # Si la fila no cabe junto con la suma parcial, pasar de página
+        if y_pos - ALTO_FILA < MARGEN_INFERIOR + ALTO_ARRASTRE:
+            y_pos = salto_de_pagina(y_pos)
+        
+        concepto = item['producto']
+        cantidad = item['cantidad']
+        precio_base = item['base'] / cantidad  # Precio unitario sin IVA
+        
+        x_offset = tabla_x
+        c.drawString(x_offset + 2*mm, y_pos, concepto[:50])
+        
+        x_offset += col_widths[0]
+        c.drawCentredString(x_offset + col_widths[1]/2, y_pos, str(cantidad))
+        
+        x_offset += col_widths[1]
+        c.drawRightString(x_offset + col_widths[2] - 2*mm, y_pos, f"{precio_base:.2f} €")
+        
+        x_offset += col_widths[2]
+        iva_item = precio_base * IVA
+        c.drawRightString(x_offset + col_widths[3] - 2*mm, y_pos, f"{iva_item:.2f} €")
+        
+        x_offset += col_widths[3]
+        total_item = item['total']
+        c.drawRightString(x_offset + col_widths[4] - 2*mm, y_pos, f"{total_item:.2f} €")
+        
+        # Acumular totales
+        num_items += 1
+        subtotal_acumulado += item['base']
+        iva_acumulado += item['iva']
+        total_acumulado += item['total']
+        
+        # Línea separadora fina
+        y_pos -= 4*mm
+        c.setStrokeColor(colors.lightgrey)
+        c.setLineWidth(0.3)
+        c.line(tabla_x, y_pos, tabla_x + tabla_width, y_pos)
+        y_pos -= 4*mm
+    
+    # Los totales necesitan su propio hueco al final de la tabla
+    if y_pos - ALTO_TOTALES < MARGEN_INFERIOR:
+        y_pos = salto_de_pagina(y_pos)
+    
+    # Línea final de tabla
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(0.5)
+    c.line(tabla_x, y_pos + 4*mm, tabla_x + tabla_width, y_pos + 4*mm)
+    
+    # ===== TOTALES (PARTE INFERIOR DERECHA) =====
+    y_pos -= 10*mm
+    totales_x = width - 65*mm
+    totales_label_x = totales_x - 35*mm
+    
+    c.setFont("Helvetica", 9)
+    
+    # Base Imponible
+    c.drawString(totales_label_x, y_pos, "Base Imponible")
+    c.drawRightString(totales_x + 40*mm, y_pos, f"{subtotal_acumulado:.2f} €")
+    
+    # IVA
+    y_pos -= 6*mm
+    c.drawString(totales_label_x, y_pos, "IVA")
+    c.drawCentredString(totales_x + 10*mm, y_pos, "10%")
+    c.drawRightString(totales_x + 40*mm, y_pos, f"{iva_acumulado:.2f} €")
+    
+    # Línea antes del total
+    y_pos -= 4*mm
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(0.5)
+    c.line(totales_label_x, y_pos, totales_x + 40*mm, y_pos)
+    
+    # Total
+    y_pos -= 7*mm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(totales_label_x, y_pos, "Total")
+    c.drawRightString(totales_x + 40*mm, y_pos, f"{total_acumulado:.2f} €")
+    
+    # Metadatos del documento (el catálogo los usa para reindexar)
+    c.setTitle(f"Factura {factura_num}")
+    c.setAuthor(DATOS_EMPRESA['nombre'])
+    c.setSubject(f"Factura {factura_num} - {cliente}")
+    metadatos = {
+        'numero': factura_num,
+        'fecha': fecha,
+        'cliente': cliente,
+        'subtotal': round(subtotal_acumulado, 2),
+        'iva': round(iva_acumulado, 2),
+        'total': round(total_acumulado, 2),
+        'num_items': num_items
+    }
+    if huella:
+        metadatos['huella'] = huella
+    c.setKeywords(json.dumps(metadatos))
+    
+    if medir:
+        ETAPA.labels('dibujo').observe(time.perf_counter() - inicio_dibujo)
+    
+    # Guardar PDF
+    with _etapa('guardado', medir):
+        c.save()
+    if medir:
+        FACTURAS.inc()
+
+
+def precalentar():
+    """
+    Prepara lo que necesitaría el primer render: logo decodificado,
+    métricas de las fuentes y el resto del camino de ReportLab, sin
+    contar en las métricas de facturas
+    """
+    obtener_logo()
+    _renderizar(io.BytesIO(), 'PRECALENTAR', '01/01/2000', 'Cliente', [{
+        'producto': 'Ramo de rosas',
+        'cantidad': 1,
+        'base': 10.0,
+        'iva': 1.0,
+        'total': 11.0
+    }], None, medir=False)
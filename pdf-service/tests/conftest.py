@@ -0,0 +1,45 @@
+"""
+Configuración común de las pruebas de pdf-service
+
+app lee INVOICES_DIR al importarse: se apunta a un directorio temporal
+antes de importarla. Cada prueba trabaja además con su propio catálogo y
+almacén (fixture servicio).
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['INVOICES_DIR'] = tempfile.mkdtemp(prefix='pdf-service-pruebas-')
+
+import app as servicio_pdf  # noqa: E402
+from almacen import Almacen  # noqa: E402
+from catalogo import Catalogo  # noqa: E402
+
+
+def factura(**cambios):
+    """Factura válida sin número; cambios sustituye campos"""
+    data = {
+        'fecha': '15/03/2025',
+        'cliente': {'nombre': 'María García'},
+        'items': [
+            {'producto': 'Ramo de rosas', 'cantidad': 1, 'base': 35.0, 'iva': 3.5, 'total': 38.5}
+        ]
+    }
+    data.update(cambios)
+    return data
+
+
+@pytest.fixture
+def servicio(tmp_path, monkeypatch):
+    """El módulo app con un catálogo y un almacén vacíos en tmp_path"""
+    monkeypatch.setattr(servicio_pdf, 'catalogo', Catalogo(str(tmp_path / 'catalogo.db')))
+    monkeypatch.setattr(servicio_pdf, 'almacen', Almacen(str(tmp_path)))
+    return servicio_pdf
+
+
+@pytest.fixture
+def cliente(servicio):
+    return servicio.app.test_client()
@@ -0,0 +1,73 @@
+"""Reenvíos: Idempotency-Key, números repetidos y escritura tras la respuesta"""
+from conftest import factura
+
+
+def test_misma_clave_devuelve_la_misma_factura(cliente):
+    primera = cliente.post('/generar-factura', json=factura(), headers={'Idempotency-Key': 'k1'})
+    segunda = cliente.post('/generar-factura', json=factura(), headers={'Idempotency-Key': 'k1'})
+
+    assert primera.status_code == 201
+    assert segunda.status_code == 200
+    assert segunda.headers['Idempotent-Replayed'] == 'true'
+    assert segunda.get_json()['factura']['numero'] == primera.get_json()['factura']['numero']
+
+
+def test_sin_clave_dos_pedidos_iguales_son_dos_facturas(cliente):
+    primera = cliente.post('/generar-factura', json=factura())
+    segunda = cliente.post('/generar-factura', json=factura())
+
+    assert segunda.status_code == 201
+    assert segunda.get_json()['factura']['numero'] != primera.get_json()['factura']['numero']
+
+
+def test_clave_reutilizada_con_otros_datos_da_422(cliente):
+    cliente.post('/generar-factura', json=factura(), headers={'Idempotency-Key': 'k2'})
+    otra = factura(cliente={'nombre': 'Otro cliente'})
+
+    for url in ('/generar-factura', '/generar-factura?formato=pdf', '/generar-factura?async=1'):
+        respuesta = cliente.post(url, json=otra, headers={'Idempotency-Key': 'k2'})
+        assert respuesta.status_code == 422, url
+
+
+def test_numero_usado_con_otros_datos_da_409(cliente):
+    assert cliente.post('/generar-factura', json=factura(numero='A-1')).status_code == 201
+    otra = factura(numero='A-1', cliente={'nombre': 'Otro cliente'})
+
+    for url in ('/generar-factura', '/generar-factura?formato=pdf', '/generar-factura?async=1'):
+        assert cliente.post(url, json=otra).status_code == 409, url
+
+    respuesta = cliente.post('/generar-factura?sobrescribir=1', json=otra)
+    assert respuesta.status_code == 201
+    assert respuesta.get_json()['factura']['cliente'] == 'Otro cliente'
+
+
+def test_numero_repetido_en_un_lote_con_otros_datos_da_409(cliente):
+    lote = [factura(numero='L-1'), factura(numero='L-1', cliente={'nombre': 'Otro cliente'})]
+    resultados = cliente.post('/generar-facturas', json=lote).get_json()['resultados']
+
+    assert resultados[0]['success']
+    assert resultados[1]['estado'] == 409
+
+
+def test_reintento_mientras_se_escribe_el_pdf(servicio, cliente):
+    cabeceras = {'Idempotency-Key': 'k3', 'Accept': 'application/pdf'}
+    primera = cliente.post('/generar-factura', json=factura(), headers=cabeceras)
+    assert primera.status_code == 201
+    numero = primera.headers['X-Factura-Numero']
+    filename = f'factura_{numero}.pdf'
+
+    # Antes de cerrar la respuesta, la factura ya está registrada
+    # (pendiente) y el PDF aún no está en disco
+    fila = servicio.catalogo.obtener(filename)
+    assert fila['estado'] == 'pendiente'
+    assert servicio.almacen.localizar(filename, fila['fecha_iso']) is None
+
+    reintento = cliente.post('/generar-factura', json=factura(), headers=cabeceras)
+    assert reintento.status_code == 200
+    assert reintento.headers['X-Factura-Numero'] == numero
+
+    reintento.close()
+    primera.close()
+    assert servicio.catalogo.obtener(filename)['estado'] == 'generada'
+    assert servicio.almacen.localizar(filename, fila['fecha_iso']) is not None
+    assert servicio.catalogo.buscar()[0] == 1
@@ -0,0 +1,73 @@
+"""Numeración de las facturas sin número (ver numeracion y Catalogo.reservar)"""
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+
+from catalogo import Catalogo
+from conftest import factura
+
+
+def _reservar_varias(ruta_db, proceso, cantidad):
+    catalogo = Catalogo(ruta_db)
+    numeros = []
+    for i in range(cantidad):
+        fila, nueva = catalogo.reservar(
+            {'numero': None, 'huella': f'{proceso}-{i}', 'fecha': '01/01/2026', 'datos': {}},
+            serie='2026'
+        )
+        assert nueva
+        numeros.append(fila['numero'])
+    return numeros
+
+
+def test_procesos_en_paralelo_no_repiten_ni_dejan_huecos(tmp_path):
+    ruta_db = str(tmp_path / 'catalogo.db')
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        por_proceso = pool.starmap(_reservar_varias, [(ruta_db, p, 25) for p in range(4)])
+
+    numeros = sorted(n for numeros in por_proceso for n in numeros)
+    assert numeros == [f'2026-{n:06d}' for n in range(1, 101)]
+    # Cada proceso recibe sus números en orden
+    for numeros in por_proceso:
+        assert numeros == sorted(numeros)
+
+
+def test_peticiones_en_paralelo_reciben_numeros_distintos(servicio):
+    def generar(_):
+        respuesta = servicio.app.test_client().post('/generar-factura', json=factura())
+        assert respuesta.status_code == 201
+        return respuesta.get_json()['factura']['numero']
+
+    with ThreadPoolExecutor(8) as hilos:
+        numeros = list(hilos.map(generar, range(16)))
+    assert sorted(numeros) == [f'2025-{n:06d}' for n in range(1, 17)]
+
+
+def test_salta_los_numeros_que_ya_existen(cliente):
+    assert cliente.post('/generar-factura', json=factura(numero='2025-000001')).status_code == 201
+
+    respuesta = cliente.post('/generar-factura', json=factura())
+    assert respuesta.get_json()['factura']['numero'] == '2025-000002'
+
+
+def test_un_fallo_al_generar_no_devuelve_el_numero(servicio, cliente, monkeypatch):
+    generar_factura_pdf = servicio.generar_factura_pdf
+
+    def falla(*args, **kwargs):
+        raise OSError('disco lleno')
+
+    monkeypatch.setattr(servicio, 'generar_factura_pdf', falla)
+    respuesta = cliente.post('/generar-factura', json=factura(), headers={'Idempotency-Key': 'fallo'})
+    assert respuesta.status_code == 500
+    pendientes = servicio.catalogo.pendientes()
+    assert [fila['numero'] for fila in pendientes] == ['2025-000001']
+
+    # La siguiente factura no reutiliza el número de la que falló
+    monkeypatch.setattr(servicio, 'generar_factura_pdf', generar_factura_pdf)
+    respuesta = cliente.post('/generar-factura', json=factura(cliente={'nombre': 'Otro'}))
+    assert respuesta.get_json()['factura']['numero'] == '2025-000002'
+
+    # El reintento con la misma clave completa la pendiente con su número
+    respuesta = cliente.post('/generar-factura', json=factura(), headers={'Idempotency-Key': 'fallo'})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['factura']['numero'] == '2025-000001'
+    assert servicio.catalogo.pendientes() == []
@@ -33,6 +33,7 @@ echo -e "${YELLOW}📋 Paso 1: Verificando estructura de directorios...${NC}"
 # Crear directorios necesarios
 mkdir -p volumes/invoices
 mkdir -p volumes/n8n
+mkdir -p volumes/perfiles
 
 echo -e "${GREEN}✓ Directorios creados/verificados${NC}"
 echo ""
@@ -70,6 +71,14 @@ fi
 echo -e "${GREEN}✓ Todos los archivos necesarios están presentes${NC}"
 echo ""
 
+# Módulos que ai-mock y pdf-service comparten (cada uno lleva su copia)
+echo -e "${YELLOW}📋 Comprobando módulos compartidos...${NC}"
+if ! ./comprobar_compartidos.sh; then
+    echo "   Copia la versión correcta en ai-mock/ y pdf-service/"
+    exit 1
+fi
+echo ""
+
 # Verificar logo
 echo -e "${YELLOW}📋 Paso 3: Verificando logo...${NC}"
 if [ -f "volumes/logo.png" ]; then
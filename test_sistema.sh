@@ -23,6 +23,16 @@ check_response() {
     fi
 }
 
+# check_status esperado obtenido: sale del script si no coinciden
+check_status() {
+    if [ "$2" = "$1" ]; then
+        echo -e "${GREEN}  ✓ HTTP $2${NC}"
+    else
+        echo -e "${RED}  ✗ FALLO: HTTP $2 (se esperaba $1)${NC}"
+        exit 1
+    fi
+}
+
 # 1. Health checks
 echo -e "${BLUE}📋 Paso 1: Verificando servicios...${NC}"
 
@@ -34,6 +44,14 @@ echo -n "  - Mock IA (5001): "
 response=$(curl -s -o /dev/null -w "%{http_code}" http://localhost:5001/health)
 check_response $response
 
+echo -n "  - PDF Service listo (/ready): "
+response=$(curl -s -o /dev/null -w "%{http_code}" http://localhost:5000/ready)
+check_response $response
+
+echo -n "  - Mock IA listo (/ready): "
+response=$(curl -s -o /dev/null -w "%{http_code}" http://localhost:5001/ready)
+check_response $response
+
 echo -n "  - n8n (5678): "
 response=$(curl -s -o /dev/null -w "%{http_code}" http://localhost:5678/healthz)
 check_response $response
@@ -56,12 +74,17 @@ echo -e "${YELLOW}  Texto del mensaje de WhatsApp:${NC}"
 echo "  '$TEXTO_PEDIDO'"
 echo ""
 
-RESPONSE_IA=$(curl -s -X POST http://localhost:5001/procesar-pedido \
+# Sin número: pdf-service le da el siguiente de la serie, así que el
+# script se puede repetir sin chocar con facturas anteriores
+RESPONSE_IA=$(curl -s -w "\n%{http_code}" -X POST http://localhost:5001/procesar-pedido \
   -H "Content-Type: application/json" \
-  -d "{\"texto\": \"$TEXTO_PEDIDO\", \"numero\": \"2025-001\"}")
+  -d "{\"texto\": \"$TEXTO_PEDIDO\"}")
+STATUS_IA=$(echo "$RESPONSE_IA" | tail -n 1)
+RESPONSE_IA=$(echo "$RESPONSE_IA" | sed '$d')
 
 echo -e "${YELLOW}  Respuesta del procesador IA:${NC}"
 echo "$RESPONSE_IA" | python3 -m json.tool
+check_status 200 "$STATUS_IA"
 echo ""
 
 # Extraer JSON de factura
@@ -75,12 +98,15 @@ fi
 # 4. Generar PDF
 echo -e "${BLUE}📋 Paso 4: Generando PDF de la factura...${NC}"
 
-RESPONSE_PDF=$(curl -s -X POST http://localhost:5000/generar-factura \
+RESPONSE_PDF=$(curl -s -w "\n%{http_code}" -X POST http://localhost:5000/generar-factura \
   -H "Content-Type: application/json" \
   -d "$FACTURA_JSON")
+STATUS_PDF=$(echo "$RESPONSE_PDF" | tail -n 1)
+RESPONSE_PDF=$(echo "$RESPONSE_PDF" | sed '$d')
 
 echo -e "${YELLOW}  Respuesta del generador PDF:${NC}"
 echo "$RESPONSE_PDF" | python3 -m json.tool
+check_status 201 "$STATUS_PDF"
 echo ""
 
 FILENAME=$(echo "$RESPONSE_PDF" | python3 -c "import sys, json; print(json.load(sys.stdin)['factura']['filename'])" 2>/dev/null)
@@ -88,13 +114,20 @@ FILENAME=$(echo "$RESPONSE_PDF" | python3 -c "import sys, json; print(json.load(
 # 5. Verificar archivo
 echo -e "${BLUE}📋 Paso 5: Verificando archivo generado...${NC}"
 
-if [ -n "$FILENAME" ] && [ -f "invoices/$FILENAME" ]; then
+# Las facturas se guardan en carpetas YYYY/MM (o YYYY/MM.zip una vez
+# compactado el mes): se comprueba con la descarga, no con la ruta
+DESCARGA=$(curl -s -o /dev/null -w "%{http_code} %{content_type} %{size_download}" \
+  "http://localhost:5000/factura/$FILENAME")
+read -r STATUS_DESCARGA TIPO_DESCARGA BYTES_DESCARGA <<< "$DESCARGA"
+
+if [ -n "$FILENAME" ] && [ "$STATUS_DESCARGA" = "200" ] && [ "$TIPO_DESCARGA" = "application/pdf" ]; then
     echo -e "${GREEN}✓ PDF generado exitosamente${NC}"
     echo ""
-    ls -lh "invoices/$FILENAME"
+    echo "  $FILENAME ($BYTES_DESCARGA bytes)"
     echo ""
 else
-    echo -e "${RED}✗ No se encontró el archivo PDF${NC}"
+    echo -e "${RED}✗ No se encontró el archivo PDF (HTTP $STATUS_DESCARGA)${NC}"
+    exit 1
 fi
 
 # 6. Listar facturas
@@ -145,13 +178,31 @@ done
 
 echo ""
 
+# 9. Pipeline directo: texto → factura en una sola llamada
+echo -e "${BLUE}📋 Paso 9: Pipeline directo texto → factura...${NC}"
+
+TEXTO_PEDIDO_3="Para Carmen Ruiz: 3 tulipanes a 12 euros y 1 orquídea blanca a 35 euros. Factura 2025-003"
+
+echo "  Texto: '$TEXTO_PEDIDO_3'"
+
+TIMING=$(curl -s -o /dev/null -D - -X POST http://localhost:5000/factura-desde-texto \
+  -H "Content-Type: application/json" \
+  -d "{\"texto\": \"$TEXTO_PEDIDO_3\"}" | grep -i '^server-timing' | tr -d '\r')
+
+if [ -n "$TIMING" ]; then
+    echo -e "${GREEN}✓ Factura generada${NC} ($TIMING)"
+else
+    echo -e "${RED}✗ Falló el pipeline directo${NC}"
+fi
+echo ""
+
 # Resumen final
 echo "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
 echo -e "${GREEN}✅ SISTEMA FUNCIONANDO CORRECTAMENTE${NC}"
 echo "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
 echo ""
 echo "🌸 FLORES Y PLANTAS LOLI"
-echo "📁 Facturas generadas en: ./invoices/"
+echo "📁 Facturas generadas en: ./volumes/invoices/YYYY/MM/"
 echo "📄 Última factura: $FILENAME"
 echo ""
 echo "🔗 ENLACES:"